@@ -73,6 +73,7 @@ const ask_gpt = async (message) => {
     prompt_lock = true;
     window.text = ``;
     window.token = message_id();
+    const sections = [];
 
     stop_generating.classList.remove(`stop_generating-hidden`);
 
@@ -92,8 +93,6 @@ const ask_gpt = async (message) => {
 
     message_box.scrollTop = message_box.scrollHeight;
     window.scrollTo(0, 0);
-    await new Promise((r) => setTimeout(r, 500));
-    window.scrollTo(0, 0);
 
     message_box.innerHTML += `
             <div class="message">
@@ -108,8 +107,6 @@ const ask_gpt = async (message) => {
 
     message_box.scrollTop = message_box.scrollHeight;
     window.scrollTo(0, 0);
-    await new Promise((r) => setTimeout(r, 1000));
-    window.scrollTo(0, 0);
 
     const response = await fetch(`/backend-api/v2/conversation`, {
       method: `POST`,
@@ -126,7 +123,6 @@ const ask_gpt = async (message) => {
         meta: {
           id: window.token,
           content: {
-            conversation: await get_conversation(window.conversation_id),
             internet_access: document.getElementById("switch").checked,
             content_type: "text",
             parts: [
@@ -141,31 +137,40 @@ const ask_gpt = async (message) => {
     });
 
     const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const streaming = (response.headers.get(`content-type`) || ``).includes(`text/event-stream`);
+    let buffer = ``;
 
     while (true) {
       const { value, done } = await reader.read();
       if (done) break;
 
-      chunk = new TextDecoder().decode(value);
+      buffer += decoder.decode(value, { stream: true });
 
-      if (
-        chunk.includes(
-          `<form id="challenge-form" action="/backend-api/v2/conversation?`
-        )
-      ) {
-        chunk = `cloudflare token expired, please refresh the page.`;
+      if (!streaming) {
+        continue;
       }
 
-      text += chunk;
-
-      // const objects         = chunk.match(/({.+?})/g);
-
-      // try { if (JSON.parse(objects[0]).success === false) throw new Error(JSON.parse(objects[0]).error) } catch (e) {}
-
-      // objects.forEach((object) => {
-      //     console.log(object)
-      //     try { text += h2a(JSON.parse(object).content) } catch(t) { console.log(t); throw new Error(t)}
-      // });
+      // server-sent events are separated by a blank line
+      const events = buffer.split(`\n\n`);
+      buffer = events.pop();
+
+      for (const event of events) {
+        const data = event
+          .split(`\n`)
+          .filter((line) => line.startsWith(`data:`))
+          .map((line) => line.slice(5).trim())
+          .join(`\n`);
+        if (!data) continue;
+
+        const payload = JSON.parse(data);
+        if (payload.error) throw new Error(payload.error);
+        if (payload.section !== undefined) {
+          // sections arrive as they finish; keep them in document order
+          sections[payload.index] = payload.content;
+          text = sections.filter(Boolean).join(``);
+        } else if (payload.content) text += payload.content;
+      }
 
       document.getElementById(`gpt_${window.token}`).innerHTML =
         markdown.render(text);
@@ -177,6 +182,13 @@ const ask_gpt = async (message) => {
       message_box.scrollTo({ top: message_box.scrollHeight, behavior: "auto" });
     }
 
+    if (!streaming) {
+      const payload = JSON.parse(buffer);
+      text = payload.success ? payload.response : payload.error || payload.message;
+      document.getElementById(`gpt_${window.token}`).innerHTML =
+        markdown.render(text);
+    }
+
     // if text contains :
     if (
       text.includes(
@@ -338,13 +350,6 @@ const load_conversation = async (conversation_id) => {
   }, 500);
 };
 
-const get_conversation = async (conversation_id) => {
-  let conversation = await JSON.parse(
-    localStorage.getItem(`conversation:${conversation_id}`)
-  );
-  return conversation.items;
-};
-
 const add_conversation = async (conversation_id, title) => {
   if (localStorage.getItem(`conversation:${conversation_id}`) == null) {
     localStorage.setItem(
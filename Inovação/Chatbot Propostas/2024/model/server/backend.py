@@ -1,37 +1,131 @@
+import json
 import os
 import time
 from datetime import datetime
 from dotenv import load_dotenv
-from flask import request
+from flask import Response, request
 from requests import get
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
+
+from appkit.metrics import Metrics
+from appkit.sse import stream, wants_stream
+from appkit.warmup import Warmup, shared
+
+from server.batching import BatchingEncoder
+from server.context import ContextPacker
+from server.embedding_cache import EmbeddingCache
+from server.embedding_profiles import profile_encoder, resolve_profile
+from server.lexical_index import LexicalIndex, fuse
+from server.proposal import SYSTEM_INSTRUCTION, ProposalGenerator
+from server.semantic_cache import SemanticCache
 
 # Load environment variables from .env file
 dotenv_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../.env'))
 load_dotenv(dotenv_path)
 
+EMBEDDING_MODEL = 'sentence-transformers/nli-bert-large'
+
+# Metadata the conversation request may filter on ("filters": {"ano": 2024, "setor": ["varejo", "saúde"]})
+FILTER_FIELDS = ("ano", "setor", "portfolio", "tipo", "cliente")
+
+
+def load_embedding_model(name: str = EMBEDDING_MODEL):
+    """
+    Loads the local embedding model once per process (sentence_transformers
+    and torch are only imported here).
+    """
+    def build():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(name)
+    return shared(name, build)
+
+
+def embedding_profile(config: dict):
+    """
+    Model, kept dimensions and index storage of `config`; by default
+    `embedding_model` at full size.
+    """
+    vector_index_config = config.get("vector_index")
+    return resolve_profile(
+        config.get("embedding_profile", {"model": config.get("embedding_model", EMBEDDING_MODEL)}),
+        pca_path=os.path.join(vector_index_config["path"], "pca.npz") if vector_index_config else None,
+    )
+
+
 class Backend_Api:
-    def __init__(self, app, config: dict) -> None:
+    def __init__(self, app, config: dict, embedding_model=None, pinecone_index=None, model=None) -> None:
         self.app = app
         self.gemini_key = os.getenv("GEMINI_API_KEY")
         self.pinecone_api_key = os.getenv("PINECONE_API_KEY")
-        
-        pc = Pinecone(
-            api_key=self.pinecone_api_key
+
+        self.vector_index_config = config.get("vector_index")
+        self.profile = embedding_profile(config)
+        self.embedding_model_name = self.profile.model
+        self.embedding_cache_config = config.get("embedding_cache", {})
+        self.batching_config = config.get("embedding_batching", {})
+        self.retrieval_config = config.get("retrieval", {})
+        self.proposal_config = config.get("proposal", {})
+        self.semantic_cache_config = config.get("semantic_cache", {})
+        self.context_config = config.get("context", {})
+        # Keyword search needs the chunk text, which only the local index has
+        self.hybrid = bool(self.vector_index_config) and self.retrieval_config.get("hybrid", True)
+
+        # Models and clients load in the background; `/ready` says when.
+        # Tokenizing the chunks and loading the weights are CPU-bound: blocking
+        self.warmup = Warmup()
+        self.warmup.add("pinecone_index", self._open_vector_index, pinecone_index)
+        if self.hybrid:
+            self.warmup.add("lexical_index", lambda: LexicalIndex(self.pinecone_index), blocking=True)
+        self.warmup.add("model", self._build_model, model)
+        self.warmup.add(
+            "embedding_model",
+            lambda: self._cached(self._batched(profile_encoder(load_embedding_model(self.embedding_model_name), self.profile))),
+            self._cached(self._batched(profile_encoder(embedding_model, self.profile))) if embedding_model is not None else None,
+            blocking=True,
         )
+        if config.get("warmup", {}).get("background", True):
+            self.warmup.start()
 
-        # Connect to the existing index
-        self.pinecone_index = pc.Index('propostas-comerciais')  # Save as instance attribute
-        
-        # Load local embedding model
-        self.embedding_model = SentenceTransformer('sentence-transformers/nli-bert-large')
-        
         self.proxy = config.get("proxy")
+        self.metrics = Metrics("propostas", trace_log=config.get("metrics", {}).get("trace_log"))
+        for key in ("hits", "disk_hits", "misses"):
+            self.metrics.gauge(f"embedding_cache_{key}", f"Embedding cache {key.replace('_', ' ')}.", lambda key=key: self._embedding_cache_stats().get(key, 0))
+        for key in ("batches", "mean_batch_size", "queued"):
+            self.metrics.gauge(f"embedding_batcher_{key}", f"Embedding batcher {key.replace('_', ' ')}.", lambda key=key: self._batching_stats().get(key, 0))
+
+        # Answers to near-identical questions, reused until the index changes.
+        # Opt-in: the threshold must be tuned for the embedding model in use
+        self.response_cache = None
+        if self.semantic_cache_config.get("enabled", False):
+            self.response_cache = SemanticCache(
+                threshold=self.semantic_cache_config.get("threshold", 0.92),
+                ttl=self.semantic_cache_config.get("ttl_seconds", 86400),
+                max_entries=self.semantic_cache_config.get("max_entries", 512),
+            )
+            for key in ("hits", "misses", "hit_ratio", "saved_seconds", "entries"):
+                self.metrics.gauge(f"semantic_cache_{key}", f"Semantic response cache {key.replace('_', ' ')}.", lambda key=key: self.response_cache.stats()[key])
+
+        # Relevant, non-redundant passages within a token budget
+        self.packer = None
+        if self.context_config.get("enabled", True):
+            self.packer = ContextPacker(
+                budget_tokens=self.context_config.get("budget_tokens", 1500),
+                diversity=self.context_config.get("diversity", 0.3),
+                duplicate_threshold=self.context_config.get("duplicate_threshold", 0.5),
+            )
+        self._index_version_value = None
+        self._index_version_checked = None
         self.routes = {
             "/backend-api/v2/conversation": {
                 "function": self._conversation,
                 "methods": ["POST"]
+            },
+            "/metrics": {
+                "function": self._metrics,
+                "methods": ["GET"]
+            },
+            "/ready": {
+                "function": self._ready,
+                "methods": ["GET"]
             }
         }
         
@@ -44,13 +138,131 @@ class Backend_Api:
             "response_mime_type": "text/plain",
         }
 
+    def _batched(self, model):
+        """
+        Groups concurrent encode calls into batches, unless disabled.
+        """
+        if not self.batching_config.get("enabled", True):
+            return model
+        return BatchingEncoder(
+            model,
+            max_batch_size=self.batching_config.get("max_batch_size", 32),
+            max_wait=self.batching_config.get("max_wait_ms", 5) / 1000,
+            threads=self.batching_config.get("threads", 1),
+        )
+
+    def _cached(self, model):
+        """
+        Puts the embedding cache in front of `model`, unless disabled.
+        """
+        if not self.embedding_cache_config.get("enabled", True):
+            return model
+        return EmbeddingCache(
+            model,
+            model_id=self.profile.cache_id,
+            path=self.embedding_cache_config.get("path", "data/embeddings.sqlite3"),
+            max_entries=self.embedding_cache_config.get("max_entries", 4096),
+        )
+
+    def _embedding_cache_stats(self) -> dict:
+        resource = self.warmup.resources["embedding_model"]
+        if isinstance(resource.value, EmbeddingCache):
+            return resource.value.stats()
+        return {}
+
+    def _batching_stats(self) -> dict:
+        model = self.warmup.resources["embedding_model"].value
+        model = getattr(model, "model", model) if isinstance(model, EmbeddingCache) else model
+        if isinstance(model, BatchingEncoder):
+            return model.stats()
+        return {}
+
+    @property
+    def embedding_model(self):
+        return self.warmup.get("embedding_model")
+
+    @property
+    def pinecone_index(self):
+        return self.warmup.get("pinecone_index")
+
+    @property
+    def lexical_index(self):
+        return self.warmup.get("lexical_index")
+
+    @property
+    def model(self):
+        return self.warmup.get("model")
+
+    def _build_model(self):
+        import google.generativeai as genai
+
+        # Configure Gemini API
+        genai.configure(api_key=self.gemini_key)
+        return genai.GenerativeModel(
+            model_name="gemini-2.0-flash-exp",
+            generation_config=self.generation_config,
+            system_instruction=SYSTEM_INSTRUCTION,
+        )
+
+    def _open_vector_index(self):
+        """
+        The local index when `vector_index` is configured (offline and on-prem
+        deployments), otherwise the Pinecone index.
+        """
+        if self.vector_index_config:
+            from server.vector_index import VectorIndex
+            return VectorIndex(
+                self.vector_index_config["path"],
+                dimension=self.profile.dimension or self.vector_index_config.get("dimension", 1024),
+                nprobe=self.vector_index_config.get("nprobe", 8),
+                quantization=self.profile.quantization,
+                rescore=self.profile.rescore,
+            )
+
+        from pinecone import Pinecone
+        pc = Pinecone(
+            api_key=self.pinecone_api_key
+        )
+
+        # Connect to the existing index
+        return pc.Index('propostas-comerciais')
+
+    def _index_version(self):
+        """
+        Identifies the current state of the proposal index, checked at most
+        every `version_check_seconds` (for Pinecone it is a stats request).
+
+        Re-ingesting a changed file upserts existing IDs, which leaves
+        Pinecone's vector count alone, so its version also carries the mtime
+        of the ingest ledger (`semantic_cache.ledger`, default
+        `data/ingest-propostas-comerciais.json`), rewritten by every ingest
+        run. When the ingest runs on another host and the ledger isn't here,
+        cached answers are only invalidated by `ttl_seconds`.
+        """
+        now = time.monotonic()
+        interval = self.semantic_cache_config.get("version_check_seconds", 30)
+        if self._index_version_checked is not None and now - self._index_version_checked < interval:
+            return self._index_version_value
+        self._index_version_checked = now
+        index = self.pinecone_index
+        try:
+            if hasattr(index, "version"):
+                self._index_version_value = index.version
+            elif hasattr(index, "describe_index_stats"):
+                ledger = self.semantic_cache_config.get("ledger", os.path.join("data", "ingest-propostas-comerciais.json"))
+                modified = os.stat(ledger).st_mtime_ns if os.path.exists(ledger) else None
+                self._index_version_value = (index.describe_index_stats()["total_vector_count"], modified)
+        except Exception as e:
+            print(f"Index version check failed: {e}")
+        return self._index_version_value
+
     def encode_message(self, message: str):
         """
         Encodes the input message using the local embedding model.
         """
-        return self.embedding_model.encode(message).tolist()
+        return self.embedding_model.encode(self.profile.query_prefix + message).tolist()
 
-    def query_pinecone(self, query_embedding, top_k=5):
+    def query_pinecone(self, query_embedding, top_k=5, filter=None):
         """
         Queries Pinecone database using the provided embedding.
         """
@@ -58,60 +270,166 @@ class Backend_Api:
             results = self.pinecone_index.query(
                 vector=query_embedding,
                 top_k=top_k,
-                include_metadata=True
+                include_metadata=True,
+                **({"filter": filter} if filter else {})
             )
             return results["matches"]
         except Exception as e:
+            self.metrics.error("vector_query", e)
             print(f"Pinecone query failed: {e}")
             return []
 
-    def send_message(self, message):
+    def query_lexical(self, message: str, top_k=5, filter=None):
+        """
+        Queries the BM25 index with the words of the message.
+        """
+        try:
+            return self.lexical_index.query(message, top_k=top_k, include_metadata=True, filter=filter)["matches"]
+        except Exception as e:
+            self.metrics.error("lexical_query", e)
+            print(f"Lexical query failed: {e}")
+            return []
+
+    def retrieve(self, message: str, query_embedding, filter=None, top_k=None):
+        """
+        The chunks to put in the prompt: the vector matches alone, or fused
+        with the keyword matches when hybrid retrieval is on.
+        """
+        top_k = top_k or self.retrieval_config.get("top_k", 3 if self.hybrid else 5)
+        if not self.hybrid:
+            with self.metrics.stage("vector_query"):
+                return self.query_pinecone(query_embedding, top_k, filter)
+
+        candidates = self.retrieval_config.get("candidates", 20)
+        with self.metrics.stage("vector_query"):
+            dense = self.query_pinecone(query_embedding, candidates, filter)
+        with self.metrics.stage("lexical_query"):
+            lexical = self.query_lexical(message, candidates, filter)
+        return fuse(
+            [dense, lexical], top_k,
+            k=self.retrieval_config.get("rrf_k", 60),
+            weights=[1.0, self.retrieval_config.get("lexical_weight", 1.0)],
+        )
+
+    @staticmethod
+    def build_filter(filters: dict):
+        """
+        Pinecone-style metadata filter from the request's `filters`; lists
+        match any of their values.
+        """
+        clauses = {}
+        for field, value in (filters or {}).items():
+            if field not in FILTER_FIELDS or value in (None, "", []):
+                continue
+            clauses[field] = {"$in": value} if isinstance(value, list) else {"$eq": value}
+        return clauses or None
+
+    def send_message(self, message, filters=None):
         """
         Generates a response after enriching with Pinecone results.
         """
         try:
-            # Encode the message into an embedding
-            query_embedding = self.encode_message(message)
-            print('encoded')
-            
-            # Query Pinecone
-            pinecone_results = self.query_pinecone(query_embedding)
-            print('queried')
-            
-            # Debug: Print a sample of the results structure
-            if pinecone_results:
-                print(f"First result metadata structure: {pinecone_results[0].get('metadata', {})}")
-            
-            # Construct a context string from Pinecone results with safety checks
-            context_items = []
-            for match in pinecone_results:
-                if "metadata" in match and "summary" in match["metadata"]:
-                    context_items.append(f"- {match['metadata']['summary']}")
-            
-            pinecone_context = "\n".join(context_items)
-            print('context')
-    
-            # Combine the Pinecone context with the original message
-            enriched_message = f"Contexto dos dados:\n{pinecone_context}\n\nPergunta original:\n{message}"
-            print('enriched')
-            
-            # Simulate AI response
-            response_text = f"{enriched_message}"
-            return response_text
+            # Sections arrive as they finish; the full answer keeps document order
+            events = sorted(self.stream_message(message, filters), key=lambda event: event.get("index", -1))
+            return "".join(event.get("content", "") for event in events)
         except Exception as e:
             print(f"Error in send_message: {e}")
             return "Erro ao processar a mensagem."
 
+    def stream_message(self, message, filters=None):
+        """
+        Yields the response in pieces, each one as soon as its stage is done.
+        """
+        # Encode the message into an embedding
+        with self.metrics.stage("embed"):
+            query_embedding = self.encode_message(message)
+
+        filter = self.build_filter(filters)
+        if self.response_cache is not None:
+            scope = json.dumps(filter, sort_keys=True, default=str) if filter else ""
+            version = self._index_version()
+            with self.metrics.stage("semantic_cache"):
+                cached = self.response_cache.get(query_embedding, scope, version)
+            if cached is not None:
+                yield {"cached": True, "similarity": round(cached.similarity, 4), "context": cached.context}
+                yield from cached.events
+                return
+        started = time.perf_counter()
+
+        # Query Pinecone (and the keyword index), restricted to the filters;
+        # with packing, a wider pool the packer picks from
+        top_k = self.context_config.get("candidates", 10) if self.packer is not None else None
+        pinecone_results = self.retrieve(message, query_embedding, filter, top_k)
+
+        # Construct a context string from Pinecone results with safety checks
+        with self.metrics.stage("context"):
+            if self.packer is not None:
+                packed = self.packer.pack(pinecone_results)
+                pinecone_context = packed.text
+                self._record_context(packed)
+            else:
+                context_items = []
+                for match in pinecone_results:
+                    if "metadata" in match and "summary" in match["metadata"]:
+                        context_items.append(f"- {match['metadata']['summary']}")
+
+                pinecone_context = "\n".join(context_items)
+        if self.packer is not None:
+            yield {"context_tokens": packed.tokens, "context_tokens_saved": packed.saved_tokens}
+
+        # One concurrent call per proposal section, all sharing the context
+        generator = ProposalGenerator(
+            self.model,
+            max_workers=self.proposal_config.get("max_workers"),
+            retries=self.proposal_config.get("retries", 2),
+            backoff=self.proposal_config.get("backoff", 0.5),
+            metrics=self.metrics,
+        )
+        events = []
+        for event in self.metrics.iterate(generator.stream(message, pinecone_context), "generation"):
+            events.append(event)
+            yield event
+
+        # Complete answers only: a failed section is retried on the next request
+        if self.response_cache is not None and not any("failed" in event for event in events):
+            self.response_cache.put(query_embedding, events, pinecone_context,
+                                    time.perf_counter() - started, scope, version)
+
+    def _record_context(self, packed) -> None:
+        """
+        Token usage of the packed context, in the counters and in the
+        request's trace.
+        """
+        self.metrics.inc("context_tokens_used_total", packed.tokens, "Estimated prompt tokens of the packed context.")
+        self.metrics.inc("context_tokens_saved_total", packed.saved_tokens, "Estimated tokens of retrieved passages left out of the context.")
+        self.metrics.inc("context_passages_dropped_total", packed.duplicates, "Passages dropped from the context.", reason="duplicate")
+        self.metrics.inc("context_passages_dropped_total", packed.over_budget, "Passages dropped from the context.", reason="budget")
+        self.metrics.annotate(context_tokens=packed.tokens, context_tokens_saved=packed.saved_tokens,
+                              context_passages=len(packed.passages), context_duplicates=packed.duplicates)
+
     def _conversation(self):
         """
         Handles conversation requests.
         """
         try:
-            prompt = request.json["meta"]["content"]["parts"][0]
-            response = self.send_message(prompt["content"])
+            with self.metrics.stage("parse"):
+                prompt = request.json["meta"]["content"]["parts"][0]
+                conversation_id = request.json.get("conversation_id")
+                filters = request.json.get("filters")
+            if wants_stream(request):
+                return stream(self.metrics.traced(self.stream_message(prompt["content"], filters), conversation_id=conversation_id))
+
+            with self.metrics.trace(conversation_id=conversation_id):
+                response = self.send_message(prompt["content"], filters)
             if not response:
                 return {"success": False, "message": "Failed to process request"}, 500
             return {"success": True, "response": response}, 200
         except Exception as e:
             print(e)
-            return {"success": False, "error": str(e)}, 400
\ No newline at end of file
+            return {"success": False, "error": str(e)}, 400
+
+    def _metrics(self):
+        return Response(self.metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    def _ready(self):
+        return self.warmup.response()
\ No newline at end of file
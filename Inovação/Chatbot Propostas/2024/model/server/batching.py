@@ -0,0 +1,108 @@
+"""
+Micro-batching in front of the embedding model.
+
+Concurrent requests each encode a single message, which leaves most of the
+CPU's matrix throughput unused. `BatchingEncoder` queues those calls; a
+worker thread takes the first one, waits up to `max_wait` seconds for more
+(or until `max_batch_size` texts), runs one batched `encode` and hands every
+caller its own row through a future. A lone request pays at most
+`max_wait` extra; under load, batches fill up before the window closes.
+
+It has the `encode` interface of the model, so it sits between the
+embedding cache and the model: only cache misses are batched.
+
+Under gunicorn's gevent workers the worker threads are greenlets, so the
+batched `encode` runs through `serving.run_in_thread` on a real OS thread:
+the hub keeps serving (and queueing) requests meanwhile. The workers start
+with the first call, in the thread (and hub) of the requests.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from appkit.serving import run_in_thread
+
+
+class BatchingEncoder:
+    def __init__(self, model, max_batch_size: int = 32, max_wait: float = 0.005, threads: int = 1) -> None:
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.threads = threads
+        self.batches = 0
+        self.texts = 0
+        self._queue = queue.Queue()
+        self._workers = []
+        self._start_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._workers:
+                return
+            self._workers = [
+                threading.Thread(target=self._run, daemon=True, name=f'encode-batcher-{i}')
+                for i in range(self.threads)
+            ]
+            for worker in self._workers:
+                worker.start()
+
+    def submit(self, text: str) -> Future:
+        if not self._workers:
+            self._start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, sentences, **kwargs):
+        """
+        Same result as `model.encode`. Calls with extra options bypass the
+        batcher, since batched texts must share them.
+        """
+        if kwargs.keys() - {'batch_size'}:
+            return run_in_thread(self.model.encode, sentences, **kwargs)
+        single = isinstance(sentences, str)
+        futures = [self.submit(text) for text in ([sentences] if single else sentences)]
+        vectors = [future.result() for future in futures]
+        return vectors[0] if single else np.stack(vectors)
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                vectors = run_in_thread(self.model.encode, [text for text, _ in batch], batch_size=len(batch))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(np.asarray(vector, dtype=np.float32))
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'texts': self.texts,
+            'mean_batch_size': self.texts / self.batches if self.batches else 0.0,
+            'queued': self._queue.qsize(),
+        }
@@ -0,0 +1,109 @@
+"""
+Assembly of the retrieved chunks into the prompt context, within a token
+budget.
+
+Matches often repeat each other: neighbouring chunks of one proposal share
+their overlap, and proposals reused from one client to the next differ in a
+few words. `ContextPacker` compares the word shingles of the candidates and
+picks them by maximal marginal relevance: each step takes the candidate with
+the best mix of relevance (its retrieval score) and novelty (least overlap
+with what is already picked). Candidates mostly contained in a picked one
+are dropped as duplicates, and picking stops adding passages once the token
+budget is full:
+
+    packed = ContextPacker(budget_tokens=1500).pack(matches)
+    packed.text, packed.tokens, packed.saved_tokens
+"""
+import re
+import zlib
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for Portuguese text in Gemini's tokenizer
+    return max(1, len(text) // 4)
+
+
+def shingles(text: str, size: int = 5) -> set:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {zlib.crc32(' '.join(words).encode('utf-8'))}
+    return {zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+
+def overlap(a: set, b: set) -> float:
+    """
+    Share of the smaller set found in the other one, so a chunk contained
+    in a longer one counts as a duplicate.
+    """
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+class PackedContext:
+    def __init__(self, passages: list, tokens: int, candidate_tokens: int, duplicates: int, over_budget: int) -> None:
+        self.passages = passages
+        self.tokens = tokens
+        self.candidate_tokens = candidate_tokens
+        self.duplicates = duplicates
+        self.over_budget = over_budget
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.candidate_tokens - self.tokens
+
+    @property
+    def text(self) -> str:
+        return "\n".join(f"- {passage}" for passage in self.passages)
+
+
+class ContextPacker:
+    def __init__(self, budget_tokens: int = 1500, diversity: float = 0.3, duplicate_threshold: float = 0.5,
+                 shingle_size: int = 5) -> None:
+        self.budget_tokens = budget_tokens
+        self.diversity = diversity
+        self.duplicate_threshold = duplicate_threshold
+        self.shingle_size = shingle_size
+
+    def pack(self, matches: list) -> PackedContext:
+        candidates = []
+        for rank, match in enumerate(matches):
+            summary = (match.get("metadata") or {}).get("summary")
+            if summary:
+                candidates.append({
+                    "text": summary,
+                    "tokens": estimate_tokens(summary),
+                    "shingles": shingles(summary, self.shingle_size),
+                    "score": match.get("score"),
+                    "rank": rank,
+                })
+        candidate_tokens = sum(candidate["tokens"] for candidate in candidates)
+        if not candidates:
+            return PackedContext([], 0, 0, 0, 0)
+
+        # Scores of different retrievers aren't comparable; scale them per request
+        top = max((candidate["score"] or 0.0) for candidate in candidates)
+        for candidate in candidates:
+            if candidate["score"] is not None and top > 0:
+                candidate["relevance"] = candidate["score"] / top
+            else:
+                candidate["relevance"] = 1.0 / (1 + candidate["rank"])
+
+        picked, tokens, duplicates, over_budget = [], 0, 0, 0
+        remaining = candidates
+        while remaining:
+            for candidate in remaining:
+                candidate["redundancy"] = max((overlap(candidate["shingles"], chosen["shingles"]) for chosen in picked),
+                                              default=0.0)
+            best = max(remaining, key=lambda c: (1 - self.diversity) * c["relevance"] - self.diversity * c["redundancy"])
+            remaining = [candidate for candidate in remaining if candidate is not best]
+            if best["redundancy"] >= self.duplicate_threshold:
+                duplicates += 1
+            elif tokens + best["tokens"] > self.budget_tokens:
+                over_budget += 1
+            else:
+                picked.append(best)
+                tokens += best["tokens"]
+        return PackedContext([candidate["text"] for candidate in picked], tokens, candidate_tokens, duplicates, over_budget)
@@ -0,0 +1,151 @@
+"""
+Content-addressed cache in front of the embedding model.
+
+`EmbeddingCache` has the same `encode` interface as a SentenceTransformer,
+so `Backend_Api.encode_message` and the ingestion both go through it:
+
+    model = EmbeddingCache(SentenceTransformer(name), model_id=name, path='data/embeddings.sqlite3')
+    model.encode('texto')            # one vector
+    model.encode(['a', 'b', 'c'])    # a batch; only the misses reach the model
+
+Entries are keyed by the SHA-256 of the model id and the normalized text
+(NFC, collapsed whitespace), so a retry or the same ata pasted twice skips
+the model and switching models never returns stale vectors. Hot entries
+live in an in-process LRU; all of them are kept on disk as float16 (2 KB per
+1024-dim vector) in a SQLite file shared by every worker.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY,
+    model TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    created REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def cache_key(model_id: str, text: str) -> bytes:
+    return hashlib.sha256(f'{model_id}\0{normalize_text(text)}'.encode('utf-8')).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, model, model_id: str, path: str = None, max_entries: int = 4096) -> None:
+        self.model = model
+        self.model_id = model_id
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.executescript(SCHEMA)
+
+    def __getattr__(self, name):
+        # Anything else (get_sentence_embedding_dimension, ...) goes to the model
+        return getattr(self.model, name)
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs):
+        """
+        Returns float32 vectors like `SentenceTransformer.encode`: one array
+        for a string, a 2-D array for a list.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        keys = [cache_key(self.model_id, text) for text in texts]
+        vectors = self._lookup(keys)
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Duplicates inside one batch are encoded once
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], i)
+            encoded = np.asarray(
+                self.model.encode([texts[i] for i in unique.values()], batch_size=batch_size, **kwargs),
+                dtype=np.float32,
+            )
+            fresh = dict(zip(unique, encoded))
+            self._store(fresh)
+            for i in missing:
+                vectors[i] = fresh[keys[i]]
+
+        return vectors[0] if single else np.stack(vectors)
+
+    def _lookup(self, keys: list) -> list:
+        vectors = [None] * len(keys)
+        pending = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    vectors[i] = vector
+                else:
+                    pending.append(i)
+
+            if pending and self._db is not None:
+                found = {}
+                wanted = list({keys[i] for i in pending})
+                for start in range(0, len(wanted), 500):
+                    chunk = wanted[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    found.update((key, np.frombuffer(blob, dtype=np.float16).astype(np.float32)) for key, blob in rows)
+                for i in pending:
+                    vector = found.get(keys[i])
+                    if vector is not None:
+                        self.disk_hits += 1
+                        vectors[i] = vector
+                        self._remember(keys[i], vector)
+            self.misses += sum(1 for vector in vectors if vector is None)
+        return vectors
+
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        vector.setflags(write=False)
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _store(self, fresh: dict) -> None:
+        with self._lock:
+            for key, vector in fresh.items():
+                self._remember(key, vector)
+            if self._db is not None:
+                now = time.time()
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)',
+                    [(key, self.model_id, vector.astype(np.float16).tobytes(), now) for key, vector in fresh.items()],
+                )
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+        }
@@ -0,0 +1,152 @@
+"""
+Embedding profiles: which model encodes the chunks, how many dimensions are
+kept and how the local index stores them.
+
+    "embedding_profile": "minilm-int8"
+    "embedding_profile": {"name": "mpnet", "dimension": 256, "reduction": "pca", "quantization": "binary"}
+
+A profile sets:
+
+    model           sentence-transformers model
+    dimension       dimensions kept (default: all of the model's)
+    reduction       'truncate' keeps the first `dimension` components
+                    (Matryoshka-trained models), 'pca' projects onto the
+                    principal components fitted on the corpus (`pca.npz`)
+    quantization    how `VectorIndex` scans the vectors: 'float32', 'int8'
+                    (4x smaller) or 'binary' (32x smaller, Hamming distance)
+    rescore         with quantization, `top_k * rescore` candidates are
+                    rescored with the float vectors (0 disables)
+    query_prefix / passage_prefix
+                    text prepended to questions / chunks (E5 models)
+
+Without a profile the backend keeps `nli-bert-large` at 1024 float32
+dimensions. `bench/embedding_eval.py` compares the profiles on the corpus.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+PROFILES = {
+    'bert-large': {'model': 'sentence-transformers/nli-bert-large', 'model_dimension': 1024},
+    'mpnet': {'model': 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2', 'model_dimension': 768},
+    'mpnet-256-pca': {'model': 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2', 'model_dimension': 768,
+                      'dimension': 256, 'reduction': 'pca'},
+    'mpnet-binary': {'model': 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2', 'model_dimension': 768,
+                     'quantization': 'binary', 'rescore': 8},
+    'minilm': {'model': 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2', 'model_dimension': 384},
+    'minilm-int8': {'model': 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2', 'model_dimension': 384,
+                    'quantization': 'int8'},
+    'e5-small': {'model': 'intfloat/multilingual-e5-small', 'model_dimension': 384,
+                 'query_prefix': 'query: ', 'passage_prefix': 'passage: '},
+    'e5-small-int8': {'model': 'intfloat/multilingual-e5-small', 'model_dimension': 384,
+                      'query_prefix': 'query: ', 'passage_prefix': 'passage: ', 'quantization': 'int8'},
+}
+
+
+class EmbeddingProfile:
+    def __init__(self, name: str, model: str, model_dimension: int = None, dimension: int = None,
+                 reduction: str = None, quantization: str = 'float32', rescore: int = 4,
+                 query_prefix: str = '', passage_prefix: str = '', pca_path: str = None) -> None:
+        if reduction not in (None, 'truncate', 'pca'):
+            raise ValueError(f"Redução desconhecida: {reduction}")
+        if quantization not in ('float32', 'int8', 'binary'):
+            raise ValueError(f"Quantização desconhecida: {quantization}")
+        if reduction and not dimension:
+            raise ValueError(f"O perfil {name} reduz dimensões mas não define `dimension`")
+        self.name = name
+        self.model = model
+        self.model_dimension = model_dimension
+        self.dimension = dimension or model_dimension
+        self.reduction = reduction
+        self.quantization = quantization
+        self.rescore = rescore
+        self.query_prefix = query_prefix
+        self.passage_prefix = passage_prefix
+        self.pca_path = pca_path
+
+    @property
+    def cache_id(self) -> str:
+        """
+        Embedding cache key: the model name alone for full vectors, so
+        switching quantization keeps the cache; reductions are part of it.
+        """
+        if not self.reduction:
+            return self.model
+        cache_id = f'{self.model}|{self.reduction}{self.dimension}'
+        if self.reduction == 'pca' and self.pca_path and os.path.exists(self.pca_path):
+            with open(self.pca_path, 'rb') as file:
+                cache_id += '|' + hashlib.sha256(file.read()).hexdigest()[:12]
+        return cache_id
+
+
+def resolve_profile(config, pca_path: str = None) -> EmbeddingProfile:
+    """
+    A profile from its name, or from a dict whose `name` (optional) picks the
+    preset it overrides.
+    """
+    if isinstance(config, str):
+        config = {'name': config}
+    config = dict(config)
+    name = config.pop('name', None)
+    if name is not None and name not in PROFILES:
+        raise ValueError(f"Perfil de embeddings desconhecido: {name} (opções: {', '.join(PROFILES)})")
+    options = dict(PROFILES.get(name, {}), **config)
+    options.setdefault('pca_path', pca_path)
+    return EmbeddingProfile(name or 'custom', **options)
+
+
+def fit_pca(vectors: np.ndarray, dimension: int, path: str) -> None:
+    """
+    Fits the projection on a sample of corpus embeddings and saves it.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) < dimension:
+        raise ValueError(f"São necessários pelo menos {dimension} vetores para o PCA ({len(vectors)} disponíveis)")
+    mean = vectors.mean(axis=0)
+    _, _, components = np.linalg.svd(vectors - mean, full_matrices=False)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path + '.tmp.npz', mean=mean, components=components[:dimension].astype(np.float32))
+    os.replace(path + '.tmp.npz', path)
+
+
+class ReducedEncoder:
+    """
+    Applies the profile's dimensionality reduction to the model's output and
+    re-normalizes, behind the usual `encode` interface.
+    """
+
+    def __init__(self, model, profile: EmbeddingProfile) -> None:
+        self.model = model
+        self.profile = profile
+        self.mean = self.components = None
+        if profile.reduction == 'pca':
+            if not profile.pca_path or not os.path.exists(profile.pca_path):
+                raise FileNotFoundError(
+                    f"PCA do perfil {profile.name} não encontrado em {profile.pca_path}; "
+                    f"rode `python -m server.ingest` com `--profile` para ajustá-lo"
+                )
+            with np.load(profile.pca_path) as pca:
+                self.mean, self.components = pca['mean'], pca['components']
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.profile.dimension
+
+    def encode(self, sentences, **kwargs):
+        return self.reduce(self.model.encode(sentences, **kwargs))
+
+    def reduce(self, vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.profile.reduction == 'pca':
+            vectors = (vectors - self.mean) @ self.components.T
+        else:
+            vectors = vectors[..., :self.profile.dimension]
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def profile_encoder(model, profile: EmbeddingProfile):
+    return ReducedEncoder(model, profile) if profile.reduction else model
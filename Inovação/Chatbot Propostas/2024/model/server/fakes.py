@@ -0,0 +1,120 @@
+"""
+Offline stand-ins for the embedding model, the Pinecone index and the
+Gemini model, with configurable latency and failure rate. They expose the
+same calls the backend makes (`encode`, `query`, `generate_content`), so
+the server can be exercised under load without downloading weights or
+reaching the network.
+"""
+import hashlib
+import random
+import threading
+import time
+
+import numpy as np
+
+
+class _Simulated:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, seed: int = None) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def _simulate(self, name: str) -> None:
+        self.calls += 1
+        delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        if delay > 0:
+            time.sleep(delay)
+        if self._random.random() < self.failure_rate:
+            raise RuntimeError(f'Fake {name} failure')
+
+
+class FakeEmbeddingModel(_Simulated):
+    """
+    Deterministic unit vectors derived from a hash of the text, so equal
+    texts get equal embeddings. `per_item` is the extra latency per text
+    of a batch, on top of the fixed `latency` of a call. With `serial`,
+    calls run one at a time, like a CPU model that already uses every core.
+    """
+
+    def __init__(self, dimension: int = 1024, per_item: float = 0.0, serial: bool = False, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.dimension = dimension
+        self.per_item = per_item
+        self._serial = threading.Lock() if serial else None
+
+    def _vector(self, text: str):
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if self._serial is not None:
+            with self._serial:
+                return self._encode(single, texts)
+        return self._encode(single, texts)
+
+    def _encode(self, single: bool, texts: list):
+        if self.per_item > 0:
+            time.sleep(self.per_item * len(texts))
+        self._simulate('embedding')
+        vectors = np.stack([self._vector(text) for text in texts])
+        return vectors[0] if single else vectors
+
+
+class FakePineconeIndex(_Simulated):
+    """
+    Answers every query with `top_k` canned matches carrying a `summary`.
+    """
+
+    def __init__(self, summaries: list = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.summaries = summaries or [
+            f'Proposta {i}: projeto de dados com diagnóstico, dashboard e capacitação da equipe.'
+            for i in range(20)
+        ]
+
+    def query(self, vector=None, top_k: int = 5, include_metadata: bool = False, **kwargs):
+        self._simulate('pinecone')
+        matches = []
+        for i, summary in enumerate(self.summaries[:top_k]):
+            match = {'id': f'fake-{i}', 'score': 1.0 - i * 0.01}
+            if include_metadata:
+                match['metadata'] = {'summary': summary}
+            matches.append(match)
+        return {'matches': matches}
+
+
+class FakeGenerativeResponse:
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+class FakeGenerativeModel(_Simulated):
+    """
+    Answers `generate_content` with `reply` after `latency` seconds (plus
+    or minus `jitter`), plus `per_token` seconds per prompt token (~4
+    characters), or raises with probability `failure_rate`. Calls run
+    concurrently, like requests to the API.
+    """
+
+    def __init__(self, reply: str = 'Texto simulado da seção da proposta.', per_token: float = 0.0, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.reply = reply
+        self.per_token = per_token
+        self._lock = threading.Lock()
+
+    def generate_content(self, content, stream=False):
+        with self._lock:
+            # Random draws and the call count are shared by the section threads
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            delay += self.per_token * len(str(content)) / 4
+            fails = self._random.random() < self.failure_rate
+        time.sleep(delay)
+        if fails:
+            raise RuntimeError('Fake model failure')
+        return FakeGenerativeResponse(self.reply)
@@ -0,0 +1,355 @@
+"""
+Loads a directory of commercial proposals and meeting atas into the vector
+index the backend queries.
+
+    python -m server.ingest propostas/ --index data/propostas-index --workers 8
+    python -m server.ingest propostas/ --pinecone propostas-comerciais
+
+Files (.txt, .md, and .docx/.pdf when python-docx/pypdf are installed) are
+read and split in a process pool into overlapping word windows. Every chunk
+keeps its text in the `summary` metadata, which is what the backend puts in
+the prompt, plus `source`, `chunk`, `tipo` (ata or proposta) and `ano` when
+the path has a year. A `<file>.json` next to a file adds fields to all of
+its chunks, e.g. {"cliente": "...", "setor": "varejo", "portfolio": "dados"},
+which the backend can filter on.
+
+Chunk IDs are the SHA-256 of the source path, the normalized chunk text and
+the sidecar fields, so they are the same on every run. `<index>/_ingest.json`
+(or `--ledger`) records the file hash and the chunk IDs of every loaded
+file: unchanged files are skipped without being read, and for changed
+files only the new chunks are embedded; chunks that disappeared are deleted
+from the index. New chunks are embedded `--embed-batch` at a time through
+the embedding cache and upserted `--upsert-batch` at a time. For the local
+index, the BM25 postings (`server.lexical_index`) are saved at the end.
+
+`--profile` picks an embedding profile (`server.embedding_profiles`); a PCA
+profile is fitted on the first `--pca-sample` chunks into `<index>/pca.npz`
+on the first run. The backend must use the same profile, and changing it
+needs a new index directory.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from server.embedding_cache import EmbeddingCache, normalize_text
+from server.embedding_profiles import PROFILES, fit_pca, profile_encoder, resolve_profile
+
+EXTENSIONS = ('.txt', '.md', '.docx', '.pdf')
+YEAR_PATTERN = re.compile(r'(?<!\d)(20\d{2})(?!\d)')
+ATA_PATTERN = re.compile(r'\bata', re.IGNORECASE)
+
+
+def read_text(path: str) -> str:
+    lower = path.lower()
+    if lower.endswith('.docx'):
+        import docx
+        return '\n'.join(paragraph.text for paragraph in docx.Document(path).paragraphs)
+    if lower.endswith('.pdf'):
+        from pypdf import PdfReader
+        return '\n'.join(page.extract_text() or '' for page in PdfReader(path).pages)
+    with open(path, encoding='utf-8', errors='replace') as file:
+        return file.read()
+
+
+def split_chunks(text: str, size: int = 220, overlap: int = 40) -> list:
+    """
+    Windows of `size` words, each starting `size - overlap` words after the
+    previous one, so a sentence cut at a border is whole in one of them.
+    """
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, size - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(' '.join(words[start:start + size]))
+        if start + size >= len(words):
+            break
+    return chunks
+
+
+def chunk_id(source: str, text: str, extra: dict = None) -> str:
+    key = f'{source}\0{normalize_text(text)}'
+    if extra:
+        key += '\0' + json.dumps(extra, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    for file_path in (path, path + '.json'):
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as file:
+                for block in iter(lambda: file.read(1 << 20), b''):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def sidecar_metadata(path: str) -> dict:
+    if not os.path.exists(path + '.json'):
+        return {}
+    with open(path + '.json', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def chunk_file(path: str, source: str, size: int, overlap: int):
+    """
+    Runs in a worker process: returns the source, the file hash and the
+    chunks as (id, text, metadata).
+    """
+    metadata = {'source': source, 'tipo': 'ata' if ATA_PATTERN.search(source) else 'proposta'}
+    year = YEAR_PATTERN.findall(source)
+    if year:
+        metadata['ano'] = int(year[-1])
+    extra = sidecar_metadata(path)
+    metadata.update(extra)
+    # The sidecar is part of the ID, so editing it re-upserts the chunks
+    # (their vectors come from the embedding cache)
+    chunks = [
+        (chunk_id(source, text, extra), text, dict(metadata, summary=text, chunk=i))
+        for i, text in enumerate(split_chunks(read_text(path), size, overlap))
+    ]
+    return source, file_hash(path), chunks
+
+
+def sample_texts(paths: list, count: int, size: int, overlap: int) -> list:
+    texts = []
+    for path, source in discover(paths):
+        texts.extend(text for _, text, _ in chunk_file(path, source, size, overlap)[2])
+        if len(texts) >= count:
+            break
+    return texts[:count]
+
+
+def discover(paths: list) -> list:
+    """
+    Returns (path, source) pairs; `source` is the path relative to the
+    directory given, so the IDs don't depend on where the archive is mounted.
+    """
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append((path, os.path.basename(path)))
+            continue
+        for directory, _, names in os.walk(path):
+            for name in sorted(names):
+                if name.lower().endswith(EXTENSIONS) and not name.startswith(('.', '~$')):
+                    file_path = os.path.join(directory, name)
+                    files.append((file_path, os.path.relpath(file_path, path).replace(os.sep, '/')))
+    return files
+
+
+class Ledger:
+    """
+    Hash and chunk IDs of every file already in the index.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                self.files = json.load(file)
+
+    def unchanged(self, source: str, digest: str) -> bool:
+        return self.files.get(source, {}).get('hash') == digest
+
+    def ids(self, source: str) -> list:
+        return self.files.get(source, {}).get('ids', [])
+
+    def save(self) -> None:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(self.files, file, ensure_ascii=False)
+        os.replace(self.path + '.tmp', self.path)
+
+
+class Ingestor:
+    def __init__(self, index, model, ledger: Ledger, workers: int = None, chunk_words: int = 220,
+                 overlap: int = 40, embed_batch: int = 256, upsert_batch: int = 200, prefix: str = '') -> None:
+        self.index = index
+        self.model = model
+        self.prefix = prefix
+        self.ledger = ledger
+        self.workers = workers or os.cpu_count()
+        self.chunk_words = chunk_words
+        self.overlap = overlap
+        self.embed_batch = embed_batch
+        self.upsert_batch = upsert_batch
+        self._pending = []          # (id, text, metadata) to embed
+        self._pending_files = {}    # source -> ledger entry, saved once its chunks are written
+        self._stale = []            # IDs of chunks that left their file
+        self.stats = {'arquivos': 0, 'ignorados': 0, 'trechos': 0, 'novos': 0, 'removidos': 0}
+
+    def _collect(self, source: str, digest: str, chunks: list) -> None:
+        self.stats['arquivos'] += 1
+        self.stats['trechos'] += len(chunks)
+        known = set(self.ledger.ids(source))
+        ids = [id for id, _, _ in chunks]
+        self._stale.extend(known - set(ids))
+        # Chunks repeated inside one file are embedded once
+        seen = set(known)
+        for chunk in chunks:
+            if chunk[0] not in seen:
+                seen.add(chunk[0])
+                self._pending.append(chunk)
+        self._pending_files[source] = {'hash': digest, 'ids': list(dict.fromkeys(ids))}
+        if len(self._pending) >= self.embed_batch:
+            self.flush()
+
+    def flush(self) -> None:
+        pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.embed_batch):
+            batch = pending[start:start + self.embed_batch]
+            vectors = np.asarray(
+                self.model.encode([self.prefix + text for _, text, _ in batch], batch_size=min(len(batch), 64)),
+                dtype=np.float32,
+            )
+            for offset in range(0, len(batch), self.upsert_batch):
+                self.index.upsert(vectors=[
+                    {'id': id, 'values': vector.tolist(), 'metadata': metadata}
+                    for (id, _, metadata), vector in zip(batch[offset:offset + self.upsert_batch],
+                                                         vectors[offset:offset + self.upsert_batch])
+                ])
+            self.stats['novos'] += len(batch)
+
+        stale, self._stale = self._stale, []
+        for start in range(0, len(stale), 1000):
+            self.index.delete(ids=stale[start:start + 1000])
+        self.stats['removidos'] += len(stale)
+
+        # Recorded after the writes: an interrupted run redoes, never loses, a file
+        self.ledger.files.update(self._pending_files)
+        self._pending_files = {}
+        self.ledger.save()
+
+    def prune(self, sources: set) -> None:
+        """
+        Deletes the chunks of files that are no longer in the archive.
+        """
+        for source in [source for source in self.ledger.files if source not in sources]:
+            self._stale.extend(self.ledger.ids(source))
+            del self.ledger.files[source]
+        self.flush()
+
+    def run(self, paths: list, prune: bool = False) -> dict:
+        files = discover(paths)
+        changed = []
+        for path, source in files:
+            if self.ledger.unchanged(source, file_hash(path)):
+                self.stats['ignorados'] += 1
+            else:
+                changed.append((path, source))
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            # Bounded number of files in flight, so chunks don't pile up
+            for path, source in changed:
+                pending.add(executor.submit(chunk_file, path, source, self.chunk_words, self.overlap))
+                if len(pending) >= self.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._handle(future)
+            for future in pending:
+                self._handle(future)
+        self.flush()
+        if prune:
+            self.prune({source for _, source in files})
+        return self.stats
+
+    def _handle(self, future) -> None:
+        try:
+            self._collect(*future.result())
+        except Exception as e:
+            print(f"Falha ao ler arquivo: {e}", file=sys.stderr)
+
+
+class MultiProcessEncoder:
+    """
+    Spreads `encode` over several processes with sentence-transformers'
+    multi-process pool, for CPUs where one process doesn't use every core.
+    """
+
+    def __init__(self, model, processes: int) -> None:
+        self.model = model
+        self.pool = model.start_multi_process_pool(['cpu'] * processes)
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs):
+        return self.model.encode_multi_process(sentences, self.pool, batch_size=batch_size)
+
+    def close(self) -> None:
+        self.model.stop_multi_process_pool(self.pool)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Carrega propostas e atas de reunião no índice vetorial.')
+    parser.add_argument('paths', nargs='+', help='Arquivos ou diretórios a carregar')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--index', default='data/propostas-index', help='Diretório do índice vetorial local')
+    target.add_argument('--pinecone', metavar='NOME', help='Carrega no índice Pinecone com este nome')
+    parser.add_argument('--ledger', help='Registro dos arquivos carregados (padrão: <índice>/_ingest.json)')
+    parser.add_argument('--model', default=None, help='Modelo sentence-transformers')
+    parser.add_argument('--profile', choices=sorted(PROFILES), help='Perfil de embeddings (modelo, dimensões e quantização)')
+    parser.add_argument('--pca-sample', type=int, default=5000, help='Trechos usados para ajustar o PCA do perfil')
+    parser.add_argument('--cache', default='data/embeddings.sqlite3', help='Cache de embeddings ("" desativa)')
+    parser.add_argument('--workers', type=int, default=None, help='Processos de leitura (padrão: núcleos da CPU)')
+    parser.add_argument('--embed-processes', type=int, default=1, help='Processos do modelo de embeddings')
+    parser.add_argument('--chunk-words', type=int, default=220, help='Palavras por trecho')
+    parser.add_argument('--overlap', type=int, default=40, help='Palavras repetidas entre trechos vizinhos')
+    parser.add_argument('--embed-batch', type=int, default=256, help='Trechos por lote de embeddings')
+    parser.add_argument('--upsert-batch', type=int, default=200, help='Vetores por upsert')
+    parser.add_argument('--prune', action='store_true', help='Remove do índice os arquivos que não existem mais')
+    args = parser.parse_args(argv)
+
+    from server.backend import EMBEDDING_MODEL, load_embedding_model
+    pca_path = os.path.join('data', f'pca-{args.pinecone}.npz') if args.pinecone else os.path.join(args.index, 'pca.npz')
+    profile = resolve_profile(args.profile or {'model': args.model or EMBEDDING_MODEL}, pca_path=pca_path)
+    model = load_embedding_model(profile.model)
+    encoder = MultiProcessEncoder(model, args.embed_processes) if args.embed_processes > 1 else model
+
+    if profile.reduction == 'pca' and not os.path.exists(profile.pca_path):
+        texts = sample_texts(args.paths, args.pca_sample, args.chunk_words, args.overlap)
+        full = EmbeddingCache(encoder, model_id=profile.model, path=args.cache or None)
+        fit_pca(full.encode([profile.passage_prefix + text for text in texts], batch_size=64),
+                profile.dimension, profile.pca_path)
+    reduced = profile_encoder(encoder, profile)
+
+    if args.pinecone:
+        from pinecone import Pinecone
+        index = Pinecone(api_key=os.getenv('PINECONE_API_KEY')).Index(args.pinecone)
+        ledger_path = args.ledger or os.path.join('data', f'ingest-{args.pinecone}.json')
+    else:
+        from server.vector_index import VectorIndex
+        index = VectorIndex(args.index, dimension=profile.dimension or model.get_sentence_embedding_dimension(),
+                            quantization=profile.quantization, rescore=profile.rescore)
+        index.quantize()
+        ledger_path = args.ledger or os.path.join(args.index, '_ingest.json')
+
+    cached = EmbeddingCache(reduced, model_id=profile.cache_id, path=args.cache or None)
+    ingestor = Ingestor(index, cached, Ledger(ledger_path), args.workers, args.chunk_words, args.overlap,
+                        args.embed_batch, args.upsert_batch, prefix=profile.passage_prefix)
+
+    started = time.perf_counter()
+    try:
+        stats = ingestor.run(args.paths, prune=args.prune)
+    finally:
+        if isinstance(encoder, MultiProcessEncoder):
+            encoder.close()
+    if not args.pinecone:
+        from server.lexical_index import LexicalIndex
+        LexicalIndex(index).save()
+    elapsed = time.perf_counter() - started
+    print(f"{stats['arquivos']} arquivos lidos, {stats['ignorados']} sem alteração, {stats['trechos']} trechos, "
+          f"{stats['novos']} novos embeddings e {stats['removidos']} trechos removidos em {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+BM25 keyword index over the chunks of the local vector index, and the
+fusion of its ranking with the vector one.
+
+Dense retrieval alone misses exact client names, sectors and service lines.
+`LexicalIndex` tokenizes the `summary`, `cliente`, `setor`, `portfolio` and
+`source` metadata of every row of a `VectorIndex` and scores queries with
+BM25; `fuse` merges its ranking with the vector one by reciprocal rank
+fusion.
+
+    lexical = LexicalIndex(index)
+    lexical.query('previsão de demanda varejo', top_k=5, filter={'ano': 2024})
+
+Postings are keyed by the vector index's row, so deleted rows and metadata
+filters reuse its masks: a filter drops rows before any scoring. They are
+kept as one sorted array of rows (int32) and one of term frequencies
+(uint16) per term, plus a small in-memory segment for rows added since the
+last merge, which `refresh` fills from the vector index log. `save` writes
+the arrays to `<index>/bm25.npz`; on open they are reused as long as the
+vector index still has the same rows (`compact` and `train` renumber them,
+which triggers a rebuild).
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+TEXT_FIELDS = ('summary', 'cliente', 'setor', 'portfolio', 'source')
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+STOPWORDS = frozenset(
+    'a o e as os ao aos um uma uns umas de da do das dos em na no nas nos para por pela pelo pelas pelos '
+    'com sem que se sua seu suas seus ou mas como mais muito ja the and of to in for'.split()
+)
+
+
+def tokenize(text: str) -> list:
+    """
+    Lower-case, accent-free words, without stopwords and single letters.
+    """
+    text = unicodedata.normalize('NFKD', text.lower()).encode('ascii', 'ignore').decode('ascii')
+    return [token for token in TOKEN_PATTERN.findall(text)
+            if token not in STOPWORDS and (len(token) > 1 or token.isdigit())]
+
+
+def document(metadata: dict) -> str:
+    return ' '.join(str(metadata[field]) for field in TEXT_FIELDS if metadata.get(field))
+
+
+def _fingerprint(ids: list) -> str:
+    return hashlib.sha256('\n'.join(str(id) for id in ids).encode('utf-8')).hexdigest()
+
+
+class LexicalIndex:
+    def __init__(self, index, k1: float = 1.2, b: float = 0.75, merge_every: int = 4096) -> None:
+        self.index = index
+        self.k1 = k1
+        self.b = b
+        self.merge_every = merge_every
+        self.path = os.path.join(index.path, 'bm25.npz')
+        self._lock = threading.RLock()
+        self._reset()
+        self._load()
+        self.refresh()
+
+    def _reset(self) -> None:
+        self._terms = {}                            # term -> term id
+        self._offsets = np.zeros(1, dtype=np.int64)  # term id -> slice of the merged postings
+        self._rows = np.zeros(0, dtype=np.int32)
+        self._freqs = np.zeros(0, dtype=np.uint16)
+        self._delta = {}                            # term id -> (rows, freqs) not merged yet
+        self._delta_rows = 0
+        self._lengths = np.zeros(0, dtype=np.int32)
+        self._covered = 0                           # rows of the vector index already tokenized
+        self._last_id = None
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with np.load(self.path) as saved:
+            covered = int(saved['covered'])
+            if covered > self.index.row_count:
+                return
+            ids = [id for id, _ in self.index.entries(range(covered))]
+            if str(saved['fingerprint']) != _fingerprint(ids):
+                return
+            terms = saved['terms'].tobytes().decode('utf-8').split('\n') if saved['terms'].size else []
+            self._terms = {term: i for i, term in enumerate(terms)}
+            self._offsets = saved['offsets']
+            self._rows = saved['rows']
+            self._freqs = saved['freqs']
+            self._lengths = saved['lengths']
+            self._covered = covered
+            self._last_id = ids[-1] if ids else None
+
+    def save(self) -> None:
+        with self._lock:
+            self.refresh()
+            self._merge()
+            ids = [id for id, _ in self.index.entries(range(self._covered))]
+            np.savez(
+                self.path + '.tmp.npz',
+                terms=np.frombuffer('\n'.join(self._terms).encode('utf-8'), dtype=np.uint8),
+                offsets=self._offsets, rows=self._rows, freqs=self._freqs,
+                lengths=self._lengths[:self._covered], covered=self._covered,
+                fingerprint=_fingerprint(ids),
+            )
+            os.replace(self.path + '.tmp.npz', self.path)
+
+    # --- Updates ---
+
+    def refresh(self) -> None:
+        """
+        Tokenizes the rows the vector index gained since the last call.
+        """
+        self.index.refresh()
+        with self._lock:
+            count = self.index.row_count
+            if self._covered and (count < self._covered
+                                  or self.index.entries([self._covered - 1])[0][0] != self._last_id):
+                self._reset()  # the vector index was compacted
+            if count == self._covered:
+                return
+            entries = self.index.entries(range(self._covered, count))
+            if len(self._lengths) < count:
+                self._lengths = np.concatenate([self._lengths, np.zeros(max(count, 2 * len(self._lengths)) - len(self._lengths), dtype=np.int32)])
+            for row, (_, metadata) in enumerate(entries, self._covered):
+                counts = Counter(tokenize(document(metadata or {})))
+                self._lengths[row] = sum(counts.values())
+                for term, freq in counts.items():
+                    postings = self._delta.setdefault(self._terms.setdefault(term, len(self._terms)), ([], []))
+                    postings[0].append(row)
+                    postings[1].append(min(freq, 65535))
+            self._delta_rows += len(entries)
+            self._covered = count
+            self._last_id = entries[-1][0]
+            if self._delta_rows >= self.merge_every:
+                self._merge()
+
+    def _merge(self) -> None:
+        """
+        Folds the in-memory segment into the sorted arrays, dropping the
+        postings of deleted rows.
+        """
+        if not self._delta and len(self._offsets) == len(self._terms) + 1:
+            return
+        base_terms = np.repeat(np.arange(len(self._offsets) - 1, dtype=np.int32), np.diff(self._offsets))
+        delta = sorted(self._delta.items())
+        terms = np.concatenate([base_terms] + [np.full(len(rows), term, dtype=np.int32) for term, (rows, _) in delta])
+        rows = np.concatenate([self._rows] + [np.asarray(rows, dtype=np.int32) for _, (rows, _) in delta])
+        freqs = np.concatenate([self._freqs] + [np.asarray(freqs, dtype=np.uint16) for _, (_, freqs) in delta])
+
+        alive = self.index.mask()
+        keep = alive[rows]
+        terms, rows, freqs = terms[keep], rows[keep], freqs[keep]
+        # Stable: rows stay ascending within a term (merged ones precede newer ones)
+        order = np.argsort(terms, kind='stable')
+        self._rows, self._freqs = rows[order], freqs[order]
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=len(self._terms)))])
+        self._delta, self._delta_rows = {}, 0
+
+    def _postings(self, term: int):
+        start, end = (self._offsets[term], self._offsets[term + 1]) if term < len(self._offsets) - 1 else (0, 0)
+        rows, freqs = self._rows[start:end], self._freqs[start:end]
+        if term in self._delta:
+            delta_rows, delta_freqs = self._delta[term]
+            rows = np.concatenate([rows, np.asarray(delta_rows, dtype=np.int32)])
+            freqs = np.concatenate([freqs, np.asarray(delta_freqs, dtype=np.uint16)])
+        return rows, freqs
+
+    # --- Queries ---
+
+    def query(self, text: str, top_k: int = 5, include_metadata: bool = False, filter: dict = None, **kwargs) -> dict:
+        """
+        BM25 over the rows passing `filter`; same result shape as
+        `VectorIndex.query`.
+        """
+        self.refresh()
+        with self._lock:
+            terms = {self._terms[token] for token in tokenize(text) if token in self._terms}
+            if not terms:
+                return {'matches': []}
+            mask = self.index.mask(filter)[:self._covered]
+            total = int(mask.sum())
+            if total == 0:
+                return {'matches': []}
+            lengths = self._lengths[:self._covered]
+            average = float(lengths[mask].mean()) or 1.0
+
+            scores = np.zeros(self._covered, dtype=np.float32)
+            for term in terms:
+                rows, freqs = self._postings(term)
+                allowed = mask[rows]
+                rows, freqs = rows[allowed], freqs[allowed].astype(np.float32)
+                if len(rows) == 0:
+                    continue
+                idf = math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[rows] / average)
+                scores[rows] += idf * freqs * (self.k1 + 1) / (freqs + norm)
+
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+            candidates = candidates[np.argsort(-scores[candidates])]
+            matches = []
+            for row, (id, metadata) in zip(candidates, self.index.entries(candidates)):
+                match = {'id': id, 'score': float(scores[row])}
+                if include_metadata:
+                    match['metadata'] = metadata
+                matches.append(match)
+        return {'matches': matches}
+
+    def stats(self) -> dict:
+        return {
+            'terms': len(self._terms),
+            'postings': len(self._rows) + sum(len(rows) for rows, _ in self._delta.values()),
+            'unmerged_rows': self._delta_rows,
+        }
+
+
+def fuse(rankings: list, top_k: int, k: int = 60, weights: list = None) -> list:
+    """
+    Reciprocal rank fusion: a match scores sum(weight / (k + rank)) over the
+    rankings it appears in. Scores of different retrievers are not
+    comparable, ranks are.
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused, found = {}, {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, match in enumerate(ranking, 1):
+            fused[match['id']] = fused.get(match['id'], 0.0) + weight / (k + rank)
+            found.setdefault(match['id'], match)
+    best = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [dict(found[id], score=fused[id]) for id in best]
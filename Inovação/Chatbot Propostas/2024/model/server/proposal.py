@@ -0,0 +1,96 @@
+"""
+Section-wise generation of a commercial proposal.
+
+The proposal used to be one long generation covering every part of the
+document. `ProposalGenerator` takes the meeting ata and the context
+retrieved once for it, and asks the model for each section in its own
+concurrent call, so the whole proposal takes about as long as its slowest
+section. Sections are yielded as they finish, each with its position in the
+document, and a failed call is retried with backoff without holding back
+the other sections:
+
+    for event in ProposalGenerator(model).stream(ata, context):
+        event  # {'section': 'etapas', 'index': 2, 'title': ..., 'content': '## Etapas de execução\\n\\n...'}
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+SYSTEM_INSTRUCTION = (
+    "Você é um assistente para a criação de propostas comerciais. Você tem os dados de outras propostas "
+    "comerciais juntamente à ata de reunião delas, e deve receber a ata de outras reuniões para gerar propostas "
+    "comerciais para elas. Você deve utilizar o contexto dos dados para determinar quais dados utilizar da ata para "
+    "a proposta, quais devem ser as etapas de execução para aquela demanda, bem como qual é a dor do cliente e "
+    "impactos do projeto. Você deve retornar essa informação em texto, em partes por parágrafo, para que seja colada "
+    "na respectiva página da proposta."
+)
+
+# (key, title, instruction), in document order
+SECTIONS = [
+    ("contexto", "Contexto e objetivo",
+     "Escreva a seção de contexto e objetivo: quem é o cliente, a situação atual descrita na ata e o objetivo do projeto."),
+    ("dor", "Dor do cliente",
+     "Escreva a seção sobre a dor do cliente: os problemas e as consequências que motivam a demanda."),
+    ("dados", "Dados utilizados",
+     "Escreva a seção sobre os dados: quais dados e sistemas citados na ata serão utilizados e como."),
+    ("etapas", "Etapas de execução",
+     "Escreva a seção de etapas de execução: as fases do projeto, em ordem, com entregas de cada uma."),
+    ("impactos", "Impactos do projeto",
+     "Escreva a seção de impactos: os resultados esperados para o negócio do cliente, de preferência mensuráveis."),
+]
+
+
+def section_prompt(instruction: str, ata: str, context: str) -> str:
+    return (
+        f"Contexto de propostas anteriores:\n{context or '(nenhum)'}\n\n"
+        f"Ata da reunião:\n{ata}\n\n"
+        f"{instruction} Responda apenas com o texto da seção, em parágrafos."
+    )
+
+
+class ProposalGenerator:
+    def __init__(self, model, sections: list = None, max_workers: int = None, retries: int = 2,
+                 backoff: float = 0.5, metrics=None) -> None:
+        self.model = model
+        self.sections = sections or SECTIONS
+        self.max_workers = max_workers or len(self.sections)
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = metrics
+
+    def _generate(self, key: str, prompt: str) -> str:
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                text = self.model.generate_content(prompt).text
+                if self.metrics is not None:
+                    self.metrics.observe(f"section_{key}", time.perf_counter() - started)
+                return text
+            except Exception as e:
+                if self.metrics is not None:
+                    self.metrics.error(f"section_{key}", e)
+                if attempt == self.retries:
+                    raise
+                print(f"Section {key} failed (attempt {attempt + 1}): {e}")
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def stream(self, ata: str, context: str):
+        """
+        Yields one event per section, in the order they finish. A section
+        that still fails after the retries yields `failed` and a
+        placeholder text.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="proposal") as executor:
+            futures = {
+                executor.submit(self._generate, key, section_prompt(instruction, ata, context)): (index, key, title)
+                for index, (key, title, instruction) in enumerate(self.sections)
+            }
+            for future in as_completed(futures):
+                index, key, title = futures[future]
+                event = {"section": key, "index": index, "title": title}
+                try:
+                    body = future.result().strip()
+                except Exception as e:
+                    body = "_Não foi possível gerar esta seção. Tente novamente._"
+                    event["failed"] = str(e)
+                event["content"] = f"## {title}\n\n{body}\n\n"
+                yield event
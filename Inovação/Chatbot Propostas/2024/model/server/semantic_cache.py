@@ -0,0 +1,132 @@
+"""
+Semantic cache of generated proposals, keyed by the question's embedding.
+
+Near-identical requests ("proposta de dashboard para varejo", "proposta BI
+varejo") land close together in the embedding space. `SemanticCache` keeps
+the embeddings of recent questions in a small in-process matrix; a new
+question whose cosine similarity to a cached one reaches `threshold` gets
+that answer back, with the context it was generated from, without querying
+the index or calling the model:
+
+    cache = SemanticCache(threshold=0.92, ttl=86400, max_entries=512)
+    hit = cache.get(query_embedding, scope='{"ano": 2024}', version='42:1830')
+    cache.put(query_embedding, events, context, seconds=3.1, scope=..., version=...)
+
+Only questions with the same `scope` (the metadata filters) match. Entries
+expire after `ttl` seconds; when full, expired entries and then the least
+recently used one are evicted. `version` identifies the state of the
+proposal index: when it changes, every entry is dropped.
+
+The backend only enables the cache with `"semantic_cache": {"enabled":
+true}`: how similar two different questions look depends on the embedding
+model, so `threshold` has to be tuned for the embedding profile in use or
+different requests get each other's proposals.
+"""
+import threading
+import time
+
+import numpy as np
+
+
+class CachedResponse:
+    def __init__(self, events: list, context: str, seconds: float, similarity: float = 1.0) -> None:
+        self.events = events
+        self.context = context
+        self.seconds = seconds
+        self.similarity = similarity
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.92, ttl: float = 86400, max_entries: int = 512) -> None:
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self._version = None
+        self.clear()
+
+    def clear(self) -> None:
+        self._scope_ids = {}                                   # scope -> id, for the scopes in use
+        self._next_scope = 0
+        self._vectors = None                                   # slot -> normalized question embedding
+        self._expires = np.zeros(self.max_entries)             # slot -> expiry time (0: free)
+        self._last_used = np.zeros(self.max_entries)
+        self._scopes = np.full(self.max_entries, -1, dtype=np.int64)
+        self._responses = [None] * self.max_entries
+
+    def _check_version(self, version) -> None:
+        if version != self._version:
+            if self._version is not None:
+                self.clear()
+            self._version = version
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def get(self, vector, scope: str = '', version=None):
+        """
+        Returns the `CachedResponse` of the most similar live question, or
+        None.
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_version(version)
+            now = time.time()
+            scope_id = self._scope_ids.get(scope)
+            if self._vectors is None or scope_id is None or len(query) != self._vectors.shape[1]:
+                self.misses += 1
+                return None
+            scores = self._vectors @ query
+            scores[(self._expires <= now) | (self._scopes != scope_id)] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+            self._last_used[slot] = now
+            cached = self._responses[slot]
+            self.hits += 1
+            self.saved_seconds += cached.seconds
+            return CachedResponse(cached.events, cached.context, cached.seconds, float(scores[slot]))
+
+    def put(self, vector, events: list, context: str, seconds: float, scope: str = '', version=None) -> None:
+        vector = self._normalize(vector)
+        with self._lock:
+            self._check_version(version)
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                self.clear()
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            now = time.time()
+            free = np.flatnonzero(self._expires <= now)
+            slot = int(free[0]) if len(free) else int(np.argmin(self._last_used))
+            self._vectors[slot] = vector
+            self._last_used[slot] = now
+            self._expires[slot] = 0  # the slot's previous scope may be unused now
+            self._scopes[slot] = self._scope_id(scope, now)
+            self._expires[slot] = now + self.ttl
+            self._responses[slot] = CachedResponse(list(events), context, seconds)
+
+    def _scope_id(self, scope: str, now: float) -> int:
+        scope_id = self._scope_ids.get(scope)
+        if scope_id is None:
+            if len(self._scope_ids) >= self.max_entries:
+                # Forget the scopes no live entry uses, so the map stays bounded
+                live = set(self._scopes[self._expires > now].tolist())
+                self._scope_ids = {key: id for key, id in self._scope_ids.items() if id in live}
+            scope_id = self._scope_ids[scope] = self._next_scope
+            self._next_scope += 1
+        return scope_id
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'saved_seconds': self.saved_seconds,
+            'entries': int((self._expires > time.time()).sum()),
+        }
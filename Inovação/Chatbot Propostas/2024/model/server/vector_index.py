@@ -0,0 +1,603 @@
+"""
+Local approximate-nearest-neighbor index with the query interface of the
+Pinecone `propostas-comerciais` index, for offline and on-prem deployments.
+
+    index = VectorIndex('data/propostas-index', dimension=1024)
+    index.upsert([{'id': 'p1', 'values': vector, 'metadata': {'summary': '...'}}])
+    index.query(vector=query, top_k=5, include_metadata=True, filter={'ano': 2024})
+
+Layout of the index directory:
+
+    vectors.f32   raw float32 rows, L2-normalized, memory-mapped read-only
+    log.jsonl     one line per upsert/delete (id, row, metadata)
+    ivf.npz       IVF centroids and the list of every trained row
+    codes.i8      with quantization='int8': one int8 row per vector, plus
+    scales.f32    its scale (row = codes * scale)
+    codes.bits    with quantization='binary': the sign bits of each vector
+
+Vectors are mapped with `np.memmap`, so opening the index reads no vectors
+and every worker shares the same page cache. Scores are cosine similarities.
+`train` clusters the vectors and rewrites the files in list order, so a
+query scores the `nprobe` lists closest to it as contiguous slices of the
+map; rows added later are assigned to their nearest list on load. Small
+indexes and filtered queries that leave few candidates are scored exactly.
+
+With quantization, queries scan the codes, which are 4x (int8) or 32x
+(binary) smaller than the float rows, and rescore the best `top_k * rescore`
+candidates with the float rows, so only those pages of `vectors.f32` are
+read. Rows without codes yet (written by a float32 writer) are scored with
+their floats; `quantize` fills them in.
+
+Writes append to the files (vectors and codes first, then the log line), so
+readers in other processes pick them up on their next query; after a
+`compact` or `train` (the log is replaced) they reload the index. Only one
+process should write at a time (the ingest CLI or a single backend).
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+OPERATORS = {
+    '$eq': lambda value, target: value == target,
+    '$ne': lambda value, target: value != target,
+    '$gt': lambda value, target: value is not None and value > target,
+    '$gte': lambda value, target: value is not None and value >= target,
+    '$lt': lambda value, target: value is not None and value < target,
+    '$lte': lambda value, target: value is not None and value <= target,
+    '$in': lambda value, target: value in target,
+    '$nin': lambda value, target: value not in target,
+}
+
+
+def matches_filter(metadata: dict, filter: dict) -> bool:
+    """
+    Evaluates a Pinecone-style metadata filter: {'campo': valor},
+    {'campo': {'$in': [...]}}, combined with '$and' / '$or'.
+    """
+    for key, condition in filter.items():
+        if key == '$and':
+            if not all(matches_filter(metadata, part) for part in condition):
+                return False
+        elif key == '$or':
+            if not any(matches_filter(metadata, part) for part in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            for operator, target in condition.items():
+                if isinstance(value, list) and operator in ('$eq', '$in'):
+                    targets = target if operator == '$in' else [target]
+                    if not any(item in targets for item in value):
+                        return False
+                elif not OPERATORS[operator](value, target):
+                    return False
+    return True
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+QUANTIZATIONS = ('float32', 'int8', 'binary')
+POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def quantize(vectors: np.ndarray, quantization: str):
+    """
+    Codes of L2-normalized rows: (int8 codes, float32 scales) or (packed
+    sign bits, None).
+    """
+    if quantization == 'binary':
+        return np.packbits(vectors > 0, axis=-1), None
+    scales = np.maximum(np.abs(vectors).max(axis=-1), 1e-12) / 127
+    codes = np.round(vectors / scales[..., None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class VectorIndex:
+    def __init__(self, path: str, dimension: int = 1024, nprobe: int = 8, exact_below: int = 2000,
+                 quantization: str = 'float32', rescore: int = 4) -> None:
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Quantização desconhecida: {quantization}")
+        self.path = path
+        self.dimension = dimension
+        self.nprobe = nprobe
+        self.exact_below = exact_below
+        self.quantization = quantization
+        self.rescore = rescore
+        self.vectors_path = os.path.join(path, 'vectors.f32')
+        self.log_path = os.path.join(path, 'log.jsonl')
+        self.ivf_path = os.path.join(path, 'ivf.npz')
+        self.codes_path = os.path.join(path, 'codes.bits' if quantization == 'binary' else 'codes.i8')
+        self.scales_path = os.path.join(path, 'scales.f32')
+        self.code_size = (dimension + 7) // 8 if quantization == 'binary' else dimension
+        os.makedirs(path, exist_ok=True)
+        for file_path in (self.vectors_path, self.log_path):
+            open(file_path, 'ab').close()
+
+        self._lock = threading.RLock()
+        self._reset()
+        self.refresh()
+
+    def _reset(self) -> None:
+        self._ids = []          # row -> id
+        self._metadata = []     # row -> metadata
+        self._rows = {}         # id -> live row
+        self._alive = np.zeros(0, dtype=bool)
+        self._lists = np.zeros(0, dtype=np.int32)
+        self._centroids = None
+        self._members = []      # list -> rows
+        self._filters = {}      # filter -> (log offset, mask)
+        self._ivf_mtime = None
+        self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        self._codes = None      # row -> code, for the first `len(self._codes)` rows
+        self._scales = None
+        self._inodes = {}       # mapped file -> inode
+        self._log_inode = None
+        self._log_offset = 0
+
+    # --- Reading ---
+
+    def refresh(self) -> None:
+        """
+        Applies the log lines and vectors written since the last call, by this
+        or another process. A log that was replaced (`compact`, `train`) or
+        truncated since is read again from scratch, with every file remapped.
+        """
+        with self._lock:
+            stat = os.stat(self.log_path)
+            if stat.st_ino != self._log_inode or stat.st_size != self._log_offset:
+                with open(self.log_path, 'rb') as log:
+                    # The inode of the file actually read, not of the path
+                    stat = os.fstat(log.fileno())
+                    if self._log_inode is not None and (stat.st_ino != self._log_inode
+                                                        or stat.st_size < self._log_offset):
+                        self._reset()
+                    self._log_inode = stat.st_ino
+                    log.seek(self._log_offset)
+                    for line in log:
+                        if not line.endswith(b'\n'):
+                            break  # being written
+                        self._apply(json.loads(line))
+                        self._log_offset += len(line)
+            self._map_vectors()
+            self._map_codes()
+            self._load_ivf()
+
+    def _apply(self, entry: dict) -> None:
+        previous = self._rows.pop(entry['id'], None)
+        if previous is not None:
+            self._alive[previous] = False
+        if entry['op'] != 'upsert':
+            return
+        row = entry['row']
+        while len(self._ids) <= row:
+            self._ids.append(None)
+            self._metadata.append(None)
+        if len(self._alive) <= row:
+            grown = max(row + 1, 2 * len(self._alive), 1024)
+            self._alive = np.concatenate([self._alive, np.zeros(grown - len(self._alive), dtype=bool)])
+            self._lists = np.concatenate([self._lists, np.full(grown - len(self._lists), -1, dtype=np.int32)])
+        self._ids[row] = entry['id']
+        self._metadata[row] = entry.get('metadata') or {}
+        self._rows[entry['id']] = row
+        self._alive[row] = True
+
+    def _replaced(self, path: str, stat) -> bool:
+        """
+        Whether `path` is no longer the file mapped before: `compact` replaces
+        the vectors and codes just before the log, and until the new log is
+        read the old maps are the ones matching the rows.
+        """
+        return self._inodes.get(path, stat.st_ino) != stat.st_ino
+
+    def _map_vectors(self) -> None:
+        stat = os.stat(self.vectors_path)
+        rows = stat.st_size // (4 * self.dimension)
+        if rows == len(self._vectors) or self._replaced(self.vectors_path, stat):
+            return
+        if rows == 0:
+            self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        else:
+            mapped = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dimension))
+            self._vectors = mapped.view(np.ndarray)
+        self._inodes[self.vectors_path] = stat.st_ino
+        self._assign_new_rows()
+
+    def _map_codes(self) -> None:
+        if self.quantization == 'float32':
+            return
+        try:
+            stat = os.stat(self.codes_path)
+        except FileNotFoundError:
+            stat = None
+        if stat is not None and self._replaced(self.codes_path, stat):
+            return
+        rows = stat.st_size // self.code_size if stat is not None else 0
+        if self.quantization == 'int8':
+            try:
+                rows = min(rows, os.path.getsize(self.scales_path) // 4)
+            except FileNotFoundError:
+                rows = 0
+        rows = min(rows, len(self._vectors))
+        if self._codes is not None and rows == len(self._codes):
+            return
+        if rows == 0:
+            self._codes = np.zeros((0, self.code_size), dtype=np.uint8 if self.quantization == 'binary' else np.int8)
+            self._scales = np.zeros(0, dtype=np.float32)
+            return
+        dtype = np.uint8 if self.quantization == 'binary' else np.int8
+        self._codes = np.memmap(self.codes_path, dtype=dtype, mode='r', shape=(rows, self.code_size)).view(np.ndarray)
+        self._inodes[self.codes_path] = stat.st_ino
+        if self.quantization == 'int8':
+            self._scales = np.memmap(self.scales_path, dtype=np.float32, mode='r', shape=(rows,)).view(np.ndarray)
+
+    def _load_ivf(self) -> None:
+        try:
+            mtime = os.stat(self.ivf_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._ivf_mtime:
+            return
+        with np.load(self.ivf_path) as ivf:
+            self._centroids = ivf['centroids']
+            lists = ivf['lists']
+        self._ivf_mtime = mtime
+        self._lists[:] = -1
+        self._lists[:len(lists)] = lists[:len(self._lists)]
+        self._assign_new_rows()
+
+    def _assign_new_rows(self) -> None:
+        if self._centroids is None:
+            return
+        count = min(len(self._vectors), len(self._lists))
+        pending = np.flatnonzero(self._lists[:count] < 0)
+        for start in range(0, len(pending), 4096):
+            rows = pending[start:start + 4096]
+            self._lists[rows] = np.argmax(self._vectors[rows] @ self._centroids.T, axis=1)
+
+        lists = self._lists[:count]
+        order = np.argsort(lists, kind='stable')
+        bounds = np.searchsorted(lists[order], np.arange(len(self._centroids) + 1))
+        self._members = [order[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+
+    def _filter_mask(self, filter: dict) -> np.ndarray:
+        key = json.dumps(filter, sort_keys=True, default=str)
+        cached = self._filters.get(key)
+        if cached is not None and cached[0] == self._log_offset:
+            return cached[1]
+        mask = np.zeros(len(self._alive), dtype=bool)
+        for row in self._rows.values():
+            mask[row] = matches_filter(self._metadata[row], filter)
+        if len(self._filters) >= 64:
+            self._filters.pop(next(iter(self._filters)))
+        self._filters[key] = (self._log_offset, mask)
+        return mask
+
+    def _groups(self, query: np.ndarray, mask: np.ndarray, count: int, exact: bool = False) -> list:
+        """
+        Rows to score: everything allowed when that is few enough, otherwise
+        the members of the `nprobe` closest lists.
+        """
+        allowed = int(mask[:count].sum())
+        if exact or self._centroids is None or allowed <= self.exact_below:
+            if allowed == count:
+                return [np.arange(count)]
+            return [np.flatnonzero(mask[:count])]
+        nprobe = min(self.nprobe, len(self._centroids))
+        probes = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        return [self._members[probe] for probe in probes]
+
+    def _block(self, rows, query: np.ndarray, codes) -> np.ndarray:
+        """
+        Scores of `rows` (a slice or an array): from the codes when
+        quantized, else (and for rows without codes) from the floats.
+        """
+        if codes is None:
+            return self._vectors[rows] @ query
+        coded = len(self._codes)
+        if isinstance(rows, slice):
+            split = min(max(rows.start, coded), rows.stop)
+            parts = [(slice(rows.start, split), True), (slice(split, rows.stop), False)]
+        else:
+            split = np.searchsorted(rows, coded)  # rows are ascending
+            parts = [(rows[:split], True), (rows[split:], False)]
+
+        scores = []
+        for part, quantized in parts:
+            if not quantized:
+                scores.append(self._vectors[part] @ query)
+            elif self.quantization == 'binary':
+                distance = POPCOUNT[np.bitwise_xor(self._codes[part], codes)].sum(axis=1, dtype=np.int32)
+                scores.append(1 - 2 * distance.astype(np.float32) / self.dimension)
+            else:
+                scores.append((self._codes[part] @ query) * self._scales[part])
+        return np.concatenate(scores).astype(np.float32, copy=False)
+
+    def _score(self, query: np.ndarray, filter: dict, exact: bool = False):
+        count = min(len(self._vectors), len(self._alive))
+        mask = self._alive if not filter else self._alive & self._filter_mask(filter)
+        codes = None
+        if self._codes is not None and len(self._codes):
+            codes = quantize(query[None], 'binary')[0][0] if self.quantization == 'binary' else True
+        rows_parts, score_parts = [], []
+        for rows in self._groups(query, mask, count, exact):
+            if len(rows) == 0:
+                continue
+            # Lists are contiguous after `train`, followed by rows added since
+            breaks = np.flatnonzero(np.diff(rows) != 1)
+            run = len(rows) if len(breaks) == 0 else breaks[0] + 1
+            scores = self._block(slice(rows[0], rows[0] + run), query, codes)
+            if run < len(rows):
+                scores = np.concatenate([scores, self._block(rows[run:], query, codes)])
+            keep = mask[rows]
+            rows_parts.append(rows[keep])
+            score_parts.append(scores[keep])
+        if not rows_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.concatenate(rows_parts), np.concatenate(score_parts)
+
+    def query(self, vector, top_k: int = 5, include_metadata: bool = False, include_values: bool = False,
+              filter: dict = None, **kwargs) -> dict:
+        """
+        Same arguments and result shape as `pinecone.Index.query`.
+        """
+        self.refresh()
+        query = normalize(vector)
+        with self._lock:
+            rows, scores = self._score(query, filter)
+            if filter and len(rows) < top_k and self._centroids is not None:
+                # The probed lists hold too few rows passing the filter
+                rows, scores = self._score(query, filter, exact=True)
+            if len(rows) == 0:
+                return {'matches': []}
+            if self._codes is not None and len(self._codes) and self.rescore:
+                rows, scores = self._rescore(rows, scores, query, top_k * self.rescore)
+            if len(rows) > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+            else:
+                best = np.arange(len(rows))
+            best = best[np.argsort(-scores[best])]
+
+            matches = []
+            for position in best:
+                row = rows[position]
+                match = {'id': self._ids[row], 'score': float(scores[position])}
+                if include_metadata:
+                    match['metadata'] = self._metadata[row]
+                if include_values:
+                    match['values'] = self._vectors[row].tolist()
+                matches.append(match)
+        return {'matches': matches}
+
+    def _rescore(self, rows: np.ndarray, scores: np.ndarray, query: np.ndarray, count: int):
+        """
+        Exact scores of the best `count` approximate candidates.
+        """
+        if len(rows) > count:
+            rows = rows[np.argpartition(-scores, count - 1)[:count]]
+        rows = np.sort(rows)  # page-cache friendly reads of the float rows
+        return rows, self._vectors[rows] @ query
+
+    def fetch(self, ids: list) -> dict:
+        self.refresh()
+        with self._lock:
+            return {'vectors': {
+                id: {'id': id, 'values': self._vectors[row].tolist(), 'metadata': self._metadata[row]}
+                for id, row in ((id, self._rows.get(id)) for id in ids) if row is not None
+            }}
+
+    @property
+    def row_count(self) -> int:
+        return len(self._ids)
+
+    @property
+    def version(self) -> str:
+        """
+        Changes with every write, by any process, and with every compaction.
+        """
+        stat = os.stat(self.log_path)
+        return f'{stat.st_ino}:{stat.st_size}'
+
+    def entries(self, rows) -> list:
+        """
+        (id, metadata) of each row, live or not; for companion indexes keyed
+        by row (see `server.lexical_index`).
+        """
+        with self._lock:
+            return [(self._ids[row], self._metadata[row]) for row in rows]
+
+    def mask(self, filter: dict = None) -> np.ndarray:
+        """
+        Live rows passing `filter`, as a boolean array indexed by row.
+        """
+        with self._lock:
+            return self._alive.copy() if not filter else self._alive & self._filter_mask(filter)
+
+    def describe_index_stats(self) -> dict:
+        self.refresh()
+        return {
+            'dimension': self.dimension,
+            'total_vector_count': len(self._rows),
+            'lists': 0 if self._centroids is None else len(self._centroids),
+            'quantization': self.quantization,
+        }
+
+    # --- Writing ---
+
+    def upsert(self, vectors: list, **kwargs) -> dict:
+        """
+        Accepts Pinecone-style dicts ({'id', 'values', 'metadata'}) or
+        (id, values, metadata) tuples.
+        """
+        items = [(v['id'], v['values'], v.get('metadata')) if isinstance(v, dict) else tuple(v) + (None,) * (3 - len(v))
+                 for v in vectors]
+        if not items:
+            return {'upserted_count': 0}
+        values = normalize([item[1] for item in items])
+        if values.shape[1] != self.dimension:
+            raise ValueError(f"Dimensão {values.shape[1]} diferente da do índice ({self.dimension})")
+
+        with self._lock:
+            self.refresh()
+            first_row = os.path.getsize(self.vectors_path) // (4 * self.dimension)
+            with open(self.vectors_path, 'ab') as file:
+                file.write(values.tobytes())
+            if self.quantization != 'float32' and len(self._codes) == first_row:
+                self._write_codes(values, 'ab')
+            lines = [
+                json.dumps({'op': 'upsert', 'id': id, 'row': first_row + i, 'metadata': metadata or {}},
+                           ensure_ascii=False) + '\n'
+                for i, (id, _, metadata) in enumerate(items)
+            ]
+            with open(self.log_path, 'a', encoding='utf-8') as log:
+                log.writelines(lines)
+            self.refresh()
+        return {'upserted_count': len(items)}
+
+    def _write_codes(self, values: np.ndarray, mode: str) -> None:
+        codes, scales = quantize(values, self.quantization)
+        with open(self.codes_path, mode) as file:
+            file.write(codes.tobytes())
+        if scales is not None:
+            with open(self.scales_path, mode) as file:
+                file.write(scales.tobytes())
+
+    def quantize(self) -> int:
+        """
+        Writes the codes of the rows that have none (all of them when the
+        index was built without quantization). Returns how many were written.
+        """
+        if self.quantization == 'float32':
+            return 0
+        with self._lock:
+            self.refresh()
+            start, count = len(self._codes), len(self._vectors)
+            for offset in range(start, count, 65536):
+                self._write_codes(np.asarray(self._vectors[offset:min(offset + 65536, count)]), 'ab')
+            self.refresh()
+            return count - start
+
+    def delete(self, ids: list = None, **kwargs) -> dict:
+        with self._lock:
+            self.refresh()
+            lines = [json.dumps({'op': 'delete', 'id': id}, ensure_ascii=False) + '\n' for id in ids or [] if id in self._rows]
+            with open(self.log_path, 'a', encoding='utf-8') as log:
+                log.writelines(lines)
+            self.refresh()
+        return {}
+
+    def train(self, nlist: int = None, iterations: int = 10, sample: int = 50000, seed: int = 0) -> int:
+        """
+        Clusters the live vectors into `nlist` lists (default: sqrt of the
+        count) with spherical k-means, then rewrites the index in list order.
+        """
+        self.refresh()
+        with self._lock:
+            live = np.flatnonzero(self._alive[:len(self._vectors)])
+            if len(live) == 0:
+                return 0
+            nlist = min(nlist or max(1, int(np.sqrt(len(live)))), len(live))
+            random = np.random.default_rng(seed)
+            training = self._vectors[random.choice(live, min(sample, len(live)), replace=False)]
+            centroids = training[random.choice(len(training), nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = np.argmax(training @ centroids.T, axis=1)
+                for cluster in range(nlist):
+                    members = training[assignment == cluster]
+                    if len(members):
+                        centroids[cluster] = members.sum(axis=0)
+                centroids = normalize(centroids)
+
+            self._centroids = centroids
+            self._lists[:] = -1
+            self._assign_new_rows()
+            self.compact()
+            return nlist
+
+    def compact(self) -> None:
+        """
+        Rewrites the files with only the live rows, grouped by IVF list.
+        Readers in other processes see the new log on their next `refresh`
+        and reload everything from it.
+        """
+        with self._lock:
+            self.refresh()
+            rows = sorted(self._rows.values())
+            if self._centroids is not None:
+                rows = sorted(rows, key=lambda row: self._lists[row])
+            vectors = np.array(self._vectors[rows]) if rows else np.zeros((0, self.dimension), dtype=np.float32)
+            entries = [{'op': 'upsert', 'id': self._ids[row], 'row': i, 'metadata': self._metadata[row]}
+                       for i, row in enumerate(rows)]
+            lists = self._lists[rows].copy() if self._centroids is not None else None
+            centroids = self._centroids
+
+            with open(self.vectors_path + '.tmp', 'wb') as file:
+                file.write(vectors.tobytes())
+            with open(self.log_path + '.tmp', 'w', encoding='utf-8') as log:
+                log.writelines(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+            self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+            self._codes = self._scales = None
+            # Codes of the old row order are meaningless; rewritten if quantized
+            for stale in ('codes.i8', 'scales.f32', 'codes.bits'):
+                if os.path.exists(os.path.join(self.path, stale)):
+                    os.remove(os.path.join(self.path, stale))
+            if self.quantization != 'float32':
+                self._write_codes(vectors, 'wb')
+            os.replace(self.vectors_path + '.tmp', self.vectors_path)
+            os.replace(self.log_path + '.tmp', self.log_path)
+            if lists is not None:
+                np.savez(self.ivf_path + '.tmp.npz', centroids=centroids, lists=lists)
+                os.replace(self.ivf_path + '.tmp.npz', self.ivf_path)
+
+            self._reset()
+            self.refresh()
+
+
+def import_pinecone(index: VectorIndex, api_key: str, name: str = 'propostas-comerciais', batch_size: int = 100) -> int:
+    """
+    Copies every vector of a Pinecone index into `index`.
+    """
+    from pinecone import Pinecone
+    source = Pinecone(api_key=api_key).Index(name)
+    copied = 0
+    for ids in source.list():
+        for start in range(0, len(ids), batch_size):
+            fetched = source.fetch(ids=ids[start:start + batch_size]).vectors
+            index.upsert([
+                {'id': id, 'values': vector.values, 'metadata': vector.metadata or {}}
+                for id, vector in fetched.items()
+            ])
+            copied += len(fetched)
+    return copied
+
+
+def main(argv=None) -> None:
+    import argparse
+    parser = argparse.ArgumentParser(description='Manutenção do índice vetorial local.')
+    parser.add_argument('command', choices=['stats', 'train', 'compact', 'quantize', 'import-pinecone'])
+    parser.add_argument('path', help='Diretório do índice')
+    parser.add_argument('--dimension', type=int, default=1024)
+    parser.add_argument('--nlist', type=int, help='Listas do IVF (padrão: raiz do número de vetores)')
+    parser.add_argument('--quantization', choices=QUANTIZATIONS, default='float32')
+    args = parser.parse_args(argv)
+
+    index = VectorIndex(args.path, dimension=args.dimension, quantization=args.quantization)
+    if args.command == 'quantize':
+        print(f"{index.quantize()} vetores quantizados")
+    elif args.command == 'train':
+        print(f"{index.train(args.nlist)} listas")
+    elif args.command == 'compact':
+        index.compact()
+    elif args.command == 'import-pinecone':
+        print(f"{import_pinecone(index, os.getenv('PINECONE_API_KEY'))} vetores copiados")
+    print(index.describe_index_stats())
+
+
+if __name__ == '__main__':
+    main()
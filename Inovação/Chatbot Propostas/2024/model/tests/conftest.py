@@ -0,0 +1,8 @@
+"""
+Tests run from the app directory (`cd "Chatbot Propostas/2024/model" &&
+python -m pytest`), so `server` is this app's package.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,118 @@
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+
+import numpy as np
+
+from server.batching import BatchingEncoder
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Model:
+    """Stands in for the SentenceTransformer: one row per text, its length."""
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        self.calls.append(list(sentences))
+        return np.array([[len(text), batch_size] for text in sentences], dtype=np.float32)
+
+
+def test_concurrent_calls_are_coalesced():
+    model = Model()
+    encoder = BatchingEncoder(model, max_batch_size=8, max_wait=0.2)
+    texts = ['x' * i for i in range(1, 13)]
+    results = {}
+    start = threading.Barrier(len(texts))
+
+    def call(text):
+        start.wait()
+        results[text] = encoder.encode(text)
+
+    threads = [threading.Thread(target=call, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Each caller gets its own row; 12 calls fit in two batches of at most 8
+    assert all(results[text][0] == len(text) for text in texts)
+    assert len(model.calls) == encoder.batches == 2
+    assert sorted(len(call) for call in model.calls) == [4, 8]
+    assert encoder.stats()['mean_batch_size'] == 6.0
+
+
+def test_lists_and_extra_options():
+    model = Model()
+    encoder = BatchingEncoder(model, max_wait=0.01)
+    assert not encoder._workers
+
+    vectors = encoder.encode(['a', 'bbb'])
+    assert vectors.shape == (2, 2) and list(vectors[:, 0]) == [1, 3]
+    assert encoder._workers and model.calls == [['a', 'bbb']]
+
+    # Options the batch can't share bypass it
+    encoder.encode(['cc'], normalize_embeddings=True)
+    assert encoder.batches == 1 and model.calls[-1] == ['cc']
+
+
+def test_error_reaches_every_caller():
+    class Failing(Model):
+        def encode(self, sentences, **kwargs):
+            raise RuntimeError('sem memória')
+
+    encoder = BatchingEncoder(Failing(), max_wait=0.01)
+    try:
+        encoder.encode(['a', 'b'])
+    except RuntimeError as e:
+        assert str(e) == 'sem memória'
+    else:
+        raise AssertionError('encode should fail')
+    # The worker survives the failure
+    encoder.model = Model()
+    assert encoder.encode('ok')[0] == 2
+
+
+def test_encode_leaves_the_gevent_hub_free():
+    # Under gunicorn's gevent workers: while a CPU-bound batch runs, the
+    # other greenlets (requests) keep running
+    script = textwrap.dedent('''
+        from gevent import monkey
+        monkey.patch_all()
+
+        import time
+        import gevent
+        import numpy as np
+        from server.batching import BatchingEncoder
+
+        class Model:
+            calls = []
+
+            def encode(self, sentences, batch_size=32):
+                self.calls.append(len(sentences))
+                deadline = time.perf_counter() + 0.3
+                while time.perf_counter() < deadline:
+                    pass
+                return np.zeros((len(sentences), 2), dtype=np.float32)
+
+        ticks = []
+
+        def heartbeat():
+            while True:
+                ticks.append(1)
+                gevent.sleep(0.01)
+
+        model = Model()
+        encoder = BatchingEncoder(model, max_wait=0.05)
+        beat = gevent.spawn(heartbeat)
+        gevent.joinall([gevent.spawn(encoder.encode, str(i)) for i in range(6)])
+        beat.kill()
+        print(model.calls, len(ticks) > 10)
+    ''')
+    result = subprocess.run([sys.executable, '-c', script], cwd=APP_DIR, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split('\n')[0] == '[6] True'
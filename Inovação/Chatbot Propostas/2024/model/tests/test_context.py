@@ -0,0 +1,55 @@
+from server.context import ContextPacker, estimate_tokens, overlap, shingles
+
+
+def match(text: str, score=None) -> dict:
+    return {'id': text[:10], 'score': score, 'metadata': {'summary': text}}
+
+
+def words(start: int, count: int) -> str:
+    return ' '.join(f'termo{i:04d}' for i in range(start, start + count))
+
+
+def test_overlap_counts_contained_chunks():
+    long, short = shingles(words(0, 40)), shingles(words(10, 10))
+    assert overlap(long, short) == 1.0
+    assert overlap(shingles(words(0, 20)), shingles(words(100, 20))) == 0.0
+    assert overlap(set(), long) == 0.0
+
+
+def test_near_duplicates_are_dropped():
+    proposal = 'Projeto de previsão de demanda para o varejo com ' + words(0, 30)
+    reused = proposal.replace('varejo', 'atacado')
+    other = 'Dashboard de indicadores de vendas com ' + words(200, 30)
+
+    packed = ContextPacker(budget_tokens=10000).pack([match(proposal, 0.9), match(reused, 0.88), match(other, 0.7)])
+    assert packed.passages == [proposal, other]
+    assert packed.duplicates == 1 and packed.over_budget == 0
+    assert packed.saved_tokens == estimate_tokens(reused)
+    assert packed.text == f'- {proposal}\n- {other}'
+
+
+def test_diversity_prefers_a_novel_passage():
+    first = words(0, 40)
+    neighbour = words(20, 40)        # shares half its shingles with `first`
+    novel = words(500, 40)
+    matches = [match(first, 1.0), match(neighbour, 0.95), match(novel, 0.8)]
+
+    assert ContextPacker(diversity=0.0, duplicate_threshold=1.1).pack(matches).passages == [first, neighbour, novel]
+    assert ContextPacker(diversity=0.5, duplicate_threshold=1.1).pack(matches).passages == [first, novel, neighbour]
+
+
+def test_token_budget_is_respected():
+    passages = [words(i * 100, 30) for i in range(5)]
+    size = estimate_tokens(passages[0])
+    packed = ContextPacker(budget_tokens=size * 3 + 1).pack([match(text, 1.0 - i / 10) for i, text in enumerate(passages)])
+    assert packed.passages == passages[:3]
+    assert packed.tokens == size * 3 <= packed.candidate_tokens
+    assert packed.over_budget == 2 and packed.saved_tokens == size * 2
+
+
+def test_matches_without_scores_or_text():
+    # Keyword-only or fused results may lack scores: rank order is used
+    packed = ContextPacker().pack([match(words(0, 20)), {'id': 'x', 'metadata': {}}, match(words(100, 20))])
+    assert packed.passages == [words(0, 20), words(100, 20)]
+    empty = ContextPacker().pack([])
+    assert (empty.passages, empty.tokens, empty.text) == ([], 0, '')
@@ -0,0 +1,62 @@
+import numpy as np
+
+from server.embedding_cache import EmbeddingCache, cache_key
+
+
+class Model:
+    """Deterministic stand-in for the SentenceTransformer; records its calls."""
+
+    def __init__(self, offset: float = 0.0) -> None:
+        self.offset = offset
+        self.calls = []
+
+    def encode(self, sentences, batch_size=32):
+        self.calls.append(list(sentences))
+        return np.array([[len(text), text.count('a'), self.offset, 1 / 3] for text in sentences], dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+
+def test_normalized_text_hits_the_cache():
+    model = Model()
+    cache = EmbeddingCache(model, model_id='m')
+    first = cache.encode('proposta  de\n BI')
+    # Same text after NFC and whitespace collapsing: no model call
+    assert np.array_equal(cache.encode(' proposta de BI '), first)
+    # 'Cafe\u0301' (combining accent) is the same text as 'Café' after NFC
+    assert np.array_equal(cache.encode('Cafe\u0301'), cache.encode('Caf\u00e9'))
+    assert model.calls == [['proposta  de\n BI'], ['Cafe\u0301']]
+    assert cache.stats() == {'hits': 2, 'disk_hits': 0, 'misses': 2, 'entries': 2}
+    assert cache.get_sentence_embedding_dimension() == 4
+
+
+def test_keys_depend_on_the_model():
+    assert cache_key('m', 'texto') == cache_key('m', ' texto ')
+    assert cache_key('m', 'texto') != cache_key('outro', 'texto')
+
+
+def test_batch_encodes_only_unique_misses():
+    model = Model()
+    cache = EmbeddingCache(model, model_id='m')
+    cache.encode('a')
+    vectors = cache.encode(['a', 'bb', 'bb', 'ccc'])
+    assert vectors.shape == (4, 4) and list(vectors[:, 0]) == [1, 2, 2, 3]
+    assert model.calls == [['a'], ['bb', 'ccc']]
+
+
+def test_disk_entries_round_trip_as_float16(tmp_path):
+    path = str(tmp_path / 'embeddings.sqlite3')
+    vector = EmbeddingCache(Model(), model_id='m', path=path).encode('banana')
+
+    model = Model(offset=9.0)
+    reopened = EmbeddingCache(model, model_id='m', path=path, max_entries=1)
+    cached = reopened.encode('banana')
+    assert model.calls == [] and reopened.stats()['disk_hits'] == 1
+    assert cached.dtype == np.float32
+    assert np.array_equal(cached, vector.astype(np.float16).astype(np.float32))
+    assert np.allclose(cached, vector, rtol=1e-3) and cached[3] != vector[3]
+
+    # Another model id never reads the entry, even from the same file
+    other = EmbeddingCache(model, model_id='outro', path=path)
+    assert other.encode('banana')[2] == 9.0
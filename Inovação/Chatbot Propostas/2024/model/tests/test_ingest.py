@@ -0,0 +1,104 @@
+import json
+
+import numpy as np
+
+from server.ingest import Ingestor, Ledger, chunk_file, chunk_id, split_chunks
+
+
+class Index:
+    """Pinecone-like stand-in: upsert/delete by ID."""
+
+    def __init__(self) -> None:
+        self.vectors = {}
+        self.deleted = []
+
+    def upsert(self, vectors: list, **kwargs) -> None:
+        for vector in vectors:
+            self.vectors[vector['id']] = vector
+
+    def delete(self, ids: list = None, **kwargs) -> None:
+        self.deleted.extend(ids)
+        for id in ids:
+            self.vectors.pop(id, None)
+
+
+class Model:
+    def __init__(self) -> None:
+        self.texts = []
+
+    def encode(self, sentences, batch_size=32):
+        self.texts.extend(sentences)
+        return np.ones((len(sentences), 4), dtype=np.float32)
+
+
+def words(start: int, count: int) -> str:
+    return ' '.join(f'palavra{i}' for i in range(start, start + count))
+
+
+def ingest(tmp_path, index, model, prune=False) -> dict:
+    ingestor = Ingestor(index, model, Ledger(str(tmp_path / '_ingest.json')), workers=1, chunk_words=10, overlap=2)
+    return ingestor.run([str(tmp_path / 'propostas')], prune=prune)
+
+
+def test_split_chunks_overlap():
+    chunks = split_chunks(words(0, 20), size=10, overlap=2)
+    assert [chunk.split()[0] for chunk in chunks] == ['palavra0', 'palavra8', 'palavra16']
+    assert chunks[-1].split()[-1] == 'palavra19'
+    assert split_chunks('  \n') == []
+
+
+def test_chunk_metadata_and_ids(tmp_path):
+    path = tmp_path / 'Ata reunião 2023.txt'
+    path.write_text(words(0, 12))
+    (tmp_path / 'Ata reunião 2023.txt.json').write_text(json.dumps({'cliente': 'ACME'}))
+
+    source, digest, chunks = chunk_file(str(path), 'atas/Ata reunião 2023.txt', 10, 2)
+    assert source == 'atas/Ata reunião 2023.txt' and len(chunks) == 2
+    id, text, metadata = chunks[0]
+    assert metadata == {'source': source, 'tipo': 'ata', 'ano': 2023, 'cliente': 'ACME', 'summary': text, 'chunk': 0}
+    # Stable across runs and whitespace, but tied to the sidecar fields
+    assert id == chunk_id(source, text.replace(' ', '  '), {'cliente': 'ACME'})
+    assert id != chunk_id(source, text)
+
+
+def test_unchanged_files_are_skipped(tmp_path):
+    folder = tmp_path / 'propostas'
+    folder.mkdir()
+    (folder / 'varejo.md').write_text(words(0, 18))
+    (folder / 'saude.txt').write_text(words(100, 8))
+    index, model = Index(), Model()
+
+    stats = ingest(tmp_path, index, model)
+    assert stats['arquivos'] == 2 and stats['novos'] == len(index.vectors) == 3
+    ledger = Ledger(str(tmp_path / '_ingest.json'))
+    assert sorted(ledger.files) == ['saude.txt', 'varejo.md']
+    assert sorted(id for entry in ledger.files.values() for id in entry['ids']) == sorted(index.vectors)
+
+    model.texts.clear()
+    stats = ingest(tmp_path, index, model)
+    assert stats['ignorados'] == 2 and stats['arquivos'] == 0 and model.texts == []
+
+
+def test_changed_file_embeds_only_new_chunks(tmp_path):
+    folder = tmp_path / 'propostas'
+    folder.mkdir()
+    (folder / 'varejo.md').write_text(words(0, 18))
+    (folder / 'saude.txt').write_text(words(100, 8))
+    index, model = Index(), Model()
+    ingest(tmp_path, index, model)
+    before = set(index.vectors)
+
+    # Same first window, a different second one
+    (folder / 'varejo.md').write_text(words(0, 10) + ' ' + words(50, 6))
+    model.texts.clear()
+    stats = ingest(tmp_path, index, model)
+    assert stats['ignorados'] == 1 and stats['novos'] == 1 and stats['removidos'] == 1
+    assert model.texts == [words(8, 2) + ' ' + words(50, 6)]
+    assert len(before & set(index.vectors)) == 2
+
+    # A file removed from the archive is deleted with --prune
+    (folder / 'saude.txt').unlink()
+    stats = ingest(tmp_path, index, model, prune=True)
+    assert stats['removidos'] == 1
+    assert {vector['metadata']['source'] for vector in index.vectors.values()} == {'varejo.md'}
+    assert list(Ledger(str(tmp_path / '_ingest.json')).files) == ['varejo.md']
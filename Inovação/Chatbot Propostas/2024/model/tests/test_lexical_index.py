@@ -0,0 +1,81 @@
+import numpy as np
+
+from server.lexical_index import LexicalIndex, fuse, tokenize
+from server.vector_index import VectorIndex
+
+DIMENSION = 8
+
+DOCUMENTS = [
+    {'summary': 'Previsão de demanda para o varejo', 'cliente': 'Lojas Alfa', 'ano': 2024},
+    {'summary': 'Dashboard de vendas e previsão', 'cliente': 'Beta Saúde', 'ano': 2023},
+    {'summary': 'Modelo de churn para telecom', 'cliente': 'Gama Tel', 'ano': 2024},
+]
+
+
+def fill(index, documents, start=0):
+    index.upsert([
+        {'id': f'd{i}', 'values': np.ones(DIMENSION, dtype=np.float32), 'metadata': metadata}
+        for i, metadata in enumerate(documents, start)
+    ])
+
+
+def ids(result) -> list:
+    return [match['id'] for match in result['matches']]
+
+
+def test_tokenize():
+    assert tokenize('Previsão de Demanda, varejo_2024 e a ACME!') == ['previsao', 'demanda', 'varejo', '2024', 'acme']
+
+
+def test_query_ranks_and_filters(tmp_path):
+    index = VectorIndex(str(tmp_path), dimension=DIMENSION)
+    fill(index, DOCUMENTS)
+    lexical = LexicalIndex(index)
+
+    assert ids(lexical.query('previsão varejo')) == ['d0', 'd1']
+    assert ids(lexical.query('previsão', filter={'ano': 2023})) == ['d1']
+    assert ids(lexical.query('saude', include_metadata=True)) == ['d1']
+    assert lexical.query('inexistente') == {'matches': []}
+    match = lexical.query('gama', include_metadata=True)['matches'][0]
+    assert match['metadata']['cliente'] == 'Gama Tel' and match['score'] > 0
+
+
+def test_rows_added_later_go_to_the_delta_segment(tmp_path):
+    index = VectorIndex(str(tmp_path), dimension=DIMENSION)
+    fill(index, DOCUMENTS)
+    lexical = LexicalIndex(index, merge_every=100)
+    lexical.save()
+    assert lexical.stats()['unmerged_rows'] == 0
+
+    # Another writer adds a row: the next query tokenizes it into the delta
+    fill(VectorIndex(str(tmp_path), dimension=DIMENSION), [{'summary': 'Previsão de safra', 'cliente': 'Agro'}], start=3)
+    assert ids(lexical.query('safra')) == ['d3']
+    assert lexical.stats()['unmerged_rows'] == 1
+    assert set(ids(lexical.query('previsão'))) == {'d0', 'd1', 'd3'}
+
+    # Merging keeps the results and drops the postings of deleted rows
+    index.delete(ids=['d1'])
+    lexical.save()
+    assert lexical.stats()['unmerged_rows'] == 0
+    assert set(ids(lexical.query('previsão'))) == {'d0', 'd3'}
+
+    # The saved postings are reused as long as the rows match
+    reopened = LexicalIndex(VectorIndex(str(tmp_path), dimension=DIMENSION))
+    assert reopened._covered == 4 and reopened.stats()['unmerged_rows'] == 0
+    assert set(ids(reopened.query('previsão'))) == {'d0', 'd3'}
+
+
+def test_fuse_orders_by_reciprocal_rank():
+    vector = [{'id': 'a', 'score': 0.9}, {'id': 'b', 'score': 0.8}, {'id': 'c', 'score': 0.7, 'metadata': {'ano': 2024}}]
+    keyword = [{'id': 'c', 'score': 12.0}, {'id': 'b', 'score': 3.0}, {'id': 'd', 'score': 1.0}]
+
+    fused = fuse([vector, keyword], top_k=3, k=60)
+    # Found by both retrievers beats first in one: c (3rd + 1st), b (2nd + 2nd), a
+    assert [match['id'] for match in fused] == ['c', 'b', 'a']
+    assert [match['score'] for match in fused] == [1 / 63 + 1 / 61, 2 / 62, 1 / 61]
+    # The fields of the first ranking a match appears in are kept
+    assert fused[0]['metadata'] == {'ano': 2024}
+
+    # With the keyword ranking weighted out, the vector order is back
+    weighted = fuse([vector, keyword], top_k=3, k=60, weights=[1.0, 0.0])
+    assert [match['id'] for match in weighted] == ['a', 'b', 'c']
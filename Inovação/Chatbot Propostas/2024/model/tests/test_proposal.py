@@ -0,0 +1,62 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from server.proposal import SECTIONS, ProposalGenerator, section_prompt
+
+
+class Model:
+    """Answers each section after `delays[key]` seconds; `failures[key]` calls fail first."""
+
+    def __init__(self, delays=None, failures=None) -> None:
+        self.delays = delays or {}
+        self.failures = dict(failures or {})
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str):
+        key = next(key for key, _, instruction in SECTIONS if instruction in prompt)
+        with self._lock:
+            self.calls.append(key)
+            failing = self.failures.get(key, 0) > 0
+            if failing:
+                self.failures[key] -= 1
+        time.sleep(self.delays.get(key, 0))
+        if failing:
+            raise RuntimeError(f'{key} indisponível')
+        return SimpleNamespace(text=f'  Texto de {key}.  ')
+
+
+def test_sections_stream_as_they_finish_with_their_position():
+    model = Model(delays={'contexto': 0.3, 'dor': 0.2})
+    events = list(ProposalGenerator(model).stream('Ata da reunião', 'Propostas anteriores'))
+
+    # Slow sections don't hold back the others; `index` restores document order
+    finished = [event['section'] for event in events]
+    assert finished[-2:] == ['dor', 'contexto']
+    ordered = sorted(events, key=lambda event: event['index'])
+    assert [event['section'] for event in ordered] == [key for key, _, _ in SECTIONS]
+    assert ordered[3] == {'section': 'etapas', 'index': 3, 'title': 'Etapas de execução',
+                          'content': '## Etapas de execução\n\nTexto de etapas.\n\n'}
+
+
+def test_failed_section_is_retried():
+    model = Model(failures={'dados': 2})
+    events = {event['section']: event for event in ProposalGenerator(model, backoff=0.01).stream('ata', '')}
+    assert model.calls.count('dados') == 3
+    assert 'failed' not in events['dados'] and events['dados']['content'].endswith('Texto de dados.\n\n')
+
+
+def test_section_failing_every_attempt_gets_a_placeholder():
+    model = Model(failures={'impactos': 5})
+    events = {event['section']: event for event in ProposalGenerator(model, retries=1, backoff=0.01).stream('ata', '')}
+    assert model.calls.count('impactos') == 2
+    assert events['impactos']['failed'] == 'impactos indisponível'
+    assert 'Não foi possível gerar esta seção' in events['impactos']['content']
+    assert all('failed' not in event for key, event in events.items() if key != 'impactos')
+
+
+def test_section_prompt():
+    prompt = section_prompt('Escreva a seção.', 'Ata X', '')
+    assert prompt.startswith('Contexto de propostas anteriores:\n(nenhum)\n\nAta da reunião:\nAta X\n\n')
+    assert prompt.endswith('Escreva a seção. Responda apenas com o texto da seção, em parágrafos.')
@@ -0,0 +1,18 @@
+import pytest
+
+from server import backend, run
+
+
+@pytest.mark.parametrize('config, expected', [
+    ({}, backend.EMBEDDING_MODEL),
+    ({'embedding_model': 'sentence-transformers/outro'}, 'sentence-transformers/outro'),
+    ({'embedding_profile': 'minilm-int8'}, 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'),
+    ({'embedding_profile': {'name': 'e5-small', 'dimension': 256}, 'embedding_model': 'ignorado'},
+     'intfloat/multilingual-e5-small'),
+])
+def test_preload_loads_the_profile_model(monkeypatch, config, expected):
+    loaded = []
+    monkeypatch.setattr(backend, 'load_embedding_model', loaded.append)
+    run.preload(config)
+    assert loaded == [expected]
+    assert backend.embedding_profile(config).model == expected
@@ -0,0 +1,54 @@
+import os
+import time
+
+import numpy as np
+
+from server.semantic_cache import SemanticCache
+
+
+def test_scope_map_stays_bounded():
+    cache = SemanticCache(ttl=0.2, max_entries=4)
+    vector = np.ones(8, dtype=np.float32)
+    for i in range(50):
+        if i and i % 10 == 0:
+            time.sleep(0.25)
+        cache.put(vector, [], f'contexto {i}', 1.0, scope=f'{{"ano": {i}}}')
+    assert len(cache._scope_ids) <= cache.max_entries + 1
+
+    # Live entries are still found under their scope, and only there
+    assert cache.get(vector, scope='{"ano": 49}').context == 'contexto 49'
+    assert cache.get(vector, scope='{"ano": 48}').context == 'contexto 48'
+    assert cache.get(vector, scope='{"ano": 0}') is None
+
+
+def test_reused_slot_keeps_other_scopes_apart():
+    cache = SemanticCache(max_entries=2)
+    vector = np.ones(8, dtype=np.float32)
+    for i in range(10):
+        cache.put(vector, [], f'contexto {i}', 1.0, scope=f'escopo {i}')
+    assert len(cache._scope_ids) <= 3
+    assert cache.get(vector, scope='escopo 9').context == 'contexto 9'
+    assert cache.get(vector, scope='escopo 8').context == 'contexto 8'
+    assert cache.get(vector, scope='escopo 7') is None
+
+
+def test_pinecone_version_changes_with_the_ingest_ledger(tmp_path):
+    from types import SimpleNamespace
+
+    from server.backend import Backend_Api
+
+    class Pinecone:
+        def describe_index_stats(self):
+            return {'total_vector_count': 120}
+
+    ledger = tmp_path / 'ingest.json'
+    api = SimpleNamespace(semantic_cache_config={'ledger': str(ledger), 'version_check_seconds': 0},
+                          pinecone_index=Pinecone(), _index_version_checked=None, _index_version_value=None)
+    versions = [Backend_Api._index_version(api)]
+    ledger.write_text('{}')
+    versions.append(Backend_Api._index_version(api))
+    # A re-ingest upserting the same IDs keeps the count but rewrites the ledger
+    os.utime(ledger, ns=(0, ledger.stat().st_mtime_ns + 10**9))
+    versions.append(Backend_Api._index_version(api))
+    assert versions[0] == (120, None)
+    assert len(set(versions)) == 3
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from server.vector_index import VectorIndex
+
+DIMENSION = 32
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(400, DIMENSION)).astype(np.float32)
+
+
+def fill(index, vectors, start=0):
+    index.upsert([{'id': f'v{i}', 'values': vectors[i], 'metadata': {'row': i}} for i in range(start, len(vectors))])
+
+
+def top(index, vector):
+    match = index.query(vector=vector, top_k=1, include_metadata=True)['matches'][0]
+    return match['id'], match['metadata']['row']
+
+
+def test_reader_sees_appends_from_another_writer(tmp_path, vectors):
+    writer = VectorIndex(str(tmp_path), dimension=DIMENSION)
+    fill(writer, vectors[:200])
+    reader = VectorIndex(str(tmp_path), dimension=DIMENSION)
+    fill(writer, vectors, start=200)
+    assert top(reader, vectors[300]) == ('v300', 300)
+    assert reader.describe_index_stats()['total_vector_count'] == 400
+
+
+@pytest.mark.parametrize('quantization', ['float32', 'int8', 'binary'])
+def test_reader_reloads_after_train_in_another_process(tmp_path, vectors, quantization):
+    writer = VectorIndex(str(tmp_path), dimension=DIMENSION, quantization=quantization, exact_below=0)
+    fill(writer, vectors)
+    reader = VectorIndex(str(tmp_path), dimension=DIMENSION, quantization=quantization, exact_below=0, nprobe=20)
+    assert top(reader, vectors[125]) == ('v125', 125)
+
+    writer.delete(ids=[f'v{i}' for i in range(0, 400, 3)])
+    writer.train(nlist=20)
+    for i in (125, 200, 386):
+        assert top(reader, vectors[i]) == (f'v{i}', i)
+    assert reader.describe_index_stats()['total_vector_count'] == len(writer._rows)
+    assert reader.fetch(ids=['v0'])['vectors'] == {}
+
+
+def test_reader_reloads_after_compact_and_new_writes(tmp_path, vectors):
+    writer = VectorIndex(str(tmp_path), dimension=DIMENSION)
+    fill(writer, vectors[:300])
+    reader = VectorIndex(str(tmp_path), dimension=DIMENSION)
+    reader.refresh()
+
+    writer.delete(ids=[f'v{i}' for i in range(100)])
+    writer.compact()
+    fill(writer, vectors, start=300)
+    assert top(reader, vectors[150]) == ('v150', 150)
+    assert top(reader, vectors[350]) == ('v350', 350)
+    assert reader.row_count == 300
+
+
+def test_reader_reloads_truncated_log(tmp_path, vectors):
+    writer = VectorIndex(str(tmp_path), dimension=DIMENSION)
+    fill(writer, vectors[:50])
+    reader = VectorIndex(str(tmp_path), dimension=DIMENSION)
+    assert reader.row_count == 50
+
+    with open(writer.log_path, 'r+', encoding='utf-8') as log:
+        lines = log.readlines()[:10]
+        log.seek(0)
+        log.writelines(lines)
+        log.truncate()
+    reader.refresh()
+    assert reader.row_count == 10
+    assert reader.describe_index_stats()['total_vector_count'] == 10
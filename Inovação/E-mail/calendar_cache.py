@@ -0,0 +1,177 @@
+"""
+Cache dos eventos da agenda, sincronizado de forma incremental.
+
+Cada rerun do Streamlit (clique, seleção, tecla no texto) buscava de novo os
+eventos do dia na API. `CalendarCache` carrega de uma vez uma janela de
+algumas semanas (seguindo a paginação) e guarda o `nextSyncToken` da
+Calendar API; depois disso, a cada `min_sync_interval` segundos no máximo,
+pede só o que mudou desde a última sincronização:
+
+    cache = CalendarCache(weeks=4)
+    eventos = cache.events_for_date(cal_service, data)
+
+A janela acompanha o dia atual (de `past_days` atrás até `weeks` semanas à
+frente); datas fora dela são buscadas direto na API. Se o token expirar
+(HTTP 410), a janela é carregada de novo.
+"""
+import datetime
+import threading
+import time
+
+# Máximo permitido pela Calendar API por página
+PAGE_SIZE = 2500
+
+
+def day_bounds(date):
+    """
+    Início e fim (UTC) do dia, como na busca original por data.
+    """
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    start = datetime.datetime.combine(date, datetime.time.min, tzinfo=datetime.timezone.utc)
+    return start, start + datetime.timedelta(days=1)
+
+
+def rfc3339(moment):
+    return moment.astimezone(datetime.timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+def _moment(value):
+    """
+    Instante de um `start`/`end` da API; eventos de dia inteiro ('date')
+    começam à meia-noite UTC.
+    """
+    if "dateTime" in value:
+        return datetime.datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+    return datetime.datetime.combine(
+        datetime.date.fromisoformat(value["date"]), datetime.time.min, tzinfo=datetime.timezone.utc
+    )
+
+
+def overlaps(event, start, end):
+    try:
+        return _moment(event["start"]) < end and _moment(event.get("end", event["start"])) > start
+    except (KeyError, ValueError):
+        return False
+
+
+def start_key(event):
+    # Mesma ordem do orderBy="startTime": dia inteiro primeiro, depois por horário
+    return (0 if "date" in event["start"] else 1, _moment(event["start"]))
+
+
+def _status(error):
+    return getattr(getattr(error, "resp", None), "status", None)
+
+
+class CalendarCache:
+    def __init__(self, calendar_id="primary", weeks=4, past_days=7, min_sync_interval=30):
+        self.calendar_id = calendar_id
+        self.weeks = weeks
+        self.past_days = past_days
+        self.min_sync_interval = min_sync_interval
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.requests = 0
+        self._events = {}  # id -> evento, dentro da janela
+        self._window = None
+        self._sync_token = None
+        self._synced_at = None
+        self._outside = {}  # data fora da janela -> (instante, eventos)
+        self._lock = threading.Lock()
+
+    def _current_window(self):
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        start, _ = day_bounds(today - datetime.timedelta(days=self.past_days))
+        _, end = day_bounds(today + datetime.timedelta(weeks=self.weeks))
+        return start, end
+
+    def _list(self, service, **params):
+        """
+        Todas as páginas de um `events().list`; devolve os eventos e o
+        `nextSyncToken` da última página.
+        """
+        items, page_token = [], None
+        while True:
+            self.requests += 1
+            response = (
+                service.events()
+                .list(calendarId=self.calendar_id, singleEvents=True, maxResults=PAGE_SIZE,
+                      pageToken=page_token, **params)
+                .execute()
+            )
+            items.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return items, response.get("nextSyncToken")
+
+    def _full_sync(self, service, window):
+        start, end = window
+        items, token = self._list(service, timeMin=rfc3339(start), timeMax=rfc3339(end))
+        self._events = {event["id"]: event for event in items if event.get("status") != "cancelled"}
+        self._window, self._sync_token = window, token
+        self._synced_at = time.monotonic()
+        self.full_syncs += 1
+
+    def _incremental_sync(self, service):
+        try:
+            # O syncToken não pode ser combinado com timeMin/timeMax/orderBy
+            items, token = self._list(service, syncToken=self._sync_token)
+        except Exception as error:
+            if _status(error) == 410:
+                # Token expirado: recarrega a janela inteira
+                self._full_sync(service, self._window)
+                return
+            raise
+        start, end = self._window
+        for event in items:
+            if event.get("status") == "cancelled" or not overlaps(event, start, end):
+                self._events.pop(event["id"], None)
+            else:
+                self._events[event["id"]] = event
+        self._sync_token = token or self._sync_token
+        self._synced_at = time.monotonic()
+        self.incremental_syncs += 1
+
+    def sync(self, service, force=False):
+        """
+        Atualiza a janela: carga completa na primeira vez ou quando o dia
+        muda, e incremental depois (no máximo a cada `min_sync_interval`).
+        """
+        with self._lock:
+            window = self._current_window()
+            if self._window != window or not self._sync_token:
+                self._full_sync(service, window)
+            elif force or time.monotonic() - self._synced_at >= self.min_sync_interval:
+                self._incremental_sync(service)
+
+    def events_for_date(self, service, date):
+        """
+        Eventos do dia, em ordem de início, como o `events().list` com
+        `orderBy="startTime"`.
+        """
+        self.sync(service)
+        start, end = day_bounds(date)
+        with self._lock:
+            window_start, window_end = self._window
+            if window_start <= start and end <= window_end:
+                events = [event for event in self._events.values() if overlaps(event, start, end)]
+                return sorted(events, key=start_key)
+
+            # Fora da janela: busca direta, guardada por `min_sync_interval`
+            cached = self._outside.get(start)
+            if cached and time.monotonic() - cached[0] < self.min_sync_interval:
+                return cached[1]
+            items, _ = self._list(service, timeMin=rfc3339(start), timeMax=rfc3339(end), orderBy="startTime")
+            if len(self._outside) >= 32:
+                self._outside.clear()
+            self._outside[start] = (time.monotonic(), items)
+            return items
+
+    def stats(self):
+        return {
+            "events": len(self._events),
+            "full_syncs": self.full_syncs,
+            "incremental_syncs": self.incremental_syncs,
+            "requests": self.requests,
+        }
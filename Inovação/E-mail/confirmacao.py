@@ -0,0 +1,207 @@
+"""
+Montagem e envio das mensagens de confirmação de reunião, sem dependência do
+Streamlit: `email_deploy.py` usa estas funções tanto para um evento quanto
+para o envio em lote.
+
+    confirmacoes = build_confirmations(eventos_por_dia, hoje, assinatura)
+    resultados = send_batch(gmail_service, confirmacoes)
+
+O lote vai em requisições batch da API do Gmail (até `BATCH_SIZE` envios por
+requisição HTTP); cada mensagem tem seu próprio status.
+"""
+import base64
+import datetime
+import time
+from email.mime.text import MIMEText
+
+INTERNAL_DOMAIN = "@polijunior.com.br"
+
+# O Gmail recomenda no máximo 50 chamadas por requisição batch
+BATCH_SIZE = 50
+
+# Status HTTP de falhas temporárias, reenviadas no lote seguinte
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+DIAS_SEMANA = [
+    "segunda-feira",
+    "terça-feira",
+    "quarta-feira",
+    "quinta-feira",
+    "sexta-feira",
+    "sábado",
+    "domingo",
+]
+
+
+# --- Agrupa convidados por evento ---
+def group_guests(events):
+    """
+    Convidados externos de cada evento, por id do evento: duas reuniões com o
+    mesmo título no mesmo dia continuam separadas. {id: {"event", "label",
+    "guests": [(email, nome)]}}
+    """
+    grouped = {}
+    for ev in events:
+        guests = [
+            att
+            for att in ev.get("attendees", [])
+            if not att["email"].endswith(INTERNAL_DOMAIN)  # Seu filtro de email
+        ]
+        if not guests:
+            continue
+        label = ev.get("summary", "(sem título)")
+        key = ev.get("id") or label
+        if key not in grouped:
+            grouped[key] = {"event": ev, "label": label, "guests": []}
+        for att in guests:
+            # Tenta pegar o displayName, se não, o email, e se não, usa o nome do email
+            name = att.get("displayName", att.get("email", att["email"].split("@")[0]))
+            grouped[key]["guests"].append((att["email"], name))
+    return grouped
+
+
+def first_name(email):
+    return email.split("@")[0].split(".")[0].capitalize()
+
+
+def greeting(emails):
+    """
+    Saudação com o primeiro nome de cada convidado (tirado do e-mail).
+    """
+    first_names = [first_name(email) for email in emails]
+    if not first_names:
+        return "Bom dia!"
+    if len(first_names) == 1:
+        return f"Bom dia, {first_names[0]}!"
+    return f"Bom dia, {', '.join(first_names[:-1])} e {first_names[-1]}!"
+
+
+def confirmation_time(event):
+    """
+    Horário do evento para a mensagem ("às 14h30"), ou a data para eventos
+    de dia inteiro.
+    """
+    start_info = event["start"]
+    # Verifica se é um evento de dia inteiro ('date') ou com horário específico ('dateTime')
+    if "dateTime" in start_info:
+        start_dt = datetime.datetime.fromisoformat(start_info["dateTime"].replace("Z", "+00:00"))
+        return f"às {start_dt.strftime('%Hh%M')}"
+    if "date" in start_info:
+        return f"no dia {datetime.date.fromisoformat(start_info['date']).strftime('%d/%m/%Y')}"
+    return ""
+
+
+def day_phrase(selected_date, today):
+    """
+    Como a mensagem se refere ao dia da reunião: "hoje", "amanhã", "nesta
+    quinta-feira", "na próxima segunda-feira" ou a data completa.
+    """
+    delta = (selected_date - today).days
+    if delta == 0:
+        return "hoje"
+    if delta == 1:
+        return "amanhã"
+    if 1 < delta < 7:
+        # Usa o nome do dia da semana; "nesta" se for na mesma semana, senão "na próxima"
+        dia_semana_nome = DIAS_SEMANA[selected_date.weekday()]
+        if today.isocalendar()[1] == selected_date.isocalendar()[1]:
+            return f"nesta {dia_semana_nome}"
+        return f"na próxima {dia_semana_nome}"
+    # Caso fora da próxima semana, usa data completa
+    return f"no dia {selected_date.strftime('%d/%m/%Y')}"
+
+
+def confirmation_body(emails, event, selected_date, today):
+    return (
+        f"{greeting(emails)}\nTudo bem?\n\n"
+        f"Gostaria de confirmar, tudo certo para nossa conversa "
+        f"{day_phrase(selected_date, today)} {confirmation_time(event)}?\n\n"
+        "Nos vemos em breve!"
+    )
+
+
+def build_raw(emails, subject, body, signature=""):
+    """
+    Mensagem codificada para `users().messages().send`; a assinatura já vem
+    com o separador "\\n\\n-- \\n".
+    """
+    mime = MIMEText(body + (signature or ""))
+    mime["to"] = ", ".join(emails)
+    mime["subject"] = subject
+    return base64.urlsafe_b64encode(mime.as_bytes()).decode()
+
+
+def build_confirmations(events_by_date, today, signature=""):
+    """
+    Uma confirmação por evento com convidados externos, para cada dia de
+    `events_by_date` ({data: eventos}), com todos os convidados externos.
+    """
+    confirmations = []
+    for date, events in sorted(events_by_date.items()):
+        for key, data in group_guests(events).items():
+            emails = [email for email, _ in data["guests"]]
+            label = data["label"]
+            confirmations.append({
+                "id": f"{date.isoformat()}:{key}",
+                "date": date,
+                "label": label,
+                "event": data["event"],
+                "emails": emails,
+                "names": [name for _, name in data["guests"]],
+                "subject": f"Confirmação: {label}",
+                "body": confirmation_body(emails, data["event"], date, today),
+                "signature": signature,
+            })
+    return confirmations
+
+
+def _status(exception):
+    return getattr(getattr(exception, "resp", None), "status", None)
+
+
+def send_batch(gmail_service, confirmations, batch_size=BATCH_SIZE, retries=2, backoff=1.0):
+    """
+    Envia as confirmações em requisições batch do Gmail e devolve o status
+    de cada uma ({id: {"ok", "message_id", "error"}}). Envios com falha
+    temporária (limite de taxa, erro do servidor) são repetidos em um novo
+    lote, após `backoff` segundos (dobrando a cada tentativa).
+    """
+    results = {}
+    pending = list(confirmations)
+    for attempt in range(retries + 1):
+        retry = []
+        for start in range(0, len(pending), batch_size):
+            chunk = {item["id"]: item for item in pending[start:start + batch_size]}
+
+            def callback(request_id, response, exception, chunk=chunk):
+                if exception is None:
+                    results[request_id] = {"ok": True, "message_id": response.get("id"), "error": None}
+                    return
+                results[request_id] = {"ok": False, "message_id": None, "error": str(exception)}
+                if _status(exception) in RETRY_STATUSES:
+                    retry.append(chunk[request_id])
+
+            batch = gmail_service.new_batch_http_request(callback=callback)
+            for request_id, item in chunk.items():
+                results.pop(request_id, None)  # resultado de uma tentativa anterior
+                raw = build_raw(item["emails"], item["subject"], item["body"], item.get("signature"))
+                batch.add(
+                    gmail_service.users().messages().send(userId="me", body={"raw": raw}),
+                    request_id=request_id,
+                )
+            try:
+                batch.execute()
+            except Exception as e:
+                # A requisição batch inteira falhou; sem status HTTP (ex.: conexão
+                # caiu) não dá para saber se algo foi enviado, então não repete
+                for request_id, item in chunk.items():
+                    if request_id in results:
+                        continue
+                    results[request_id] = {"ok": False, "message_id": None, "error": str(e)}
+                    if _status(e) in RETRY_STATUSES:
+                        retry.append(item)
+        if not retry or attempt == retries:
+            break
+        time.sleep(backoff * 2 ** attempt)
+        pending = retry
+    return results
@@ -1,14 +1,21 @@
 import streamlit as st
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
 from googleapiclient.errors import HttpError
-from email.mime.text import MIMEText
-import base64
 import datetime
 from bs4 import BeautifulSoup
 from google.auth.exceptions import RefreshError
 
+from calendar_cache import CalendarCache
+from confirmacao import (
+    build_confirmations,
+    build_raw,
+    confirmation_body,
+    confirmation_time,
+    group_guests,
+    send_batch,
+)
+from google_clients import cached, clients_for, expires_soon, refresh_if_expiring, user_email
+
 # --- Escopos Google ---
 SCOPES = [
     "openid",
@@ -65,14 +72,11 @@ def login():
     # Verifica se já temos credenciais e se elas ainda são válidas
     if creds:
         try:
-            # Se as credenciais estiverem expiradas mas tiverem um refresh_token, tente atualizá-las
-            if (
-                creds.expired
-                and hasattr(creds, "refresh_token")
-                and creds.refresh_token
-            ):
+            # Se as credenciais estiverem para expirar (ou já expiradas) e tiverem um
+            # refresh_token, atualiza antes, para nenhuma chamada da página falhar no meio
+            if expires_soon(creds) and getattr(creds, "refresh_token", None):
                 try:
-                    creds.refresh(Request())
+                    refresh_if_expiring(creds)
                     st.session_state.creds = creds
                     return creds
                 except Exception as e:
@@ -115,6 +119,8 @@ def login():
 
             # Armazena as novas credenciais
             st.session_state.creds = new_creds
+            # A agenda em cache pode ser de outra conta
+            st.session_state.pop("calendar_cache", None)
 
             # Limpa o código de autorização da URL para evitar problemas em refreshes
             try:
@@ -167,15 +173,17 @@ def login():
         st.stop()
 
 
-def get_user_signature(gmail_service):
+def get_user_signature(gmail_service, user_email=None):
     """
     Busca a assinatura do Gmail do usuário logado e a converte para texto simples.
-    A assinatura é prefixada com o separador padrão "-- \n".
+    A assinatura é prefixada com o separador padrão "-- \n". Com `user_email`
+    (já conhecido pelo login), não consulta o perfil.
     """
     try:
         # Tenta obter a configuração "sendAs" para o e-mail primário do usuário
-        user_profile = gmail_service.users().getProfile(userId="me").execute()
-        user_email = user_profile.get("emailAddress")
+        if not user_email:
+            user_profile = gmail_service.users().getProfile(userId="me").execute()
+            user_email = user_profile.get("emailAddress")
 
         if not user_email:
             st.warning(
@@ -263,8 +271,10 @@ creds = login()  # login() agora sempre retorna creds ou para a execução
 
 if creds:
     try:
-        cal_service = build("calendar", "v3", credentials=creds)
-        gmail_service = build("gmail", "v1", credentials=creds)
+        # Clientes criados uma vez por credencial e reaproveitados nos reruns
+        google_clients = clients_for(creds)
+        cal_service = google_clients.calendar
+        gmail_service = google_clients.gmail
         st.success("Conectado aos serviços Google!")  # Feedback opcional
     except Exception as e:
         st.error(f"Erro ao construir serviços Google: {e}")
@@ -279,73 +289,42 @@ if "creds" not in st.session_state or not st.session_state.creds.valid:
     st.warning("Por favor, faça login para continuar.")
     st.stop()
 
-# Construa o gmail_service se ainda não o fez ou se ele não estiver na session_state
-# Esta lógica pode já existir na sua seção de "Serviços autenticados"
-if "gmail_service" not in st.session_state:
-    try:
-        st.session_state.gmail_service = build(
-            "gmail", "v1", credentials=st.session_state.creds
-        )
-    except Exception as e:
-        st.error(f"Erro ao construir o serviço Gmail: {e}")
-        st.stop()
-
-gmail_service_instance = st.session_state.gmail_service
+gmail_service_instance = gmail_service
 
 
 # --- Busca eventos num dia ---
-def fetch_events_for_date(date):
-    # ... (seu código existente)
-    if isinstance(date, datetime.date):
-        date = datetime.datetime.combine(date, datetime.time.min)
+# Eventos de algumas semanas ficam em memória na sessão; os reruns leem daqui e
+# a API só é consultada pelas mudanças (syncToken)
+if "calendar_cache" not in st.session_state:
+    st.session_state.calendar_cache = CalendarCache(weeks=4)
+calendar_cache = st.session_state.calendar_cache
 
-    start = date.replace(hour=0, minute=0, second=0, microsecond=0).isoformat() + "Z"
-    end = (date + datetime.timedelta(days=1)).replace(
-        hour=0, minute=0, second=0, microsecond=0
-    ).isoformat() + "Z"
 
+def fetch_events_for_date(date):
     try:
-        events = (
-            cal_service.events()
-            .list(
-                calendarId="primary",
-                timeMin=start,
-                timeMax=end,
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
-            .get("items", [])
-        )
-        return events
+        return calendar_cache.events_for_date(cal_service, date)
     except HttpError as error:
         st.error(f"Erro ao buscar eventos: {error}")
         return []
 
 
-# --- Agrupa convidados por evento ---
-def group_guests(events):
-    # ... (seu código existente)
-    grouped = {}
-    for ev in events:
-        guests = [
-            att
-            for att in ev.get("attendees", [])
-            if not att["email"].endswith("@polijunior.com.br")  # Seu filtro de email
-        ]
-        if not guests:
-            continue
-        label = ev["summary"]
-        if label not in grouped:
-            grouped[label] = {"event": ev, "guests": []}
-        for att in guests:
-            # Tenta pegar o displayName, se não, o email, e se não, usa o nome do email
-            name = att.get("displayName", att.get("email", att["email"].split("@")[0]))
-            grouped[label]["guests"].append((att["email"], name))
-    return grouped
+# --- Interface ---
+def show_signature(user_signature_text):
+    # Mostra ao usuário qual assinatura será adicionada (apenas para visualização)
+    if user_signature_text:
+        st.markdown("---")
+        st.markdown("**Assinatura que será adicionada:**")
+        # st.text exibe o texto literalmente, preservando espaços e quebras de linha
+        st.text(
+            user_signature_text.strip()
+        )  # .strip() para remover quebras de linha iniciais do f-string
+        st.markdown("---")
+    else:
+        st.caption(
+            "Nenhuma assinatura automática será adicionada (não configurada ou não encontrada)."
+        )
 
 
-# --- Interface ---
 st.title("🔔 Confirmação de Reuniões")
 
 # escolha da data
@@ -357,6 +336,94 @@ elif mode == "Amanhã":
 else:
     sel_date = st.date_input("Escolha a data", datetime.date.today())
 
+envio = st.radio("Envio:", ["Um evento", "Em lote"], horizontal=True)
+
+# Data atual (sem hora)
+hoje = datetime.datetime.now().date()
+data_selecionada = (
+    sel_date.date() if isinstance(sel_date, datetime.datetime) else sel_date
+)
+
+# Buscar a assinatura do usuário e armazenar no cache da sessão; entre sessões
+# do mesmo usuário ela fica guardada por uma hora
+if "user_signature" not in st.session_state:
+    login_email = user_email(creds)
+    if login_email:
+        st.session_state.user_signature = cached(
+            ("signature", login_email),
+            3600,
+            lambda: get_user_signature(gmail_service_instance, login_email),
+        )
+    else:
+        st.session_state.user_signature = get_user_signature(gmail_service_instance)
+user_signature_text = st.session_state.user_signature
+
+# --- Envio em lote: todos os eventos do dia ou da semana ---
+if envio == "Em lote":
+    periodo = st.radio("Período:", ["Dia selecionado", "Semana"], horizontal=True)
+    dias = 1 if periodo == "Dia selecionado" else 7
+    eventos_por_dia = {
+        dia: fetch_events_for_date(dia)
+        for dia in (data_selecionada + datetime.timedelta(days=i) for i in range(dias))
+    }
+    confirmacoes = build_confirmations(eventos_por_dia, hoje, user_signature_text)
+
+    if not confirmacoes:
+        st.warning("Não há eventos no período selecionado com convidados externos.")
+        st.stop()
+
+    # Confirmações já enviadas nesta sessão não entram de novo no lote
+    enviados = st.session_state.setdefault("lote_enviados", set())
+
+    st.caption(f"{len(confirmacoes)} eventos com convidados externos. Revise as mensagens antes de enviar.")
+    selecionadas = []
+    for item in confirmacoes:
+        titulo = (
+            f"{item['date'].strftime('%d/%m')} {confirmation_time(item['event'])} · "
+            f"{item['label']} · {', '.join(item['names'])}"
+        )
+        if item["id"] in enviados:
+            titulo = f"✅ {titulo}"
+        with st.expander(titulo):
+            incluir = st.checkbox(
+                "Incluir no envio", value=item["id"] not in enviados, key=f"lote_incluir_{item['id']}"
+            )
+            st.text(f"Para: {', '.join(item['emails'])}")
+            item["body"] = st.text_area(
+                "Mensagem:", item["body"], height=180, key=f"lote_mensagem_{item['id']}"
+            )
+        if incluir and item["id"] not in enviados and item["body"].strip():
+            selecionadas.append(item)
+
+    show_signature(user_signature_text)
+
+    if st.button(f"Enviar {len(selecionadas)} confirmações", disabled=not selecionadas):
+        with st.spinner("Enviando..."):
+            resultados = send_batch(gmail_service_instance, selecionadas)
+        enviados.update(id for id, resultado in resultados.items() if resultado["ok"])
+
+        total_ok = sum(resultado["ok"] for resultado in resultados.values())
+        if total_ok == len(selecionadas):
+            st.success(f"{total_ok} e-mails enviados com sucesso!")
+        else:
+            st.warning(f"{total_ok} de {len(selecionadas)} e-mails enviados.")
+        st.dataframe(
+            [
+                {
+                    "Data": item["date"].strftime("%d/%m/%Y"),
+                    "Evento": item["label"],
+                    "Para": ", ".join(item["emails"]),
+                    "Status": "Enviado"
+                    if resultados[item["id"]]["ok"]
+                    else f"Erro: {resultados[item['id']]['error']}",
+                }
+                for item in selecionadas
+            ],
+            use_container_width=True,
+        )
+    st.stop()
+
+# --- Envio de um evento ---
 events = fetch_events_for_date(sel_date)
 grouped = group_guests(events)
 
@@ -367,12 +434,18 @@ if not grouped:
     st.stop()
 
 # seleção de evento
-event_label = st.selectbox("Evento:", list(grouped.keys()))
-if not event_label:  # Caso não haja eventos após o filtro
+# Por id: eventos com o mesmo título aparecem separados, com o horário
+event_key = st.selectbox(
+    "Evento:",
+    list(grouped.keys()),
+    format_func=lambda key: f"{grouped[key]['label']} ({confirmation_time(grouped[key]['event'])})",
+)
+if not event_key:  # Caso não haja eventos após o filtro
     st.warning("Nenhum evento selecionável.")
     st.stop()
 
-data = grouped[event_label]
+data = grouped[event_key]
+event_label = data["label"]
 ev = data["event"]
 guest_list = data["guests"]
 
@@ -384,114 +457,16 @@ if not chosen:
     st.info("Selecione ao menos um convidado.")
     st.stop()
 
-# prepara saudação
 selected = [g for g in guest_list if g[1] in chosen]
 emails = [g[0] for g in selected]
-names_sel = [g[1] for g in selected]
-
-# Lógica de saudação aprimorada
-if len(names_sel) == 1:
-    first_name = emails[0].split("@")[0].split(".")[0].capitalize()
-    greet = f"Bom dia, {first_name}!"
-elif len(names_sel) == 2:
-    first_names = [email.split("@")[0].split(".")[0].capitalize() for email in emails]
-    greet = f"Bom dia, {first_names[0]} e {first_names[1]}!"
-elif len(names_sel) > 2:
-    first_names = [email.split("@")[0].split(".")[0].capitalize() for email in emails]
-    greet = f"Bom dia, {', '.join(first_names[:-1])} e {first_names[-1]}!"
-else:  # Caso names_sel esteja vazio por algum motivo (não deveria acontecer se 'chosen' não estiver vazio)
-    greet = "Bom dia!"
-
-
-# formata horário
-start_info = ev["start"]
-# Verifica se é um evento de dia inteiro ('date') ou com horário específico ('dateTime')
-if "dateTime" in start_info:
-    start_dt_str = start_info.get("dateTime")
-    time_h = datetime.datetime.fromisoformat(
-        start_dt_str.replace("Z", "+00:00")
-    ).strftime(
-        "%Hh%M"
-    )  # Adiciona minutos e trata fuso horário
-    horario_confirmacao = f"às {time_h}"
-elif "date" in start_info:
-    start_dt_str = start_info.get("date")
-    time_h = datetime.datetime.fromisoformat(start_dt_str).strftime(
-        "%d/%m/%Y"
-    )  # Formata a data
-    horario_confirmacao = f"no dia {time_h}"
-else:
-    time_h = "(horário não especificado)"  # Fallback
-    horario_confirmacao = ""
-
-# Buscar a assinatura do usuário e armazenar no cache da sessão
-if "user_signature" not in st.session_state:
-    st.session_state.user_signature = get_user_signature(gmail_service_instance)
-user_signature_text = st.session_state.user_signature
-
-# Data atual (sem hora)
-hoje = datetime.datetime.now().date()
-data_selecionada = (
-    sel_date.date() if isinstance(sel_date, datetime.datetime) else sel_date
-)
 
-# Define a string do dia para a mensagem
-dias_semana = [
-    "segunda-feira",
-    "terça-feira",
-    "quarta-feira",
-    "quinta-feira",
-    "sexta-feira",
-    "sábado",
-    "domingo",
-]
-
-# Forçar recálculo do delta toda vez que a página é atualizada
-delta = (data_selecionada - hoje).days
-
-if delta == 0:
-    dia_mensagem = "hoje"
-elif delta == 1:
-    dia_mensagem = "amanhã"
-elif delta > 1 and delta < 7:
-    # Verificar se é na mesma semana para decidir entre "nesta" ou "na próxima"
-    hoje_semana = hoje.isocalendar()[1]  # Número da semana do ano
-    sel_semana = data_selecionada.isocalendar()[1]
-
-    # Usa o nome do dia da semana
-    dia_semana_nome = dias_semana[data_selecionada.weekday()]
-
-    # Se for na mesma semana, usa "nesta", caso contrário "na próxima"
-    if hoje_semana == sel_semana:
-        dia_mensagem = f"nesta {dia_semana_nome}"
-    else:
-        dia_mensagem = f"na próxima {dia_semana_nome}"
-else:
-    # Caso fora da próxima semana, usa data completa
-    dia_mensagem = f"no dia {data_selecionada.strftime('%d/%m/%Y')}"
-
-# Construir o corpo da mensagem com a data correta
-default_body_text = (
-    f"{greet}\nTudo bem?\n\n"
-    f"Gostaria de confirmar, tudo certo para nossa conversa {dia_mensagem} {horario_confirmacao}?\n\n"
-    "Nos vemos em breve!"
-)
+# Construir o corpo da mensagem com a saudação, o dia e o horário corretos
+# (recalculados toda vez que a página é atualizada)
+default_body_text = confirmation_body(emails, ev, data_selecionada, hoje)
 
 msg_body_edited_by_user = st.text_area("Mensagem:", default_body_text, height=200)
 
-# Opcional: Mostrar ao usuário qual assinatura será adicionada (apenas para visualização)
-if user_signature_text:
-    st.markdown("---")
-    st.markdown("**Assinatura que será adicionada:**")
-    # st.text exibe o texto literalmente, preservando espaços e quebras de linha
-    st.text(
-        user_signature_text.strip()
-    )  # .strip() para remover quebras de linha iniciais do f-string
-    st.markdown("---")
-else:
-    st.caption(
-        "Nenhuma assinatura automática será adicionada (não configurada ou não encontrada)."
-    )
+show_signature(user_signature_text)
 
 
 if st.button("Enviar"):
@@ -499,20 +474,13 @@ if st.button("Enviar"):
         st.warning("A mensagem não pode estar vazia.")
     else:
         # Corpo do e-mail final é o que o usuário digitou + a assinatura
-        final_email_content = msg_body_edited_by_user
-        if user_signature_text:
-            final_email_content += (
-                user_signature_text  # A assinatura já vem com \n\n-- \n
-            )
-
-        mime = MIMEText(final_email_content)
-        mime["to"] = ", ".join(emails)  # 'emails' deve estar definido
-        mime["subject"] = (
-            f"Confirmação: {event_label}"  # 'event_label' deve estar definido
+        raw = build_raw(
+            emails,  # 'emails' deve estar definido
+            f"Confirmação: {event_label}",  # 'event_label' deve estar definido
+            msg_body_edited_by_user,
+            user_signature_text,  # A assinatura já vem com \n\n-- \n
         )
 
-        raw = base64.urlsafe_b64encode(mime.as_bytes()).decode()
-
         try:
             gmail_service_instance.users().messages().send(
                 userId="me", body={"raw": raw}
@@ -0,0 +1,243 @@
+"""
+Substitutos locais dos serviços Google usados por `email_deploy.py`, com
+latência por requisição HTTP (e de abertura da conexão) configurável. Expõem as mesmas chamadas
+(`users().messages().send`, `getProfile`, `settings().sendAs()`,
+`new_batch_http_request`, `events().list` com paginação e syncToken), para
+exercitar o envio em lote e o cache da agenda sem rede nem conta Google;
+`round_trips` conta as requisições HTTP feitas.
+"""
+import base64
+import datetime
+import itertools
+import threading
+import time
+from email import message_from_bytes
+
+from calendar_cache import overlaps, start_key
+
+
+class FakeResponse(dict):
+    def __init__(self, status):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = "Fake"
+
+
+class FakeHttpError(Exception):
+    """
+    Mesmo formato do `googleapiclient.errors.HttpError` (`resp.status`).
+    """
+
+    def __init__(self, status, message=""):
+        super().__init__(f"<HttpError {status}: {message}>")
+        self.resp = FakeResponse(status)
+
+
+class FakeRequest:
+    def __init__(self, service, method, kwargs):
+        self.service = service
+        self.method = method
+        self.kwargs = kwargs
+
+    def execute(self):
+        self.service._round_trip()
+        return self.service._call(self.method, self.kwargs)
+
+
+class FakeBatch:
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id or str(len(self.requests)), request, callback or self.callback))
+
+    def execute(self):
+        if len(self.requests) > self.service.max_batch:
+            raise FakeHttpError(400, f"batch com mais de {self.service.max_batch} requisições")
+        self.service._round_trip()
+        self.service.batches += 1
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = self.service._call(request.method, request.kwargs), None
+            except FakeHttpError as e:
+                response, exception = None, e
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+class _FakeService:
+    """
+    A primeira requisição de cada instância paga também `connect_latency`,
+    como a conexão TLS de um cliente novo.
+    """
+
+    def __init__(self, latency=0.0, connect_latency=0.0):
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+            delay = self.latency + (self.connect_latency if self.round_trips == 1 else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FakeGmailService(_FakeService):
+    """
+    Gmail falso: guarda as mensagens enviadas em `sent`. Envios para
+    endereços de `failing` falham com 400; os primeiros `rate_limited`
+    envios falham com 429, como ao estourar a cota.
+    """
+
+    def __init__(self, email="hunter@polijunior.com.br", signature="<div>Hunter<br>Poli Júnior</div>",
+                 latency=0.0, connect_latency=0.0, failing=(), rate_limited=0, max_batch=100):
+        super().__init__(latency, connect_latency)
+        self.email = email
+        self.signature = signature
+        self.failing = set(failing)
+        self.rate_limited = rate_limited
+        self.max_batch = max_batch
+        self.sent = []
+        self.batches = 0
+        self._ids = itertools.count(1)
+
+    def _call(self, method, kwargs):
+        if method == "send":
+            raw = kwargs["body"]["raw"]
+            with self._lock:
+                if self.rate_limited > 0:
+                    self.rate_limited -= 1
+                    raise FakeHttpError(429, "Rate Limit Exceeded")
+                if any(address in raw_recipients(raw) for address in self.failing):
+                    raise FakeHttpError(400, "Invalid To header")
+                message_id = f"fake-{next(self._ids)}"
+                self.sent.append({"id": message_id, "raw": raw})
+            return {"id": message_id, "threadId": message_id, "labelIds": ["SENT"]}
+        if method == "getProfile":
+            return {"emailAddress": self.email}
+        if method == "sendAs.get":
+            if kwargs["sendAsEmail"] != self.email:
+                raise FakeHttpError(404, "Not Found")
+            return {"sendAsEmail": self.email, "isPrimary": True, "signature": self.signature}
+        if method == "sendAs.list":
+            return {"sendAs": [{"sendAsEmail": self.email, "isPrimary": True, "signature": self.signature}]}
+        raise NotImplementedError(method)
+
+    # Mesma cadeia de recursos do cliente da API
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def settings(self):
+        return _SendAsSettings(self)
+
+    def send(self, userId, body):
+        return FakeRequest(self, "send", {"userId": userId, "body": body})
+
+    def getProfile(self, userId):
+        return FakeRequest(self, "getProfile", {"userId": userId})
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+
+class _SendAsSettings:
+    def __init__(self, service):
+        self.service = service
+
+    def sendAs(self):
+        return self
+
+    def get(self, userId, sendAsEmail):
+        return FakeRequest(self.service, "sendAs.get", {"userId": userId, "sendAsEmail": sendAsEmail})
+
+    def list(self, userId):
+        return FakeRequest(self.service, "sendAs.list", {"userId": userId})
+
+
+class FakeCalendarService(_FakeService):
+    """
+    Agenda falsa: `events().list` com paginação de `page_size` eventos,
+    `nextSyncToken` na última página e, com `syncToken`, só os eventos
+    alterados desde ele (cancelados com `status: cancelled`). `put_event`
+    e `cancel_event` simulam mudanças; `expire_tokens` faz os tokens
+    antigos responderem 410.
+    """
+
+    def __init__(self, events=(), latency=0.0, connect_latency=0.0, page_size=250):
+        super().__init__(latency, connect_latency)
+        self.page_size = page_size
+        self._version = 0
+        self._oldest_token = 0
+        self._events = {}  # id -> (versão da última mudança, evento)
+        for event in events:
+            self.put_event(event)
+
+    def put_event(self, event):
+        with self._lock:
+            self._version += 1
+            self._events[event["id"]] = (self._version, dict(event, status="confirmed"))
+
+    def cancel_event(self, event_id):
+        with self._lock:
+            self._version += 1
+            self._events[event_id] = (self._version, {"id": event_id, "status": "cancelled"})
+
+    def expire_tokens(self):
+        # Os tokens já entregues deixam de valer; os próximos, não
+        with self._lock:
+            self._version += 1
+            self._oldest_token = self._version
+
+    def events(self):
+        return self
+
+    def list(self, **kwargs):
+        return FakeRequest(self, "events.list", kwargs)
+
+    def _call(self, method, kwargs):
+        if method != "events.list":
+            raise NotImplementedError(method)
+        with self._lock:
+            token = kwargs.get("syncToken")
+            if token is not None:
+                if any(kwargs.get(name) for name in ("timeMin", "timeMax", "orderBy")):
+                    raise FakeHttpError(400, "syncToken com timeMin/timeMax/orderBy")
+                if int(token) < self._oldest_token:
+                    raise FakeHttpError(410, "Sync token is no longer valid")
+                items = [event for version, event in self._events.values() if version > int(token)]
+            else:
+                start = _parse(kwargs.get("timeMin"))
+                end = _parse(kwargs.get("timeMax"))
+                items = [
+                    event for _, event in self._events.values()
+                    if event["status"] != "cancelled" and overlaps(event, start, end)
+                ]
+                if kwargs.get("orderBy") == "startTime":
+                    items.sort(key=start_key)
+            size = min(kwargs.get("maxResults") or 250, self.page_size)
+            offset = int(kwargs.get("pageToken") or 0)
+            response = {"items": items[offset:offset + size]}
+            if offset + size < len(items):
+                response["nextPageToken"] = str(offset + size)
+            else:
+                response["nextSyncToken"] = str(self._version)
+            return response
+
+
+def _parse(value):
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def raw_recipients(raw):
+    """
+    Destinatários (cabeçalho "To") de uma mensagem codificada.
+    """
+    return message_from_bytes(base64.urlsafe_b64decode(raw)).get("to", "")
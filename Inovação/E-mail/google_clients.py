@@ -0,0 +1,144 @@
+"""
+Clientes das APIs Google reaproveitados entre reruns do Streamlit.
+
+O Streamlit executa `email_deploy.py` de novo a cada interação, mas os
+módulos importados continuam carregados: os clientes ficam aqui, um conjunto
+por credencial, e cada rerun só os recupera:
+
+    clients = clients_for(creds)
+    clients.calendar.events().list(...)
+
+Os clientes são montados com os documentos de discovery que acompanham o
+`google-api-python-client` (sem buscá-los na rede) e cada um mantém sua
+conexão HTTP aberta entre as chamadas. `refresh_if_expiring` renova o token
+alguns minutos antes de ele expirar, em vez de esperar `creds.expired`.
+"""
+import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import google_auth_httplib2
+import httplib2
+import requests
+from google.auth import jwt
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build
+
+# Renova o token quando faltar menos que isso para expirar
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+HTTP_TIMEOUT = 30
+
+# Conexões reaproveitadas nas renovações de token
+_token_session = requests.Session()
+
+_lock = threading.Lock()
+_clients = OrderedDict()  # chave da credencial -> GoogleClients
+_values = {}  # chave -> (expira em, valor), ver `cached`
+
+
+def token_request():
+    return Request(session=_token_session)
+
+
+def expires_soon(creds, margin=REFRESH_MARGIN):
+    expiry = getattr(creds, "expiry", None)
+    if expiry is None:
+        return False
+    # `creds.expiry` é um datetime UTC sem fuso
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return expiry - now <= margin
+
+
+def refresh_if_expiring(creds, margin=REFRESH_MARGIN):
+    """
+    Renova o token se ele expira em menos de `margin`; devolve se renovou.
+    """
+    if not getattr(creds, "refresh_token", None) or not expires_soon(creds, margin):
+        return False
+    creds.refresh(token_request())
+    return True
+
+
+def credential_key(creds):
+    secret = getattr(creds, "refresh_token", None) or getattr(creds, "token", None) or str(id(creds))
+    return hashlib.sha256(secret.encode()).hexdigest()[:16]
+
+
+def user_email(creds):
+    """
+    E-mail da conta, lido do id_token do login (escopos openid e email),
+    sem chamada à API; None se não houver.
+    """
+    id_token = getattr(creds, "id_token", None)
+    if not id_token:
+        return None
+    try:
+        return jwt.decode(id_token, verify=False).get("email")
+    except ValueError:
+        return None
+
+
+class GoogleClients:
+    def __init__(self, creds, timeout=HTTP_TIMEOUT):
+        self.creds = creds
+        self.timeout = timeout
+        self.builds = 0
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def service(self, name, version):
+        with self._lock:
+            service = self._services.get((name, version))
+            if service is None:
+                # Um httplib2.Http por cliente: não é seguro compartilhá-lo entre threads
+                http = google_auth_httplib2.AuthorizedHttp(
+                    self.creds, http=httplib2.Http(timeout=self.timeout)
+                )
+                service = build(name, version, http=http, static_discovery=True, cache_discovery=False)
+                self._services[(name, version)] = service
+                self.builds += 1
+            return service
+
+    @property
+    def calendar(self):
+        return self.service("calendar", "v3")
+
+    @property
+    def gmail(self):
+        return self.service("gmail", "v1")
+
+
+def clients_for(creds, max_entries=64):
+    """
+    Os clientes da credencial, criados na primeira vez; guarda os das
+    `max_entries` credenciais usadas mais recentemente.
+    """
+    key = credential_key(creds)
+    with _lock:
+        clients = _clients.get(key)
+        if clients is None or clients.creds is not creds:
+            clients = _clients[key] = GoogleClients(creds)
+        _clients.move_to_end(key)
+        while len(_clients) > max_entries:
+            _clients.popitem(last=False)
+        return clients
+
+
+def cached(key, ttl, function):
+    """
+    O valor de `function()`, guardado por `ttl` segundos entre reruns e
+    sessões. Valores vazios (ex.: falha ao buscar) não são guardados.
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _values.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+    value = function()
+    if value:
+        with _lock:
+            _values[key] = (now + ttl, value)
+    return value
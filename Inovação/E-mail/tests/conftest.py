@@ -0,0 +1,8 @@
+"""
+Tests run from the app directory (`cd E-mail && python -m pytest`), so the
+app modules import as in `email_deploy.py`.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
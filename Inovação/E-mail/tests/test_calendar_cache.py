@@ -0,0 +1,87 @@
+import datetime
+
+from calendar_cache import CalendarCache
+from fakes import FakeCalendarService
+
+TODAY = datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def event(id, days, hour, summary="Reunião"):
+    start = datetime.datetime.combine(TODAY + datetime.timedelta(days=days), datetime.time(hour),
+                                      tzinfo=datetime.timezone.utc)
+    return {
+        "id": id,
+        "summary": summary,
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": (start + datetime.timedelta(hours=1)).isoformat()},
+    }
+
+
+def ids(events):
+    return [event["id"] for event in events]
+
+
+def test_full_sync_follows_pages_and_serves_days_from_memory():
+    service = FakeCalendarService([event(f"e{i}", i % 5, 8 + i // 5) for i in range(30)], page_size=7)
+    cache = CalendarCache(weeks=1, min_sync_interval=3600)
+
+    tomorrow = cache.events_for_date(service, TODAY + datetime.timedelta(days=1))
+    assert ids(tomorrow) == ["e1", "e6", "e11", "e16", "e21", "e26"]
+    assert service.round_trips == 5  # 30 eventos em páginas de 7
+    assert cache.stats()["events"] == 30
+
+    cache.events_for_date(service, TODAY)
+    cache.events_for_date(service, TODAY + datetime.timedelta(days=3))
+    assert service.round_trips == 5
+    assert cache.full_syncs == 1
+
+
+def test_incremental_sync_applies_changes_and_cancellations():
+    service = FakeCalendarService([event("a", 1, 10), event("b", 1, 9), event("c", 2, 9)])
+    cache = CalendarCache(weeks=1, min_sync_interval=3600)
+    day = TODAY + datetime.timedelta(days=1)
+    assert ids(cache.events_for_date(service, day)) == ["b", "a"]
+
+    service.put_event(event("a", 1, 8, "Remarcada"))
+    service.put_event(event("d", 1, 11))
+    service.cancel_event("b")
+    service.put_event(event("c", 60, 9))  # movido para fora da janela
+    # Dentro do intervalo mínimo, nada muda
+    assert ids(cache.events_for_date(service, day)) == ["b", "a"]
+
+    cache.sync(service, force=True)
+    events = cache.events_for_date(service, day)
+    assert ids(events) == ["a", "d"]
+    assert events[0]["summary"] == "Remarcada"
+    assert cache.events_for_date(service, TODAY + datetime.timedelta(days=2)) == []
+    assert cache.stats()["events"] == 2
+    assert (cache.full_syncs, cache.incremental_syncs) == (1, 1)
+
+
+def test_expired_sync_token_reloads_the_window():
+    service = FakeCalendarService([event("a", 1, 10)])
+    cache = CalendarCache(weeks=1, min_sync_interval=3600)
+    cache.sync(service)
+
+    service.put_event(event("b", 1, 9))
+    service.expire_tokens()
+    cache.sync(service, force=True)
+    assert ids(cache.events_for_date(service, TODAY + datetime.timedelta(days=1))) == ["b", "a"]
+    assert (cache.full_syncs, cache.incremental_syncs) == (2, 0)
+
+    # O token novo volta a valer para a sincronização incremental
+    cache.sync(service, force=True)
+    assert (cache.full_syncs, cache.incremental_syncs) == (2, 1)
+
+
+def test_dates_outside_the_window_are_fetched_and_cached():
+    service = FakeCalendarService([event("perto", 1, 10), event("longe", 40, 14), event("cedo", 40, 9)])
+    cache = CalendarCache(weeks=1, min_sync_interval=3600)
+    cache.sync(service)
+    assert cache.stats()["events"] == 1
+
+    far = TODAY + datetime.timedelta(days=40)
+    assert ids(cache.events_for_date(service, far)) == ["cedo", "longe"]
+    round_trips = service.round_trips
+    assert ids(cache.events_for_date(service, far)) == ["cedo", "longe"]
+    assert service.round_trips == round_trips
@@ -0,0 +1,92 @@
+import datetime
+
+from confirmacao import build_confirmations, group_guests, send_batch
+from fakes import FakeGmailService, raw_recipients
+
+TODAY = datetime.date(2025, 6, 16)
+
+
+def event(id, summary, hour, *emails):
+    start = datetime.datetime(2025, 6, 17, hour, tzinfo=datetime.timezone.utc)
+    return {
+        "id": id,
+        "summary": summary,
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": (start + datetime.timedelta(hours=1)).isoformat()},
+        "attendees": [{"email": "hunter@polijunior.com.br"}] + [{"email": email} for email in emails],
+    }
+
+
+def test_group_guests_keeps_events_with_the_same_title_apart():
+    grouped = group_guests([
+        event("a", "Reunião de diagnóstico", 10, "ana@cliente.com"),
+        event("b", "Reunião de diagnóstico", 15, "bruno@outra.com"),
+        event("c", "Interna", 11),
+    ])
+    assert list(grouped) == ["a", "b"]
+    assert grouped["a"]["label"] == grouped["b"]["label"] == "Reunião de diagnóstico"
+    assert grouped["a"]["guests"] == [("ana@cliente.com", "ana@cliente.com")]
+    assert grouped["b"]["guests"] == [("bruno@outra.com", "bruno@outra.com")]
+
+
+def test_build_confirmations_one_per_event_id():
+    date = datetime.date(2025, 6, 17)
+    confirmations = build_confirmations({date: [
+        event("a", "Reunião de diagnóstico", 10, "ana@cliente.com"),
+        event("b", "Reunião de diagnóstico", 15, "bruno@outra.com", "carla@outra.com"),
+    ]}, TODAY)
+
+    assert [item["id"] for item in confirmations] == ["2025-06-17:a", "2025-06-17:b"]
+    first, second = confirmations
+    assert first["emails"] == ["ana@cliente.com"]
+    assert second["emails"] == ["bruno@outra.com", "carla@outra.com"]
+    assert first["subject"] == second["subject"] == "Confirmação: Reunião de diagnóstico"
+    assert "amanhã às 10h00" in first["body"]
+    assert "amanhã às 15h00" in second["body"]
+    assert second["body"].startswith("Bom dia, Bruno e Carla!")
+
+
+def confirmations(count, domain="cliente.com"):
+    return [
+        {"id": f"c{i}", "emails": [f"pessoa{i}@{domain}"], "subject": "Confirmação", "body": "Olá!"}
+        for i in range(count)
+    ]
+
+
+def test_send_batch_groups_messages_per_request():
+    gmail = FakeGmailService()
+    results = send_batch(gmail, confirmations(7), batch_size=3)
+
+    assert gmail.round_trips == gmail.batches == 3
+    assert len(gmail.sent) == 7
+    assert all(result["ok"] for result in results.values())
+    assert {result["message_id"] for result in results.values()} == {item["id"] for item in gmail.sent}
+    assert raw_recipients(gmail.sent[0]["raw"]) == "pessoa0@cliente.com"
+
+
+def test_send_batch_reports_each_failure_without_retrying_it():
+    gmail = FakeGmailService(failing={"pessoa1@cliente.com"})
+    results = send_batch(gmail, confirmations(3), backoff=0)
+
+    assert gmail.batches == 1
+    assert [results[f"c{i}"]["ok"] for i in range(3)] == [True, False, True]
+    assert "400" in results["c1"]["error"]
+    assert results["c1"]["message_id"] is None
+
+
+def test_send_batch_retries_rate_limited_messages():
+    gmail = FakeGmailService(rate_limited=2)
+    results = send_batch(gmail, confirmations(4), backoff=0)
+
+    assert gmail.batches == 2  # os dois recusados com 429 vão num lote novo
+    assert len(gmail.sent) == 4
+    assert all(result["ok"] and result["error"] is None for result in results.values())
+
+
+def test_send_batch_gives_up_after_the_last_retry():
+    gmail = FakeGmailService(rate_limited=10)
+    results = send_batch(gmail, confirmations(2), retries=2, backoff=0)
+
+    assert gmail.batches == 3
+    assert gmail.sent == []
+    assert all("429" in result["error"] for result in results.values())
@@ -0,0 +1,92 @@
+import datetime
+
+import pytest
+
+import google_clients
+from google_clients import cached, clients_for, credential_key, expires_soon, refresh_if_expiring
+
+
+class FakeCreds:
+    def __init__(self, refresh_token="r1", minutes=60):
+        self.token = "t"
+        self.refresh_token = refresh_token
+        self.expiry = None if minutes is None else self.utcnow() + datetime.timedelta(minutes=minutes)
+        self.refreshes = 0
+
+    @staticmethod
+    def utcnow():
+        return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.expiry = self.utcnow() + datetime.timedelta(hours=1)
+
+
+@pytest.fixture(autouse=True)
+def fresh_module(monkeypatch):
+    # Os clientes ficam no módulo entre reruns; cada teste começa do zero
+    monkeypatch.setattr(google_clients, "_clients", google_clients.OrderedDict())
+    monkeypatch.setattr(google_clients, "_values", {})
+    built = []
+    monkeypatch.setattr(google_clients, "build", lambda name, version, **kwargs: built.append(name) or object())
+    return built
+
+
+def test_clients_are_reused_per_credential(fresh_module):
+    creds = FakeCreds()
+    clients = clients_for(creds)
+    assert clients_for(creds) is clients
+    calendar = clients.calendar
+    assert clients_for(creds).calendar is calendar and clients.gmail is not calendar
+    assert clients.builds == 2 and fresh_module == ["calendar", "gmail"]
+
+    # Outra conta tem seus próprios clientes
+    other = FakeCreds(refresh_token="r2")
+    assert clients_for(other) is not clients
+    assert credential_key(other) != credential_key(creds)
+
+    # Um novo login da mesma conta troca o objeto da credencial: clientes novos
+    relogin = FakeCreds()
+    assert credential_key(relogin) == credential_key(creds)
+    assert clients_for(relogin) is not clients and clients_for(relogin).creds is relogin
+
+
+def test_least_recently_used_credentials_are_dropped():
+    creds = [FakeCreds(refresh_token=f"r{i}") for i in range(4)]
+    first = clients_for(creds[0], max_entries=3)
+    for other in creds[1:3]:
+        clients_for(other, max_entries=3)
+    clients_for(creds[0], max_entries=3)
+    clients_for(creds[3], max_entries=3)
+    assert clients_for(creds[0], max_entries=3) is first
+    assert len(google_clients._clients) == 3
+    assert credential_key(creds[1]) not in google_clients._clients
+
+
+@pytest.mark.parametrize("creds, refreshed", [
+    (FakeCreds(minutes=2), True),
+    (FakeCreds(minutes=-1), True),
+    (FakeCreds(minutes=60), False),
+    (FakeCreds(minutes=None), False),
+    (FakeCreds(refresh_token=None, minutes=2), False),
+])
+def test_refresh_if_expiring(creds, refreshed):
+    assert refresh_if_expiring(creds) is refreshed
+    assert creds.refreshes == int(refreshed)
+    if refreshed:
+        assert not expires_soon(creds)
+
+
+def test_cached_keeps_only_values_found():
+    calls = []
+
+    def fetch(value):
+        calls.append(value)
+        return value
+
+    assert cached("assinatura", 60, lambda: fetch("<b>Hunter</b>")) == "<b>Hunter</b>"
+    assert cached("assinatura", 60, lambda: fetch("outra")) == "<b>Hunter</b>"
+    assert cached("vazio", 60, lambda: fetch("")) == ""
+    assert cached("vazio", 60, lambda: fetch("agora sim")) == "agora sim"
+    assert calls == ["<b>Hunter</b>", "", "agora sim"]
+    assert cached("expira", 0, lambda: fetch("a")) == "a" and cached("expira", 0, lambda: fetch("b")) == "b"
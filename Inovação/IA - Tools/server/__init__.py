@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules shared with the other chat app (serving, warmup, metrics,
+# assets) live in the `appkit` package next to the apps
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
@@ -1,27 +1,74 @@
 import os
-import time
 from datetime import datetime
-from flask import request
+from flask import Response, request
 from requests import get
-import google.generativeai as genai
-from google.ai.generativelanguage_v1beta.types import content
+
+from appkit.metrics import Metrics
+from appkit.serving import shared_dir
+from appkit.sse import stream, wants_stream
+from appkit.warmup import Warmup
+
+from server.conversations import ConversationStore
+from server.fiscal_cube import FiscalCube
+from server.fiscal_store import (
+    DETAIL_COLUMNS, FiscalStore, format_result, format_rows, format_table_header, requested_measures,
+)
+from server.intent import parse_intent
+from server.result_cache import ResultCache
+from server.rate_limit import RateLimiter
+
+FISCAL_FUNCTION = "extrair_parametros_notas_fiscais"
 
 class Backend_Api:
-    def __init__(self, app, config: dict) -> None:
+    def __init__(self, app, config: dict, model=None) -> None:
         self.app = app
         self.gemini_key = os.getenv("GEMINI_API_KEY")
         self.gemini_api_base = os.getenv("GEMINI_API_BASE")
         self.proxy = config.get('proxy')
+        fiscal_config = config.get('fiscal_store', {})
+        self.fiscal_store = FiscalStore(fiscal_config.get('path', 'data/notas'))
+        self.chunk_size = fiscal_config.get('chunk_size', 100)
+        self.max_rows = fiscal_config.get('max_rows', 1000)
+        self.fiscal_store.cube = FiscalCube(self.fiscal_store)
+
+        cache_config = config.get('result_cache', {})
+        self.result_cache = ResultCache(
+            self.fiscal_store,
+            max_entries=cache_config.get('max_entries', 1024),
+            ttl=cache_config.get('ttl', 3600),
+        )
+
+        metrics_config = config.get('metrics', {})
+        self.metrics = Metrics('iatools', trace_log=metrics_config.get('trace_log'))
+        for key, help in (('hits', 'Result cache hits.'), ('misses', 'Result cache misses.'), ('entries', 'Result cache entries.')):
+            self.metrics.gauge(f'result_cache_{key}', help, lambda key=key: self.result_cache.stats()[key])
+
+        # Questions the rule-based parser resolves skip Gemini altogether
+        intent_config = config.get('intent', {})
+        self.intent_enabled = intent_config.get('enabled', True)
+        self.intent_llm_seconds = intent_config.get('llm_seconds', 2.0)
+        self.intent_counts = {'hit': 0, 'miss': 0}
+        self.metrics.gauge('intent_hit_ratio', 'Share of questions answered without Gemini.', self._intent_hit_ratio)
+
         self.routes = {
             '/backend-api/v2/conversation': {
                 'function': self._conversation,
                 'methods': ['POST']
+            },
+            '/backend-api/v2/cache': {
+                'function': self._cache_stats,
+                'methods': ['GET']
+            },
+            '/metrics': {
+                'function': self._metrics,
+                'methods': ['GET']
+            },
+            '/ready': {
+                'function': self._ready,
+                'methods': ['GET']
             }
         }
         
-        # Configure Gemini API
-        genai.configure(api_key=self.gemini_key)
-        
         self.generation_config = {
             "temperature": 1,
             "top_p": 0.8,
@@ -29,10 +76,44 @@ class Backend_Api:
             "max_output_tokens": 8192,
             "response_mime_type": "text/plain",
         }
-        
+
+        # google.generativeai (and gRPC) load in the background; `/ready` says when
+        self.warmup = Warmup()
+        self.warmup.add('model', self._build_model, model)
+        if config.get('warmup', {}).get('background', True):
+            self.warmup.start()
+
+        rate_limit = config.get('rate_limit', {})
+        self.rate_limiter = RateLimiter(
+            rpm=rate_limit.get('rpm', 10),
+            tpm=rate_limit.get('tpm', 4_000_000),
+            # One quota for all the gunicorn workers
+            state_dir=rate_limit.get('state_dir') or shared_dir('rate_limit'),
+        )
+
+        conversation_config = config.get('conversations', {})
+        self.conversations = ConversationStore(
+            conversation_config.get('path', 'data/conversas.sqlite3'),
+            history_tokens=conversation_config.get('history_tokens', 8000),
+            summary_tokens=conversation_config.get('summary_tokens', 1000),
+            turn_tokens=conversation_config.get('turn_tokens', 2000),
+        )
+        self.conversations.expire(conversation_config.get('max_age_days', 30) * 86400)
+
+    @property
+    def model(self):
+        return self.warmup.get('model')
+
+    def _build_model(self):
+        import google.generativeai as genai
+        from google.ai.generativelanguage_v1beta.types import content
+
+        # Configure Gemini API
+        genai.configure(api_key=self.gemini_key)
+
         current_date = datetime.now().strftime("%Y-%m-%d")
-        
-        self.model = genai.GenerativeModel(
+
+        return genai.GenerativeModel(
             model_name="gemini-2.0-flash-exp",
             generation_config=self.generation_config,
             system_instruction=f"Você é um assistente especializado em responder perguntas sobre notas fiscais e fornecer insights fiscais com base em uma base de dados estruturada. A data atual é {current_date}. Use essa informação para interpretar perguntas relacionadas a intervalos de tempo, como 'este ano', 'últimas duas semanas', ou 'neste mês'.\nSua função é: Interpretar perguntas em linguagem natural relacionadas a notas fiscais e insights fiscais. \nExtrair os seguintes parâmetros relevantes para gerar queries SQL: Intervalo de datas: id_dt_ini e id_dt_fin. Impostos: Como vl_icms, imposto_pis_vpis, imposto_cofins_vcofins, entre outros. Localização: Como uf_destinatario e nome_mun_destinatario. Outros detalhes: Como tipo, origem, e classificacao_gerencial. \nEssa é a estrutura da base de dados: id_dt_ini, id_dt_fin, id_cnpj, cnpj_destinatario, cpf_destinatario, nome_destinatario, nome_mun_destinatario, uf_destinatario, pais_destinatario, descr_compl, tipo, origem, unid, vl_item, aliq_icms, vl_icms, vdeson, vl_icms_st, vstret, pfcpst, vfcp, vfcpst, vdespadu, vii, viof, pfcpufddest, picmsinter, picmsinterpart, vfcpufdest, vicmsufdest, vicmsufremet, imposto_ipi_vbc, imposto_ipi_pipi, imposto_ipi_vipi, imposto_pis_ppis, imposto_pis_vpis, imposto_cofins_pcofins, imposto_cofins_vcofins, classificacao_gerencial",
@@ -115,6 +196,18 @@ class Backend_Api:
                 type = content.Type.NUMBER,
                 description = "Valor do imposto COFINS.",
               ),
+              "vl_icms_st": content.Schema(
+                type = content.Type.NUMBER,
+                description = "Valor do ICMS ST.",
+              ),
+              "imposto_ipi_vipi": content.Schema(
+                type = content.Type.NUMBER,
+                description = "Valor do imposto IPI.",
+              ),
+              "vfcp": content.Schema(
+                type = content.Type.NUMBER,
+                description = "Valor do FCP (Fundo de Combate à Pobreza).",
+              ),
             },
           ),
         ),
@@ -124,26 +217,126 @@ class Backend_Api:
   tool_config={'function_calling_config':'ANY'},
 )
         
-    def send_message(self, message):
-        chat_session = self.model.start_chat()
-        time.sleep(1)  # Basic rate-limit pause
-
-        response = chat_session.send_message(message)
-        response_text = ""
-        for part in response.parts:
-            if part.text:
-                response_text += part.text
-            if part.function_call:
-                args = ", ".join(f"{key}={val}" for key, val in part.function_call.args.items())
-                response_text += f"\nFunction call: {part.function_call.name}({args})\n"
-        return response_text
+    def send_message(self, message, conversation_id=None):
+        return "".join(event.get("content", "") for event in self.stream_message(message, conversation_id))
+
+    def stream_message(self, message, conversation_id=None):
+        """
+        Yields answer events and then stores the exchange in the conversation
+        history.
+        """
+        answer = []
+        try:
+            for event in self.stream_answer(message, conversation_id):
+                answer.append(event.get("content", ""))
+                yield event
+        finally:
+            if conversation_id and answer:
+                self.conversations.append(conversation_id, message, "".join(answer))
+
+    def stream_answer(self, message, conversation_id=None):
+        """
+        Yields answer events as the model produces them. Function calls are
+        executed against the fiscal store and their results streamed too.
+        Questions `parse_intent` understands are executed directly.
+        """
+        if self.intent_enabled:
+            with self.metrics.stage('intent'):
+                args = parse_intent(message)
+            self._count_intent(args is not None)
+            if args is not None:
+                yield from self.stream_fiscal_query(args)
+                return
+
+        with self.metrics.stage('history'):
+            history = self.conversations.history(conversation_id)
+        prompt_text = message + "".join(part for turn in history for part in turn['parts'])
+        estimated_tokens = self.rate_limiter.estimate_tokens(prompt_text)
+        chat_session = self.model.start_chat(history=history)
+
+        with self.metrics.stage('quota_wait'):
+            self.rate_limiter.acquire(estimated_tokens)
+        with self.metrics.stage('llm'):
+            response = chat_session.send_message(message, stream=True)
+        for chunk in self.metrics.iterate(response, 'llm_stream'):
+            for part in chunk.parts:
+                if part.text:
+                    yield {"content": part.text}
+                if part.function_call:
+                    yield from self.stream_function_call(part.function_call)
+
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.rate_limiter.record(estimated_tokens, usage.total_token_count)
+
+    def stream_function_call(self, function_call):
+        """
+        Runs a Gemini function call against the local fiscal store.
+        """
+        if function_call.name != FISCAL_FUNCTION:
+            yield {"content": f"\nFunção desconhecida: {function_call.name}\n"}
+            return
+
+        yield from self.stream_fiscal_query(dict(function_call.args.items()))
+
+    def stream_fiscal_query(self, args: dict):
+        """
+        Totals are sent as one event; item listings are sent in chunks of
+        `chunk_size` rows.
+        """
+        if requested_measures(args):
+            with self.metrics.stage('function'):
+                result = self.result_cache.get(args)
+                if result is None:
+                    result = self.fiscal_store.execute(args)
+                    self.result_cache.put(args, result)
+            with self.metrics.stage('serialization'):
+                text = "\n" + format_result(args, result) + "\n"
+            yield {"content": text, "result": result}
+            return
+
+        sent = 0
+        chunks = self.fiscal_store.iter_rows(args, chunk_size=self.chunk_size)
+        for rows in self.metrics.iterate(chunks, 'function'):
+            rows = rows[:self.max_rows - sent]
+            with self.metrics.stage('serialization'):
+                text = "\n" + format_rows(rows, DETAIL_COLUMNS)
+                if sent == 0:
+                    header = f"\n**Período:** {args.get('id_dt_ini', '?')} a {args.get('id_dt_fin', '?')}\n\n"
+                    text = header + format_table_header(DETAIL_COLUMNS) + text
+            yield {"content": text, "rows": rows}
+            sent += len(rows)
+            if sent >= self.max_rows:
+                break
+
+        if sent == 0:
+            yield {"content": "\n" + format_result(args, {"itens": 0, "linhas": []}) + "\n"}
+
+    def _count_intent(self, hit: bool) -> None:
+        result = 'hit' if hit else 'miss'
+        self.intent_counts[result] += 1
+        self.metrics.inc('intent_requests_total', help='Questions seen by the rule-based parser.', result=result)
+        if hit:
+            # Estimated from the Gemini calls observed so far
+            saved = self.metrics.mean('llm', 'llm_stream') or self.intent_llm_seconds
+            self.metrics.inc('intent_saved_seconds_total', saved, help='Estimated Gemini time saved by the rule-based parser.')
+
+    def _intent_hit_ratio(self) -> float:
+        total = self.intent_counts['hit'] + self.intent_counts['miss']
+        return self.intent_counts['hit'] / total if total else 0.0
 
     def _conversation(self):
         try:
-            prompt = request.json["meta"]["content"]["parts"][0]
+            with self.metrics.stage('parse'):
+                prompt = request.json["meta"]["content"]["parts"][0]
+                conversation_id = request.json.get("conversation_id")
+
+            if wants_stream(request):
+                return stream(self.metrics.traced(self.stream_message(prompt["content"], conversation_id), conversation_id=conversation_id))
 
             # Send message
-            response = self.send_message(prompt["content"])
+            with self.metrics.trace(conversation_id=conversation_id):
+                response = self.send_message(prompt["content"], conversation_id)
             if not response:
                 return {"success": False, "message": "Failed to get response from Gemini"}, 500
             return {"success": True, "response": response}, 200
@@ -151,4 +344,13 @@ class Backend_Api:
         except Exception as e:
             print(e)
             print(e.__traceback__)
-            return {"success": False, "error": str(e)}, 400
\ No newline at end of file
+            return {"success": False, "error": str(e)}, 400
+
+    def _cache_stats(self):
+        return self.result_cache.stats(), 200
+
+    def _metrics(self):
+        return Response(self.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    def _ready(self):
+        return self.warmup.response()
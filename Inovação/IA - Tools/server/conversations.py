@@ -0,0 +1,168 @@
+"""
+Server-side conversation history, keyed by `conversation_id`.
+
+The client only posts the new message; previous turns are read from a SQLite
+file and sent to Gemini as chat history trimmed to `history_tokens`. When
+the stored turns no longer fit, the oldest ones are rolled up into a short
+summary kept in the same file and deleted, so both the prompt and the file
+stay bounded however long a conversation runs.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS summaries (
+    conversation_id TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+SUMMARY_PROMPT = "Resumo da conversa até aqui:\n"
+SUMMARY_ACK = "Entendido, vou considerar esse histórico."
+
+
+def estimate_tokens(text: str) -> int:
+    # Same estimate the rate limiter uses
+    return max(1, len(text) // 4)
+
+
+def clip(text: str, tokens: int) -> str:
+    limit = tokens * 4
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + '…'
+
+
+def summarize(summary: str, turns: list, max_tokens: int) -> str:
+    """
+    Extractive roll-up: one line per rolled turn, with answers clipped more
+    than questions. When over `max_tokens`, the oldest exchanges go first.
+    """
+    lines = summary.splitlines() if summary else []
+    for role, content in turns:
+        content = ' '.join(content.split())
+        if role == 'user':
+            lines.append('- Usuário: ' + clip(content, 60))
+        else:
+            lines.append('- Assistente: ' + clip(content, 40))
+    while len(lines) > 2 and estimate_tokens('\n'.join(lines)) > max_tokens:
+        del lines[:2]
+    return '\n'.join(lines)
+
+
+class ConversationStore:
+    def __init__(self, path: str, history_tokens: int = 8000, summary_tokens: int = 1000,
+                 turn_tokens: int = 2000, summarizer=summarize, clock=time.time) -> None:
+        self.path = path
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.turn_tokens = turn_tokens
+        self.summarizer = summarizer
+        self.clock = clock
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+
+    def append(self, conversation_id: str, question: str, answer: str) -> None:
+        """
+        Stores one exchange, each turn clipped to `turn_tokens`, and rolls the
+        oldest exchanges into the summary once over `history_tokens`.
+        """
+        now = self.clock()
+        turns = [('user', clip(question, self.turn_tokens)), ('model', clip(answer, self.turn_tokens))]
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                (last,) = self._db.execute(
+                    'SELECT COALESCE(MAX(seq), 0) FROM turns WHERE conversation_id = ?', (conversation_id,)
+                ).fetchone()
+                self._db.executemany(
+                    'INSERT INTO turns VALUES (?, ?, ?, ?, ?, ?)',
+                    [(conversation_id, last + i + 1, role, content, estimate_tokens(content), now)
+                     for i, (role, content) in enumerate(turns)],
+                )
+                self._roll_up(conversation_id, now)
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def _roll_up(self, conversation_id: str, now: float) -> None:
+        rows = self._db.execute(
+            'SELECT seq, role, content, tokens FROM turns WHERE conversation_id = ? ORDER BY seq',
+            (conversation_id,),
+        ).fetchall()
+        summary = self._db.execute(
+            'SELECT content, tokens FROM summaries WHERE conversation_id = ?', (conversation_id,)
+        ).fetchone()
+        total = sum(row[3] for row in rows)
+        if total + (summary[1] if summary else 0) <= self.history_tokens:
+            return
+
+        # Roll up whole exchanges, oldest first, keeping at least the last one
+        budget = self.history_tokens - self.summary_tokens
+        rolled = []
+        while len(rows) > 2 and total > budget:
+            for _ in range(2):
+                seq, role, content, tokens = rows.pop(0)
+                rolled.append((role, content))
+                total -= tokens
+        if not rolled:
+            return
+        content = self.summarizer(summary[0] if summary else '', rolled, self.summary_tokens)
+        self._db.execute(
+            'INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)',
+            (conversation_id, content, estimate_tokens(content), now),
+        )
+        self._db.execute('DELETE FROM turns WHERE conversation_id = ? AND seq <= ?', (conversation_id, seq))
+
+    def history(self, conversation_id: str) -> list:
+        """
+        Chat history in the format of `GenerativeModel.start_chat`.
+        """
+        if not conversation_id:
+            return []
+        with self._lock:
+            summary = self._db.execute(
+                'SELECT content FROM summaries WHERE conversation_id = ?', (conversation_id,)
+            ).fetchone()
+            rows = self._db.execute(
+                'SELECT role, content FROM turns WHERE conversation_id = ? ORDER BY seq', (conversation_id,)
+            ).fetchall()
+
+        history = []
+        if summary:
+            history.append({'role': 'user', 'parts': [SUMMARY_PROMPT + summary[0]]})
+            history.append({'role': 'model', 'parts': [SUMMARY_ACK]})
+        history += [{'role': role, 'parts': [content]} for role, content in rows]
+        return history
+
+    def expire(self, max_age: float) -> int:
+        """
+        Deletes conversations idle for more than `max_age` seconds and returns
+        how many were removed.
+        """
+        cutoff = self.clock() - max_age
+        with self._lock:
+            stale = [row[0] for row in self._db.execute(
+                'SELECT conversation_id FROM turns GROUP BY conversation_id HAVING MAX(created) < ?', (cutoff,)
+            )]
+            for conversation_id in stale:
+                self._db.execute('DELETE FROM turns WHERE conversation_id = ?', (conversation_id,))
+                self._db.execute('DELETE FROM summaries WHERE conversation_id = ?', (conversation_id,))
+        return len(stale)
@@ -0,0 +1,116 @@
+"""
+Offline stand-ins for the Gemini model, with configurable latency and
+failure rate. They mirror the small part of the `google.generativeai` API
+used by `Backend_Api`, so the server, the rate limiter and the conversation
+history can be exercised under load without network access or quota.
+"""
+import random
+import time
+
+
+class FakeFunctionCall:
+    def __init__(self, name: str, args: dict) -> None:
+        self.name = name
+        self.args = args
+
+
+class FakePart:
+    def __init__(self, text: str = '', function_call: FakeFunctionCall = None) -> None:
+        self.text = text
+        self.function_call = function_call
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int) -> None:
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    def __init__(self, parts: list, usage: FakeUsage) -> None:
+        self.parts = parts
+        self.usage_metadata = usage
+
+    @property
+    def text(self) -> str:
+        return ''.join(part.text for part in self.parts)
+
+
+class FakeStreamResponse:
+    """
+    Iterable of response chunks; like the real streaming response, the usage
+    is known once it has been consumed.
+    """
+
+    def __init__(self, chunks: list, usage: FakeUsage, delay: float) -> None:
+        self.chunks = chunks
+        self.usage_metadata = usage
+        self.delay = delay
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if self.delay > 0:
+                time.sleep(self.delay)
+            yield chunk
+
+
+class FakeChatSession:
+    def __init__(self, model, history=None) -> None:
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream=False):
+        response = self.model.generate_content(content, stream=stream)
+        self.history.append({'role': 'user', 'parts': [str(content)]})
+        self.history.append({'role': 'model', 'parts': [self.model.reply]})
+        return response
+
+
+class FakeGenerativeModel:
+    """
+    `latency` is the mean response time in seconds and `failure_rate` the
+    probability of raising instead of answering. When `function_args` is set
+    the model answers with an `extrair_parametros_notas_fiscais` call,
+    otherwise with `reply` text.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 reply: str = 'Resposta de teste.', function_args: dict = None, seed: int = None) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.reply = reply
+        self.function_args = function_args
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history)
+
+    def count_tokens(self, content):
+        return FakeUsage(max(1, len(str(content)) // 4), 0)
+
+    def generate_content(self, content, stream=False):
+        """
+        With `stream=True` the reply is split in words and the latency spread
+        over the chunks, so the first chunk arrives early.
+        """
+        self.calls += 1
+        delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        if self._random.random() < self.failure_rate:
+            time.sleep(delay)
+            raise RuntimeError('Fake model failure')
+
+        if self.function_args is not None:
+            parts = [FakePart(function_call=FakeFunctionCall('extrair_parametros_notas_fiscais', dict(self.function_args)))]
+        else:
+            words = self.reply.split(' ')
+            parts = [FakePart(text=word if i == 0 else ' ' + word) for i, word in enumerate(words)]
+        usage = FakeUsage(max(1, len(str(content)) // 4), max(1, len(self.reply) // 4))
+
+        if stream:
+            chunks = [FakeResponse([part], usage) for part in parts]
+            return FakeStreamResponse(chunks, usage, delay / len(chunks))
+        time.sleep(delay)
+        return FakeResponse(parts, usage)
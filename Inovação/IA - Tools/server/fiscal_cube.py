@@ -0,0 +1,260 @@
+"""
+Pre-aggregated rollup of the fiscal store.
+
+Tax measures are summed by month x id_cnpj x uf_destinatario x tipo x origem x
+classificacao_gerencial. The cube is updated incrementally with every batch
+appended to the store and persisted next to it, one `_cube.<ano_mes>.parquet`
+per month (files starting with `_` are ignored by the dataset discovery), so
+an update only rewrites the months the batch touched. `_cube.built` marks a
+complete cube. Questions whose filters only touch those dimensions and whose
+period covers whole months are answered from the cube without reading item
+rows.
+
+Every gunicorn worker opens the cube, and an ingest may update it at the
+same time, so writers take an exclusive lock on `_cube.lock` and readers a
+shared one: the first worker to find the cube missing rebuilds it and the
+others load its result. Each month goes to its own temporary file before
+replacing the previous one.
+"""
+import calendar
+import glob
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from server.fiscal_store import MEASURES, month_of, normalize_text, parse_date, to_int
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DIMENSIONS = ['ano_mes', 'id_cnpj', 'uf_destinatario', 'tipo', 'origem', 'classificacao_gerencial']
+CUBE_MEASURES = list(MEASURES)
+
+# Arguments the cube can filter on, besides the period
+_FILTERABLE = {'id_cnpj', 'uf_destinatario', 'tipo', 'origem', 'classificacao_gerencial'}
+_PERIOD = {'id_dt_ini', 'id_dt_fin'}
+
+# File name part of the cells without a date
+_UNDATED = 'sem-data'
+
+
+def _normalize_key(value):
+    if isinstance(value, str):
+        return normalize_text(value)
+    return value
+
+
+class FiscalCube:
+    def __init__(self, store) -> None:
+        self.root = store.root
+        self.built_path = os.path.join(store.root, '_cube.built')
+        self.lock_path = os.path.join(store.root, '_cube.lock')
+        self.months = {}  # ano_mes -> {cell key: [itens, *measures]}
+        self._lock = threading.Lock()
+        self._mtimes = {}  # ano_mes -> mtime of the file loaded
+
+        with self._locked(exclusive=True):
+            # Checked under the lock: another worker may have just built it
+            if os.path.exists(self.built_path):
+                self._refresh()
+            else:
+                self._rebuild(store)
+        store.listeners.append(self.update)
+
+    @property
+    def cells(self) -> dict:
+        return {key: values for cells in self.months.values() for key, values in cells.items()}
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        """
+        Held while the cube files are read (shared) or rewritten (exclusive),
+        by this thread and by other processes.
+        """
+        with self._lock, open(self.lock_path, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)  # released when closed
+            yield
+
+    def _month_path(self, month) -> str:
+        return os.path.join(self.root, f'_cube.{month or _UNDATED}.parquet')
+
+    def _files(self) -> dict:
+        files = {}
+        for path in glob.glob(os.path.join(glob.escape(self.root), '_cube.*.parquet')):
+            month = os.path.basename(path)[len('_cube.'):-len('.parquet')]
+            files[None if month == _UNDATED else month] = path
+        return files
+
+    def _load(self, month, path: str) -> None:
+        mtime = os.stat(path).st_mtime_ns
+        cells = {}
+        for row in pq.read_table(path).to_pylist():
+            key = tuple(row[d] for d in DIMENSIONS)
+            cells[key] = [row['itens']] + [row[m] for m in CUBE_MEASURES]
+        self.months[month] = cells
+        self._mtimes[month] = mtime
+
+    def _save(self, months) -> None:
+        """
+        Rewrites the files of `months`; a month without cells loses its file.
+        """
+        for month in months:
+            path = self._month_path(month)
+            cells = self.months.get(month)
+            if not cells:
+                self.months.pop(month, None)
+                self._mtimes.pop(month, None)
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+
+            columns = {d: [] for d in DIMENSIONS}
+            columns['itens'] = []
+            columns.update({m: [] for m in CUBE_MEASURES})
+            for key, values in cells.items():
+                for dimension, value in zip(DIMENSIONS, key):
+                    columns[dimension].append(value)
+                columns['itens'].append(values[0])
+                for measure, value in zip(CUBE_MEASURES, values[1:]):
+                    columns[measure].append(value)
+
+            # Starts with `_`, so the dataset discovery skips it too
+            fd, tmp_path = tempfile.mkstemp(prefix='_cube.', suffix='.tmp', dir=self.root)
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    pq.write_table(pa.table(columns), file)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            self._mtimes[month] = os.stat(path).st_mtime_ns
+
+    def _refresh(self) -> None:
+        # Months may have been updated by an ingest running in another process
+        files = self._files()
+        for month in set(self.months) - set(files):
+            self.months.pop(month)
+            self._mtimes.pop(month, None)
+        for month, path in files.items():
+            try:
+                if os.stat(path).st_mtime_ns != self._mtimes.get(month):
+                    self._load(month, path)
+            except FileNotFoundError:
+                continue
+
+    def rebuild(self, store, months=None) -> None:
+        """
+        Recomputes the cube, or only the cells of `months`, from the items in
+        the store.
+        """
+        with self._locked(exclusive=True):
+            if months is None:
+                self._rebuild(store)
+                return
+            self._refresh()
+            months = set(months)
+            for month in months:
+                self.months.pop(month, None)
+            dated = [month for month in months if month is not None]
+            selected = ds.field('ano_mes').isin(dated)
+            if None in months:
+                selected = selected | ds.field('ano_mes').is_null()
+            scanner = store.dataset.scanner(columns=DIMENSIONS + CUBE_MEASURES, filter=selected)
+            for batch in scanner.to_batches():
+                self._merge(pa.Table.from_batches([batch]))
+            self._save(months)
+
+    def _rebuild(self, store) -> None:
+        stale = set(self._files())
+        self.months = {}
+        scanner = store.dataset.scanner(columns=DIMENSIONS + CUBE_MEASURES)
+        for batch in scanner.to_batches():
+            self._merge(pa.Table.from_batches([batch]))
+        self._save(stale | set(self.months))
+        # Single-file cube of earlier versions
+        legacy = os.path.join(self.root, '_cube.parquet')
+        if os.path.exists(legacy):
+            os.remove(legacy)
+        with open(self.built_path, 'w'):
+            pass
+
+    def update(self, table: pa.Table) -> None:
+        """
+        Store listener: folds a freshly appended batch into the cube.
+        """
+        with self._locked(exclusive=True):
+            self._refresh()
+            self._save(self._merge(table))
+
+    def _merge(self, table: pa.Table) -> set:
+        """
+        Adds `table` to the cells and returns the months it touched.
+        """
+        if table.num_rows == 0:
+            return set()
+        aggregations = [('vl_item', 'count', pc.CountOptions(mode='all'))]
+        aggregations += [(m, 'sum') for m in CUBE_MEASURES]
+        grouped = table.select(DIMENSIONS + CUBE_MEASURES).group_by(DIMENSIONS, use_threads=False).aggregate(aggregations)
+
+        for row in grouped.to_pylist():
+            key = tuple(_normalize_key(row[d]) for d in DIMENSIONS)
+            values = [row['vl_item_count']] + [row[f'{m}_sum'] or 0.0 for m in CUBE_MEASURES]
+            cells = self.months.setdefault(key[0], {})
+            cell = cells.get(key)
+            cells[key] = values if cell is None else [a + b for a, b in zip(cell, values)]
+        return set(grouped['ano_mes'].to_pylist())
+
+    def covers(self, args: dict) -> bool:
+        """
+        True when `args` only filter on cube dimensions and the period is a
+        range of whole months.
+        """
+        keys = set(args)
+        if not keys <= (_PERIOD | _FILTERABLE | set(CUBE_MEASURES)):
+            return False
+        if not (args.get('id_dt_ini') and args.get('id_dt_fin')):
+            return False
+        try:
+            ini = parse_date(args['id_dt_ini'])
+            fin = parse_date(args['id_dt_fin'])
+        except ValueError:
+            return False
+        last_day = calendar.monthrange(fin.year, fin.month)[1]
+        return ini.day == 1 and fin.day == last_day
+
+    def aggregate(self, args: dict, measures: list) -> dict:
+        """
+        Same contract as `FiscalStore.aggregate`, served from the cube.
+        """
+        first = month_of(parse_date(args['id_dt_ini']))
+        last = month_of(parse_date(args['id_dt_fin']))
+        with self._locked(exclusive=False):
+            self._refresh()
+            months = [cells for month, cells in self.months.items() if month is not None and first <= month <= last]
+
+        filters = {}
+        for position, dimension in enumerate(DIMENSIONS):
+            if dimension in _FILTERABLE and args.get(dimension) not in (None, ''):
+                value = args[dimension]
+                filters[position] = to_int(value) if dimension == 'id_cnpj' else _normalize_key(str(value))
+
+        indexes = [CUBE_MEASURES.index(m) + 1 for m in measures]
+        count = 0
+        totals = [0.0] * len(measures)
+        for cells in months:
+            for key, values in cells.items():
+                if any(key[position] != value for position, value in filters.items()):
+                    continue
+                count += values[0]
+                for i, index in enumerate(indexes):
+                    totals[i] += values[index]
+        return {'itens': count, 'totais': dict(zip(measures, totals))}
@@ -0,0 +1,445 @@
+"""
+Local columnar store for NF-e items, used to execute the
+`extrair_parametros_notas_fiscais` function calls produced by Gemini.
+
+Items are written as Parquet files in a hive-partitioned layout:
+
+    <root>/ano_mes=2024-01/uf_destinatario=SP/part-<uuid>-0.parquet
+
+A question restricted to one month and one UF only opens the files of that
+directory; the remaining filters are pushed down to the Parquet row groups,
+and only the columns a question needs are read.
+
+Each item also keeps the access key of its note (`_chave`), so the items of
+a note can be removed again with `delete_keys`.
+"""
+import json
+import os
+import tempfile
+import threading
+import uuid
+from datetime import date, datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Column order follows tools/saida.txt
+SCHEMA = pa.schema([
+    ('id_dt_ini', pa.date32()),
+    ('id_dt_fin', pa.date32()),
+    ('id_cnpj', pa.int64()),
+    ('cnpj_destinatario', pa.int64()),
+    ('cpf_destinatario', pa.string()),
+    ('nome_destinatario', pa.string()),
+    ('nome_mun_destinatario', pa.string()),
+    ('uf_destinatario', pa.string()),
+    ('pais_destinatario', pa.string()),
+    ('descr_compl', pa.string()),
+    ('tipo', pa.string()),
+    ('origem', pa.string()),
+    ('unid', pa.string()),
+    ('vl_item', pa.float64()),
+    ('aliq_icms', pa.float64()),
+    ('vl_icms', pa.float64()),
+    ('vdeson', pa.float64()),
+    ('vl_icms_st', pa.float64()),
+    ('vstret', pa.float64()),
+    ('pfcpst', pa.float64()),
+    ('vfcp', pa.float64()),
+    ('vfcpst', pa.float64()),
+    ('vdespadu', pa.float64()),
+    ('vii', pa.float64()),
+    ('viof', pa.float64()),
+    ('pfcpufddest', pa.float64()),
+    ('picmsinter', pa.float64()),
+    ('picmsinterpart', pa.float64()),
+    ('vfcpufdest', pa.float64()),
+    ('vicmsufdest', pa.float64()),
+    ('vicmsufremet', pa.float64()),
+    ('imposto_ipi_vbc', pa.float64()),
+    ('imposto_ipi_pipi', pa.float64()),
+    ('imposto_ipi_vipi', pa.float64()),
+    ('imposto_pis_ppis', pa.float64()),
+    ('imposto_pis_vpis', pa.float64()),
+    ('imposto_cofins_pcofins', pa.float64()),
+    ('imposto_cofins_vcofins', pa.float64()),
+    ('classificacao_gerencial', pa.string()),
+])
+
+# Access key of the note an item was loaded from (None when unknown)
+KEY_COLUMN = '_chave'
+ROW_SCHEMA = SCHEMA.append(pa.field(KEY_COLUMN, pa.string()))
+
+PARTITIONING = ds.partitioning(
+    pa.schema([('ano_mes', pa.string()), ('uf_destinatario', pa.string())]),
+    flavor='hive',
+)
+
+# Monetary columns that can be summed. Gemini marks the taxes a question asks
+# about by filling the matching numeric parameters; their values are ignored.
+MEASURES = {
+    'vl_item': 'Valor dos itens',
+    'vl_icms': 'ICMS',
+    'vdeson': 'ICMS desonerado',
+    'vl_icms_st': 'ICMS ST',
+    'vstret': 'ICMS ST retido',
+    'vfcp': 'FCP',
+    'vfcpst': 'FCP ST',
+    'vdespadu': 'Despesas aduaneiras',
+    'vii': 'Imposto de Importação',
+    'viof': 'IOF',
+    'vfcpufdest': 'FCP UF destino',
+    'vicmsufdest': 'ICMS UF destino',
+    'vicmsufremet': 'ICMS UF remetente',
+    'imposto_ipi_vbc': 'Base de cálculo do IPI',
+    'imposto_ipi_vipi': 'IPI',
+    'imposto_pis_vpis': 'PIS',
+    'imposto_cofins_vcofins': 'COFINS',
+}
+
+# Rates are filtered by equality, like any other attribute
+RATE_FILTERS = [
+    'aliq_icms', 'pfcpst', 'pfcpufddest', 'picmsinter', 'picmsinterpart',
+    'imposto_ipi_pipi', 'imposto_pis_ppis', 'imposto_cofins_pcofins',
+]
+
+EXACT_FILTERS = ['id_cnpj', 'cnpj_destinatario', 'cpf_destinatario']
+UPPER_FILTERS = ['uf_destinatario']
+TEXT_FILTERS = [
+    'nome_destinatario', 'nome_mun_destinatario', 'pais_destinatario',
+    'tipo', 'origem', 'classificacao_gerencial',
+]
+
+DETAIL_COLUMNS = [
+    'id_dt_ini', 'id_cnpj', 'nome_destinatario', 'nome_mun_destinatario',
+    'uf_destinatario', 'descr_compl', 'tipo', 'origem', 'vl_item',
+    'classificacao_gerencial',
+]
+
+
+def parse_date(value) -> date:
+    """
+    Parses the dates Gemini sends ('YYYY-MM-DD', also accepting 'DD/MM/YYYY').
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value).strip()
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%Y%m%d'):
+        try:
+            return datetime.strptime(value[:10], fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Data inválida: {value!r}")
+
+
+def month_of(day: date) -> str:
+    return f"{day.year:04d}-{day.month:02d}"
+
+
+def to_int(value) -> int:
+    """
+    CNPJs arrive as floats from the function call or as formatted strings.
+    """
+    if isinstance(value, str):
+        return int(''.join(filter(str.isdigit, value)))
+    return int(value)
+
+
+def normalize_text(value) -> str:
+    """
+    Text as filters compare it: upper-case, whitespace collapsed. The result
+    cache keys on the same form, so equal keys always select the same rows.
+    """
+    return ' '.join(str(value).split()).upper()
+
+
+def _normalized_column(column: str):
+    trimmed = pc.utf8_trim_whitespace(ds.field(column))
+    return pc.utf8_upper(pc.replace_substring_regex(trimmed, pattern=r'\s+', replacement=' '))
+
+
+def requested_measures(args: dict) -> list:
+    return [column for column in MEASURES if column in args]
+
+
+def build_filter(args: dict):
+    """
+    Translates function-call arguments into a dataset filter expression.
+
+    The `ano_mes` bounds let the scanner skip whole partitions before any file
+    is opened; everything else is evaluated against Parquet statistics.
+    """
+    conditions = []
+
+    if args.get('id_dt_ini'):
+        ini = parse_date(args['id_dt_ini'])
+        conditions.append(ds.field('ano_mes') >= month_of(ini))
+        conditions.append(ds.field('id_dt_ini') >= ini)
+    if args.get('id_dt_fin'):
+        fin = parse_date(args['id_dt_fin'])
+        conditions.append(ds.field('ano_mes') <= month_of(fin))
+        conditions.append(ds.field('id_dt_ini') <= fin)
+
+    for column in EXACT_FILTERS:
+        value = args.get(column)
+        if value in (None, ''):
+            continue
+        if SCHEMA.field(column).type == pa.int64():
+            value = to_int(value)
+        conditions.append(ds.field(column) == value)
+
+    for column in UPPER_FILTERS:
+        if args.get(column):
+            conditions.append(ds.field(column) == normalize_text(args[column]))
+
+    for column in TEXT_FILTERS:
+        if args.get(column):
+            conditions.append(_normalized_column(column) == normalize_text(args[column]))
+
+    for column in RATE_FILTERS:
+        if args.get(column):
+            conditions.append(ds.field(column) == float(args[column]))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+class FiscalStore:
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.listeners = []
+        self.cube = None
+        self._lock = threading.Lock()
+        self._dataset = None
+        self._version = None
+        self._version_path = os.path.join(root, '_VERSION')
+        self.appends_path = os.path.join(root, '_appends.jsonl')
+        os.makedirs(root, exist_ok=True)
+
+    def version(self):
+        try:
+            return os.stat(self._version_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @property
+    def dataset(self):
+        # Files appended by another process (e.g. an ingest run) bump _VERSION
+        version = self.version()
+        with self._lock:
+            if self._dataset is None or version != self._version:
+                self._version = version
+                self._dataset = ds.dataset(
+                    self.root,
+                    schema=ROW_SCHEMA.append(pa.field('ano_mes', pa.string())),
+                    format='parquet',
+                    partitioning=PARTITIONING,
+                )
+            return self._dataset
+
+    def append(self, rows) -> pa.Table:
+        """
+        Writes a batch of items (a pyarrow Table or a list of dicts) and
+        notifies the registered listeners with the written table.
+        """
+        table = rows if isinstance(rows, pa.Table) else pa.Table.from_pylist(rows)
+        table = self._conform(table)
+        if table.num_rows == 0:
+            return table
+
+        ds.write_dataset(
+            table,
+            self.root,
+            format='parquet',
+            partitioning=PARTITIONING,
+            basename_template=f'part-{uuid.uuid4().hex}-{{i}}.parquet',
+            existing_data_behavior='overwrite_or_ignore',
+        )
+        self._changed(table)
+
+        for listener in self.listeners:
+            listener(table)
+        return table
+
+    def delete_keys(self, keys) -> pa.Table:
+        """
+        Removes the items of the notes with access keys `keys`, rewriting only
+        the files that hold them, and returns the removed items. The cube
+        recomputes the months they were in.
+        """
+        keys = pa.array(sorted(set(keys)), pa.string())
+        if len(keys) == 0:
+            return ROW_SCHEMA.empty_table()
+        dataset = self.dataset
+        selected = ds.field(KEY_COLUMN).isin(keys)
+        removed = []
+        for fragment in dataset.get_fragments(filter=selected):
+            table = pq.ParquetFile(fragment.path).read()
+            if KEY_COLUMN not in table.column_names:
+                continue
+            matches = pc.fill_null(pc.is_in(table[KEY_COLUMN], value_set=keys), False)
+            if not pc.any(matches).as_py():
+                continue
+            # With the partition columns, which the file itself does not hold
+            removed.append(fragment.to_table(schema=dataset.schema, filter=selected))
+            kept = table.filter(pc.invert(matches))
+            if kept.num_rows == 0:
+                os.remove(fragment.path)
+                continue
+            # Starts with `_`, so a scan meanwhile does not pick it up
+            fd, tmp_path = tempfile.mkstemp(prefix='_', suffix='.tmp', dir=os.path.dirname(fragment.path))
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    pq.write_table(kept, file)
+                os.replace(tmp_path, fragment.path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        if not removed:
+            return ROW_SCHEMA.empty_table()
+
+        table = pa.concat_tables(removed)
+        self._changed(table)
+        if self.cube is not None:
+            self.cube.rebuild(self, set(table['ano_mes'].to_pylist()))
+        return table
+
+    def _changed(self, table: pa.Table) -> None:
+        self._log_append(table)
+        with open(self._version_path, 'w') as marker:
+            marker.write(uuid.uuid4().hex)
+        with self._lock:
+            self._dataset = None
+
+    def _log_append(self, table: pa.Table) -> None:
+        # One line per batch written or removed with the period and CNPJs it
+        # touched, so caches in other processes know what to invalidate.
+        dates = table['id_dt_ini']
+        entry = {
+            'ini': str(pc.min(dates).as_py()),
+            'fin': str(pc.max(dates).as_py()),
+            'cnpjs': [c for c in pc.unique(table['id_cnpj']).to_pylist() if c is not None],
+        }
+        with open(self.appends_path, 'a', encoding='utf-8') as log:
+            log.write(json.dumps(entry) + '\n')
+
+    def read_appends(self, offset: int = 0):
+        """
+        Returns the append log entries written after byte `offset`, and the
+        offset to continue from.
+        """
+        try:
+            with open(self.appends_path, 'rb') as log:
+                log.seek(offset)
+                data = log.read()
+        except FileNotFoundError:
+            return [], 0
+        complete = data[:data.rfind(b'\n') + 1]
+        entries = [json.loads(line) for line in complete.splitlines() if line.strip()]
+        return entries, offset + len(complete)
+
+    def _conform(self, table: pa.Table) -> pa.Table:
+        columns = []
+        for field in ROW_SCHEMA:
+            if field.name in table.column_names:
+                column = table[field.name]
+                if field.name in ('id_dt_ini', 'id_dt_fin') and pa.types.is_string(column.type):
+                    column = pa.array([parse_date(v) if v else None for v in column.to_pylist()], pa.date32())
+                columns.append(column.cast(field.type))
+            else:
+                columns.append(pa.nulls(table.num_rows, field.type))
+        table = pa.Table.from_arrays(columns, schema=ROW_SCHEMA)
+
+        uf = pc.utf8_upper(pc.utf8_trim_whitespace(table['uf_destinatario']))
+        table = table.set_column(SCHEMA.get_field_index('uf_destinatario'), 'uf_destinatario', uf)
+        ano_mes = pc.strftime(table['id_dt_ini'].cast(pa.timestamp('s')), format='%Y-%m')
+        return table.append_column('ano_mes', ano_mes)
+
+    def scanner(self, args: dict, columns: list, batch_size: int = 65536):
+        return self.dataset.scanner(
+            columns=columns,
+            filter=build_filter(args),
+            batch_size=batch_size,
+        )
+
+    def aggregate(self, args: dict, measures: list) -> dict:
+        """
+        Sums the requested measures over the items matching `args`.
+        """
+        totals = {column: 0.0 for column in measures}
+        count = 0
+        for batch in self.scanner(args, measures or ['vl_item']).to_batches():
+            count += batch.num_rows
+            for column in measures:
+                totals[column] += pc.sum(batch[column]).as_py() or 0.0
+        return {'itens': count, 'totais': totals}
+
+    def iter_rows(self, args: dict, columns: list = None, chunk_size: int = 500):
+        """
+        Yields the matching items as lists of dicts of at most `chunk_size`.
+        """
+        columns = columns or DETAIL_COLUMNS
+        for batch in self.scanner(args, columns, batch_size=chunk_size).to_batches():
+            if batch.num_rows:
+                yield batch.to_pylist()
+
+    def execute(self, args: dict, max_rows: int = 50) -> dict:
+        """
+        Answers an `extrair_parametros_notas_fiscais` call: tax totals when
+        measures were requested, otherwise a sample of matching items.
+        """
+        measures = requested_measures(args)
+        if measures and self.cube is not None and self.cube.covers(args):
+            return self.cube.aggregate(args, measures)
+        if measures:
+            return self.aggregate(args, measures)
+
+        rows = []
+        for chunk in self.iter_rows(args, chunk_size=max_rows):
+            rows.extend(chunk)
+            if len(rows) >= max_rows:
+                break
+        return {'itens': len(rows), 'linhas': rows[:max_rows]}
+
+
+def format_brl(value: float) -> str:
+    text = f"{value:,.2f}"
+    return 'R$ ' + text.replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def format_table_header(columns: list) -> str:
+    return '| ' + ' | '.join(columns) + ' |\n|' + '---|' * len(columns)
+
+
+def format_rows(rows: list, columns: list) -> str:
+    return '\n'.join(
+        '| ' + ' | '.join('' if row[c] is None else str(row[c]) for c in columns) + ' |'
+        for row in rows
+    )
+
+
+def format_result(args: dict, result: dict) -> str:
+    """
+    Renders an `execute` result as markdown for the chat client.
+    """
+    period = f"{args.get('id_dt_ini', '?')} a {args.get('id_dt_fin', '?')}"
+    if 'totais' in result:
+        lines = [f"**Período:** {period} ({result['itens']} itens)", '', '| Medida | Total |', '|---|---:|']
+        for column, total in result['totais'].items():
+            lines.append(f"| {MEASURES[column]} | {format_brl(total)} |")
+        return '\n'.join(lines)
+
+    if not result['linhas']:
+        return f"Nenhuma nota encontrada para o período {period}."
+    columns = list(result['linhas'][0].keys())
+    return '\n'.join([
+        f"**Período:** {period}", '',
+        format_table_header(columns),
+        format_rows(result['linhas'], columns),
+    ])
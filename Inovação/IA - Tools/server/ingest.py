@@ -0,0 +1,483 @@
+"""
+Bulk loader of NF-e XML files and CSV exports into the fiscal store.
+
+    python -m server.ingest notas/2024/ --store data/notas --workers 8
+
+Files are parsed in a process pool. XML is read with `iterparse`, one
+`infNFe` at a time, and CSV row by row. Workers send each record batch of
+`PARSE_BATCH_ROWS` rows through a bounded queue as soon as it is parsed, so
+neither a worker nor the parent ever holds a whole file; the parent
+appends them to the store in batches of `--batch-size` rows, which keeps
+the rollup cube and the append log consistent.
+
+Loading is idempotent per access key: loaded keys are recorded in
+`<store>/_chaves.txt`, and files or notes already there are skipped. A
+file's keys are recorded once it was read to the end and its rows written;
+until then they are marked pending. The items of a file that fails are
+removed from the store again, and so are, at the start of the next run,
+those of pending keys a killed run left behind, so no note is counted twice.
+Rows without a key are only written once their file was read to the end.
+CSV exports without an access key column are keyed by the file hash.
+"""
+import argparse
+import csv
+import hashlib
+import multiprocessing
+import os
+import queue
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from server.fiscal_cube import FiscalCube
+from server.fiscal_store import KEY_COLUMN, ROW_SCHEMA, SCHEMA, FiscalStore, parse_date
+
+NS = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
+INF_NFE = '{http://www.portalfiscal.inf.br/nfe}infNFe'
+KEY_PATTERN = re.compile(r'\d{44}')
+
+# Last three digits of the CFOP -> `tipo`
+CFOP_TIPO = {
+    '101': 'Venda de produção',
+    '401': 'Venda de produção',
+    '102': 'Revenda',
+    '403': 'Revenda',
+    '405': 'Revenda',
+    '407': 'Consumo',
+    '556': 'Consumo',
+    '557': 'Consumo',
+    '910': 'Bonificação',
+    '911': 'Amostra grátis',
+    '949': 'Outras',
+}
+
+# First digit of the CFOP -> `origem`
+CFOP_ORIGEM = {
+    '1': 'Dentro do estado', '5': 'Dentro do estado',
+    '2': 'Fora do estado', '6': 'Fora do estado',
+    '3': 'Exterior', '7': 'Exterior',
+}
+
+# Item fields, relative to <det>, for every numeric column of the store
+ITEM_FIELDS = {
+    'vl_item': 'nfe:prod/nfe:vProd',
+    'aliq_icms': 'nfe:imposto/nfe:ICMS/*/nfe:pICMS',
+    'vl_icms': 'nfe:imposto/nfe:ICMS/*/nfe:vICMS',
+    'vdeson': 'nfe:imposto/nfe:ICMS/*/nfe:vICMSDeson',
+    'vl_icms_st': 'nfe:imposto/nfe:ICMS/*/nfe:vICMSST',
+    'vstret': 'nfe:imposto/nfe:ICMS/*/nfe:vICMSSTRet',
+    'pfcpst': 'nfe:imposto/nfe:ICMS/*/nfe:pFCPST',
+    'vfcp': 'nfe:imposto/nfe:ICMS/*/nfe:vFCP',
+    'vfcpst': 'nfe:imposto/nfe:ICMS/*/nfe:vFCPST',
+    'vdespadu': 'nfe:imposto/nfe:II/nfe:vDespAdu',
+    'vii': 'nfe:imposto/nfe:II/nfe:vII',
+    'viof': 'nfe:imposto/nfe:II/nfe:vIOF',
+    'pfcpufddest': 'nfe:imposto/nfe:ICMSUFDest/nfe:pFCPUFDest',
+    'picmsinter': 'nfe:imposto/nfe:ICMSUFDest/nfe:pICMSInter',
+    'picmsinterpart': 'nfe:imposto/nfe:ICMSUFDest/nfe:pICMSInterPart',
+    'vfcpufdest': 'nfe:imposto/nfe:ICMSUFDest/nfe:vFCPUFDest',
+    'vicmsufdest': 'nfe:imposto/nfe:ICMSUFDest/nfe:vICMSUFDest',
+    'vicmsufremet': 'nfe:imposto/nfe:ICMSUFDest/nfe:vICMSUFRemet',
+    'imposto_ipi_vbc': 'nfe:imposto/nfe:IPI/nfe:IPITrib/nfe:vBC',
+    'imposto_ipi_pipi': 'nfe:imposto/nfe:IPI/nfe:IPITrib/nfe:pIPI',
+    'imposto_ipi_vipi': 'nfe:imposto/nfe:IPI/nfe:IPITrib/nfe:vIPI',
+    'imposto_pis_ppis': 'nfe:imposto/nfe:PIS/*/nfe:pPIS',
+    'imposto_pis_vpis': 'nfe:imposto/nfe:PIS/*/nfe:vPIS',
+    'imposto_cofins_pcofins': 'nfe:imposto/nfe:COFINS/*/nfe:pCOFINS',
+    'imposto_cofins_vcofins': 'nfe:imposto/nfe:COFINS/*/nfe:vCOFINS',
+}
+
+# Rows per record batch sent by the workers
+PARSE_BATCH_ROWS = 10_000
+
+
+def _text(elem, path):
+    found = elem.find(path, NS)
+    return found.text.strip() if found is not None and found.text else None
+
+
+def _number(text):
+    """
+    Parses '1234.56' (XML) as well as '1.234,56' (Brazilian CSV exports).
+    """
+    if text is None or str(text).strip() == '':
+        return None
+    text = str(text).strip()
+    if ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+    return float(text)
+
+
+def _digits(text):
+    if not text:
+        return None
+    digits = ''.join(filter(str.isdigit, str(text)))
+    return int(digits) if digits else None
+
+
+def note_rows(inf_nfe):
+    """
+    Maps one <infNFe> element to store rows, one per <det> item.
+    """
+    key = inf_nfe.get('Id', '')[3:] or None
+    issued = _text(inf_nfe, 'nfe:ide/nfe:dhEmi') or _text(inf_nfe, 'nfe:ide/nfe:dEmi')
+    issued = parse_date(issued[:10]) if issued else None
+
+    dest = inf_nfe.find('nfe:dest', NS)
+    header = {
+        KEY_COLUMN: key,
+        'id_dt_ini': issued,
+        'id_dt_fin': issued,
+        'id_cnpj': _digits(_text(inf_nfe, 'nfe:emit/nfe:CNPJ')),
+        'cnpj_destinatario': _digits(_text(dest, 'nfe:CNPJ')) if dest is not None else None,
+        'cpf_destinatario': _text(dest, 'nfe:CPF') if dest is not None else None,
+        'nome_destinatario': _text(dest, 'nfe:xNome') if dest is not None else None,
+        'nome_mun_destinatario': _text(dest, 'nfe:enderDest/nfe:xMun') if dest is not None else None,
+        'uf_destinatario': _text(dest, 'nfe:enderDest/nfe:UF') if dest is not None else None,
+        'pais_destinatario': (_text(dest, 'nfe:enderDest/nfe:xPais') if dest is not None else None) or 'Brasil',
+    }
+
+    rows = []
+    for det in inf_nfe.findall('nfe:det', NS):
+        cfop = _text(det, 'nfe:prod/nfe:CFOP') or ''
+        row = dict(header)
+        row['descr_compl'] = _text(det, 'nfe:prod/nfe:xProd')
+        row['unid'] = _text(det, 'nfe:prod/nfe:uCom')
+        row['tipo'] = CFOP_TIPO.get(cfop[1:], cfop or None)
+        row['origem'] = CFOP_ORIGEM.get(cfop[:1])
+        row['classificacao_gerencial'] = None
+        for column, path in ITEM_FIELDS.items():
+            row[column] = _number(_text(det, path))
+        rows.append(row)
+    return rows
+
+
+def parse_xml(path: str, batch_rows: int = PARSE_BATCH_ROWS):
+    """
+    Yields the items of the file as record batches; a note is never split
+    between two batches.
+    """
+    rows = []
+    for _, elem in ET.iterparse(path, events=('end',)):
+        if elem.tag == INF_NFE:
+            rows.extend(note_rows(elem))
+            # Free the note before reading the next one
+            elem.clear()
+            if len(rows) >= batch_rows:
+                yield pa.RecordBatch.from_pylist(rows, schema=ROW_SCHEMA)
+                rows = []
+    if rows:
+        yield pa.RecordBatch.from_pylist(rows, schema=ROW_SCHEMA)
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return 'arquivo:' + digest.hexdigest()
+
+
+def parse_csv(path: str, batch_rows: int = PARSE_BATCH_ROWS):
+    """
+    Yields the rows of a CSV export whose header uses the store column
+    names, as record batches.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        sample = file.read(8192)
+        file.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+        reader = csv.DictReader(file, dialect=dialect)
+
+        key_field = next((f for f in reader.fieldnames or [] if f.lower() in ('chave', 'chave_acesso', 'chnfe')), None)
+        file_key = None if key_field else _file_hash(path)
+
+        rows = []
+        for record in reader:
+            row = {KEY_COLUMN: (record.get(key_field) or '').strip() or None if key_field else file_key}
+            for field in SCHEMA:
+                value = record.get(field.name)
+                if value is None or value.strip() == '':
+                    row[field.name] = None
+                elif pa.types.is_floating(field.type):
+                    row[field.name] = _number(value)
+                elif pa.types.is_integer(field.type):
+                    row[field.name] = _digits(value)
+                elif pa.types.is_date(field.type):
+                    row[field.name] = parse_date(value)
+                else:
+                    row[field.name] = value.strip()
+            rows.append(row)
+            if len(rows) >= batch_rows:
+                yield pa.RecordBatch.from_pylist(rows, schema=ROW_SCHEMA)
+                rows = []
+        if rows:
+            yield pa.RecordBatch.from_pylist(rows, schema=ROW_SCHEMA)
+
+
+def parse_batches(path: str):
+    if path.lower().endswith('.xml'):
+        return parse_xml(path, PARSE_BATCH_ROWS)
+    return parse_csv(path, PARSE_BATCH_ROWS)
+
+
+# Set in every worker by `_start_worker`
+_batches = None
+
+
+def _start_worker(batches) -> None:
+    global _batches
+    _batches = batches
+
+
+def parse_file(path: str) -> None:
+    """
+    Runs in a worker: sends (path, batch, None) for every record batch, then
+    (path, None, error) once the file is done, `error` None on success.
+    """
+    try:
+        for batch in parse_batches(path):
+            _batches.put((path, batch, None))
+    except Exception as e:
+        _batches.put((path, None, f"{type(e).__name__}: {e}"))
+        return
+    _batches.put((path, None, None))
+
+
+class Ledger:
+    """
+    Append-only record of the access keys already loaded into the store.
+    Keys written before their file was read to the end are recorded as
+    pending first (`?<key>` lines).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.keys = set()
+        self.pending = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    line = line.strip()
+                    if line.startswith('?'):
+                        self.pending.add(line[1:])
+                    elif line:
+                        self.keys.add(line)
+        self.pending -= self.keys
+
+    def __contains__(self, key) -> bool:
+        return key in self.keys
+
+    def _write(self, lines: list) -> None:
+        if lines:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write('\n'.join(lines) + '\n')
+
+    def add(self, keys) -> None:
+        new = [key for key in keys if key not in self.keys]
+        self._write(new)
+        self.keys.update(new)
+        self.pending.difference_update(new)
+
+    def begin(self, keys) -> None:
+        """
+        Records `keys` as pending, before their items are written.
+        """
+        new = [key for key in keys if key not in self.keys and key not in self.pending]
+        self._write(['?' + key for key in new])
+        self.pending.update(new)
+
+    def clear_pending(self) -> None:
+        """
+        Forgets the pending keys, once their items were removed.
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.writelines(key + '\n' for key in sorted(self.keys))
+        os.replace(tmp_path, self.path)
+        self.pending = set()
+
+
+def discover(paths: list) -> list:
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for directory, _, names in os.walk(path):
+            files.extend(
+                os.path.join(directory, name) for name in sorted(names)
+                if name.lower().endswith(('.xml', '.csv'))
+            )
+    return files
+
+
+class Ingestor:
+    def __init__(self, store: FiscalStore, workers: int = None, batch_size: int = 200_000) -> None:
+        self.store = store
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.ledger = Ledger(os.path.join(store.root, '_chaves.txt'))
+        self._pending = []      # (path, batch) not written yet
+        self._pending_rows = 0
+        self._keyless = {}      # file being read -> its batches of rows without a key
+        self._owners = {}       # key -> file it is loaded from in this run
+        self._unrecorded = {}   # file being read -> keys written, for the ledger
+        self._written = set()   # keys written in this run
+        self._finished = set()
+        self.stats = {'arquivos': 0, 'ignorados': 0, 'notas': 0, 'itens': 0}
+
+    def _already_loaded(self, path: str) -> bool:
+        # NF-e files are usually named after their access key
+        match = KEY_PATTERN.search(os.path.basename(path))
+        return bool(match) and match.group(0) in self.ledger
+
+    def _collect(self, path: str, batch) -> None:
+        """
+        Queues the rows of `batch` whose key is not loaded yet. Batches of
+        one file share keys (the file hash, a note's items), so a key is
+        only taken as loaded when it came from a previous run or another
+        file. Rows without a key are always kept, but held until their file
+        is complete: nothing could remove them if it failed.
+        """
+        keyless = pc.is_null(batch.column(KEY_COLUMN))
+        if pc.any(keyless).as_py():
+            self._keyless.setdefault(path, []).append(batch.filter(keyless))
+            batch = batch.filter(pc.invert(keyless))
+        keys = [key for key in pc.unique(batch.column(KEY_COLUMN)).to_pylist() if key]
+        loaded = [
+            key for key in keys
+            if self._owners.get(key, path) != path or (key not in self._owners and key in self.ledger)
+        ]
+        if loaded:
+            batch = batch.filter(pc.invert(pc.is_in(batch.column(KEY_COLUMN), value_set=pa.array(loaded, pa.string()))))
+        if batch.num_rows == 0:
+            return
+        for key in keys:
+            self._owners.setdefault(key, path)
+        self._queue(path, batch)
+
+    def _queue(self, path: str, batch) -> None:
+        self._pending.append((path, batch))
+        self._pending_rows += batch.num_rows
+        if self._pending_rows >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        table = pa.Table.from_batches([batch for _, batch in self._pending], schema=ROW_SCHEMA)
+        self._pending, self._pending_rows = [], 0
+
+        keys = [key for key in pc.unique(table[KEY_COLUMN]).to_pylist() if key]
+        # Pending while written: if the run dies before they are recorded,
+        # the next one removes their items before loading them again
+        self.ledger.begin(keys)
+        self.store.append(table)
+        # Recorded only for files read to the end
+        recorded = []
+        for key in keys:
+            path = self._owners[key]
+            if path in self._finished:
+                recorded.append(key)
+            else:
+                self._unrecorded.setdefault(path, set()).add(key)
+        self.ledger.add(recorded)
+        # A note's items may span two writes
+        self.stats['notas'] += len(set(keys) - self._written)
+        self._written.update(keys)
+        self.stats['itens'] += table.num_rows
+
+    def _finish(self, path: str, error: str) -> None:
+        if error is not None:
+            print(f"Falha ao ler arquivo {path}: {error}", file=sys.stderr)
+            # What was not written yet of the file is dropped and what was
+            # written is removed; its keys stay out of the ledger, so the
+            # next run reads it again
+            dropped = [batch for owner, batch in self._pending if owner == path]
+            self._pending = [(owner, batch) for owner, batch in self._pending if owner != path]
+            self._pending_rows -= sum(batch.num_rows for batch in dropped)
+            self._keyless.pop(path, None)
+            written = self._unrecorded.pop(path, set())
+            if written:
+                self.stats['itens'] -= self.store.delete_keys(written).num_rows
+                self.stats['notas'] -= len(written & self._written)
+                self._written -= written
+            self._owners = {key: owner for key, owner in self._owners.items() if owner != path}
+            return
+        self.stats['arquivos'] += 1
+        self._finished.add(path)
+        self.ledger.add(sorted(self._unrecorded.pop(path, ())))
+        for batch in self._keyless.pop(path, ()):
+            self._queue(path, batch)
+
+    def _recover(self) -> None:
+        # Items of keys a killed run wrote but never recorded
+        if not self.ledger.pending:
+            return
+        removed = self.store.delete_keys(self.ledger.pending)
+        if removed.num_rows:
+            print(f"{removed.num_rows} itens de arquivos incompletos removidos", file=sys.stderr)
+        self.ledger.clear_pending()
+
+    def run(self, paths: list) -> dict:
+        self._recover()
+        files = []
+        for path in discover(paths):
+            if self._already_loaded(path):
+                self.stats['ignorados'] += 1
+            else:
+                files.append(path)
+
+        context = multiprocessing.get_context()
+        # Bounded, so workers wait while the parent writes
+        batches = context.Queue(maxsize=self.workers * 2)
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                 initializer=_start_worker, initargs=(batches,)) as executor:
+            futures = {executor.submit(parse_file, path): path for path in files}
+            reading = set(files)
+            while reading:
+                try:
+                    path, batch, error = batches.get(timeout=1.0)
+                except queue.Empty:
+                    # A worker that died (out of memory, killed) never reports
+                    for future, path in futures.items():
+                        if path in reading and future.done() and future.exception() is not None:
+                            reading.discard(path)
+                            self._finish(path, repr(future.exception()))
+                    continue
+                if batch is not None:
+                    if path in reading:
+                        self._collect(path, batch)
+                    continue
+                reading.discard(path)
+                self._finish(path, error)
+        self.flush()
+        return self.stats
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Carrega NF-e (XML) e exportações CSV na base fiscal.')
+    parser.add_argument('paths', nargs='+', help='Arquivos ou diretórios a carregar')
+    parser.add_argument('--store', default='data/notas', help='Diretório da base fiscal')
+    parser.add_argument('--workers', type=int, default=None, help='Processos de leitura (padrão: núcleos da CPU)')
+    parser.add_argument('--batch-size', type=int, default=200_000, help='Itens por lote gravado')
+    args = parser.parse_args(argv)
+
+    store = FiscalStore(args.store)
+    store.cube = FiscalCube(store)
+
+    started = time.perf_counter()
+    stats = Ingestor(store, args.workers, args.batch_size).run(args.paths)
+    elapsed = time.perf_counter() - started
+    print(f"{stats['arquivos']} arquivos lidos, {stats['ignorados']} já carregados, "
+          f"{stats['notas']} notas e {stats['itens']} itens gravados em {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+Rule-based parser for the common shapes of fiscal questions, answered
+without a Gemini round trip:
+
+    "Quanto de ICMS paguei em 2024?"
+    "Total de PIS e COFINS em março de 2024 em SP"
+    "ICMS ST nas últimas duas semanas no município de Campinas"
+
+`parse_intent` returns the same argument dict Gemini would send to
+`extrair_parametros_notas_fiscais`, with relative periods resolved from the
+current date as the system instruction asks. It only answers when it is
+sure: exactly one period, at least one known tax, and nothing else but
+the filler words of `FILLER` once the taxes, period, state and city are
+taken out. Any other word may be a filter, grouping or listing the parser
+does not know, so the question returns None and goes to Gemini.
+"""
+import re
+import unicodedata
+from datetime import date, timedelta
+
+# Checked in order against the normalized message; 'icms st' before 'icms'
+TAXES = [
+    (r'\bicms[\s-]*st\b|\bsubstituicao tributaria\b', 'vl_icms_st'),
+    (r'\bicms\b(?![\s-]*st\b)', 'vl_icms'),
+    (r'\bpis\b', 'imposto_pis_vpis'),
+    (r'\bcofins\b', 'imposto_cofins_vcofins'),
+    (r'\bipi\b', 'imposto_ipi_vipi'),
+    (r'\bfcp\b|\bfundo de combate a pobreza\b', 'vfcp'),
+]
+
+# The only words (normalized) a question may have besides the taxes, period,
+# state and city; any other word is a filter the parser does not read
+FILLER = {
+    'a', 'as', 'o', 'os', 'ao', 'aos', 'de', 'do', 'da', 'dos', 'das', 'em', 'no', 'na', 'nos', 'nas',
+    'e', 'para', 'que', 'eu', 'me', 'meu', 'minha', 'meus', 'minhas', 'nosso', 'nossa', 'nossos', 'nossas',
+    'quanto', 'quanta', 'quantos', 'quantas', 'qual', 'foi', 'foram', 'deu', 'ficou', 'houve',
+    'total', 'totais', 'valor', 'valores', 'soma', 'somatorio', 'montante',
+    'imposto', 'impostos', 'tributo', 'tributos', 'nota', 'notas', 'fiscal', 'fiscais',
+    'paguei', 'pagamos', 'pagou', 'pagaram', 'pago', 'paga', 'pagos', 'pagas', 'pagar',
+    'recolhi', 'recolhemos', 'recolheu', 'recolhido', 'recolhida', 'recolhidos', 'recolhidas', 'recolher',
+    'gastei', 'gastamos', 'tive', 'tivemos', 'teve', 'tenho', 'temos',
+    'diga', 'informe', 'gostaria', 'saber', 'quero', 'preciso', 'favor', 'periodo', 'ano',
+}
+
+# Filler only once a state was recognized ("no estado de SP", "UF BA")
+STATE_FILLER = {'estado', 'uf'}
+
+MONTHS = {
+    'janeiro': 1, 'fevereiro': 2, 'marco': 3, 'abril': 4, 'maio': 5, 'junho': 6,
+    'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12,
+}
+
+NUMBERS = {
+    'um': 1, 'uma': 1, 'dois': 2, 'duas': 2, 'tres': 3, 'quatro': 4, 'cinco': 5,
+    'seis': 6, 'sete': 7, 'oito': 8, 'nove': 9, 'dez': 10, 'doze': 12, 'quinze': 15, 'trinta': 30,
+}
+
+UFS = {
+    'AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MT', 'MS', 'MG', 'PA',
+    'PB', 'PR', 'PE', 'PI', 'RJ', 'RN', 'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO',
+}
+
+STATES = {
+    'acre': 'AC', 'alagoas': 'AL', 'amapa': 'AP', 'amazonas': 'AM', 'bahia': 'BA',
+    'ceara': 'CE', 'distrito federal': 'DF', 'espirito santo': 'ES', 'goias': 'GO',
+    'maranhao': 'MA', 'mato grosso do sul': 'MS', 'mato grosso': 'MT', 'minas gerais': 'MG',
+    'para': 'PA', 'paraiba': 'PB', 'parana': 'PR', 'pernambuco': 'PE', 'piaui': 'PI',
+    'rio de janeiro': 'RJ', 'rio grande do norte': 'RN', 'rio grande do sul': 'RS',
+    'rondonia': 'RO', 'roraima': 'RR', 'santa catarina': 'SC', 'sao paulo': 'SP',
+    'sergipe': 'SE', 'tocantins': 'TO',
+}
+
+_MONTH_NAMES = '|'.join(MONTHS)
+_COUNT = r'(\d+|' + '|'.join(NUMBERS) + r')'
+_THIS = r'(?:este|neste|esse|nesse|deste|desse|do)'
+
+# Longer expressions first: a month followed by a year is one period, not two
+PERIODS = [
+    ('month_year', re.compile(rf'\b({_MONTH_NAMES})\s+(?:de\s+|do\s+ano\s+de\s+)?(\d{{4}})\b')),
+    ('month_number', re.compile(r'\b(\d{1,2})/(\d{4})\b')),
+    ('last_n', re.compile(rf'\bultim[oa]s\s+{_COUNT}\s+(dias|semanas|meses)\b')),
+    ('last_one', re.compile(r'\bultim[oa]\s+(dia|semana)\b|\bsemana\s+passada\b')),
+    ('last_month', re.compile(r'\bmes\s+(?:passado|anterior)\b|\bultimo\s+mes\b')),
+    ('last_year', re.compile(r'\bano\s+(?:passado|anterior)\b')),
+    ('this_month', re.compile(rf'\b{_THIS}\s+mes\b|\bmes\s+atual\b')),
+    ('this_year', re.compile(rf'\b{_THIS}\s+ano\b|\bano\s+atual\b')),
+    ('today', re.compile(r'\bhoje\b')),
+    ('yesterday', re.compile(r'\bontem\b')),
+    ('month', re.compile(rf'\b({_MONTH_NAMES})\b')),
+    ('year', re.compile(r'\b((?:19|20)\d{2})\b')),
+]
+
+UF_PATTERN = re.compile(r'\b([A-Z]{2})\b')
+_STATE_NAMES = sorted(STATES, key=len, reverse=True)
+STATE_PATTERN = re.compile(r'\bestado\s+d[eoa]\s+(' + '|'.join(_STATE_NAMES) + r')\b')
+# Without "estado de", 'para' (Pará) is the preposition unless it is accented
+BARE_STATE_PATTERN = re.compile(r'\b(' + '|'.join(name for name in _STATE_NAMES if name != 'para') + r')\b')
+PARA_PATTERN = re.compile(r'\bpará\b')
+CITY_PATTERN = re.compile(
+    r'\b(?:munic[íi]pio|cidade)\s+de\s+([A-ZÀ-Ý][\wÀ-ÿ\'-]*(?:\s+(?:d[aeo]s?\s+)?[A-ZÀ-Ý][\wÀ-ÿ\'-]*)*)'
+)
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercase without accents, so patterns match 'março' and 'marco' alike.
+    """
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def month_range(year: int, month: int) -> tuple:
+    first = date(year, month, 1)
+    following = date(year + month // 12, month % 12 + 1, 1)
+    return first, following - timedelta(days=1)
+
+
+def months_before(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 - months
+    year, month = divmod(index, 12)
+    last = month_range(year, month + 1)[1].day
+    return date(year, month + 1, min(day.day, last))
+
+
+def resolve_period(kind: str, match, today: date):
+    if kind == 'month_year':
+        return month_range(int(match.group(2)), MONTHS[match.group(1)])
+    if kind == 'month_number':
+        month, year = int(match.group(1)), int(match.group(2))
+        return month_range(year, month) if 1 <= month <= 12 else None
+    if kind == 'last_n':
+        count = match.group(1)
+        count = int(count) if count.isdigit() else NUMBERS[count]
+        unit = match.group(2)
+        if unit == 'meses':
+            return months_before(today, count), today
+        return today - timedelta(days=count * (7 if unit == 'semanas' else 1)), today
+    if kind == 'last_one':
+        days = 1 if match.group(1) == 'dia' else 7
+        return today - timedelta(days=days), today
+    if kind == 'last_month':
+        year, month = divmod(today.year * 12 + today.month - 2, 12)
+        return month_range(year, month + 1)
+    if kind == 'last_year':
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+    if kind == 'this_month':
+        return today.replace(day=1), today
+    if kind == 'this_year':
+        return today.replace(month=1, day=1), today
+    if kind == 'today':
+        return today, today
+    if kind == 'yesterday':
+        yesterday = today - timedelta(days=1)
+        return yesterday, yesterday
+    if kind == 'month':
+        # A month without a year is only unambiguous up to the current month
+        month = MONTHS[match.group(1)]
+        return month_range(today.year, month) if month <= today.month else None
+    if kind == 'year':
+        return date(int(match.group(1)), 1, 1), date(int(match.group(1)), 12, 31)
+    return None
+
+
+def find_period(text: str, today: date):
+    """
+    Returns ((ini, fin), text with the period removed), or None unless the
+    text has exactly one period.
+    """
+    found = []
+    for kind, pattern in PERIODS:
+        for match in pattern.finditer(text):
+            found.append(resolve_period(kind, match, today))
+        text = pattern.sub(' ', text)
+    if len(found) != 1 or found[0] is None:
+        return None
+    return found[0], text
+
+
+def find_uf(message: str, normalized: str):
+    """
+    Returns the UF named by sigla or by name ("Minas Gerais", "estado de Sao
+    Paulo"), None when there is none and False when more than one is named.
+    """
+    ufs = {match.group(1) for match in UF_PATTERN.finditer(message) if match.group(1) in UFS}
+    ufs |= {STATES[match.group(1)] for match in STATE_PATTERN.finditer(normalized)}
+    ufs |= {STATES[match.group(1)] for match in BARE_STATE_PATTERN.finditer(normalized)}
+    if PARA_PATTERN.search(message.lower()):
+        ufs.add('PA')
+    if len(ufs) > 1:
+        return False
+    return next(iter(ufs), None)
+
+
+def remove_uf(normalized: str, uf: str) -> str:
+    names = [name for name, sigla in STATES.items() if sigla == uf]
+    normalized = STATE_PATTERN.sub(' ', normalized)
+    for name in names:
+        normalized = re.sub(rf'\b{name}\b', ' ', normalized)
+    return re.sub(rf'\b{uf.lower()}\b', ' ', normalized)
+
+
+def parse_intent(message: str, today: date = None):
+    """
+    Returns the `extrair_parametros_notas_fiscais` arguments for `message`, or
+    None when the question has to go to Gemini.
+    """
+    today = today or date.today()
+    args = {}
+
+    city = CITY_PATTERN.search(message)
+    if city:
+        args['nome_mun_destinatario'] = city.group(1)
+        message = message[:city.start()] + ' ' + message[city.end():]
+
+    normalized = normalize(message)
+    uf = find_uf(message, normalized)
+    if uf is False:
+        return None
+    if uf:
+        args['uf_destinatario'] = uf
+        normalized = remove_uf(normalized, uf)
+
+    for pattern, column in TAXES:
+        if re.search(pattern, normalized):
+            args[column] = 0
+            normalized = re.sub(pattern, ' ', normalized)
+    if not any(column in args for _, column in TAXES):
+        return None
+
+    period = find_period(normalized, today)
+    if period is None:
+        return None
+    (ini, fin), normalized = period
+    args['id_dt_ini'] = ini.isoformat()
+    args['id_dt_fin'] = fin.isoformat()
+
+    filler = FILLER | STATE_FILLER if uf else FILLER
+    if any(word not in filler for word in re.findall(r'\w+', normalized)):
+        return None
+    return args
@@ -0,0 +1,137 @@
+"""
+Client-side quota handling for the Gemini API.
+
+`RateLimiter` keeps one token bucket for requests per minute and one for
+tokens per minute, so a call only waits when the provider quota is actually
+used up.
+
+The quota belongs to the API key, not to the process: under gunicorn the
+workers pass a shared `state_dir` and their buckets live in files there
+(`SharedTokenBucket`), so N workers still send at most the configured RPM
+and TPM together.
+"""
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float, clock=time.monotonic) -> None:
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.clock = clock
+        self.level = float(capacity)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _state(self):
+        """
+        Held while `level` and `updated` are read and changed.
+        """
+        return self._lock
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated)
+        self.level = min(self.capacity, self.level + elapsed * self.refill_per_second)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` from the bucket, possibly going into debt, and returns
+        how many seconds the caller must wait before using it.
+        """
+        amount = min(float(amount), self.capacity)
+        with self._state():
+            self._refill(self.clock())
+            self.level -= amount
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.refill_per_second
+
+    def give_back(self, amount: float) -> None:
+        with self._state():
+            self._refill(self.clock())
+            self.level = min(self.capacity, self.level + amount)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    A `TokenBucket` whose level is kept in `path`, shared by every process
+    that opens the same file. Each update holds an exclusive `flock`; the
+    default clock (CLOCK_MONOTONIC) is the same for all processes of a host.
+    """
+
+    FORMAT = struct.Struct('dd')  # level, updated
+
+    def __init__(self, path: str, capacity: float, refill_per_second: float, clock=time.monotonic) -> None:
+        super().__init__(capacity, refill_per_second, clock)
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    @contextmanager
+    def _state(self):
+        # flock does not exclude the threads of one process sharing the fd
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(self._fd, self.FORMAT.size, 0)
+                if len(data) == self.FORMAT.size:
+                    self.level, self.updated = self.FORMAT.unpack(data)
+                yield
+                os.pwrite(self._fd, self.FORMAT.pack(self.level, self.updated), 0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for the provider's RPM and TPM quotas.
+
+    Prompt tokens are estimated before the call (about 4 characters per token)
+    and reconciled with the real usage reported in the response. With
+    `state_dir`, the buckets are shared with the other processes using it.
+    """
+
+    def __init__(self, rpm: int = 10, tpm: int = 4_000_000, clock=time.monotonic, sleep=time.sleep,
+                 state_dir: str = None) -> None:
+        if state_dir and fcntl is not None:
+            self.requests = SharedTokenBucket(os.path.join(state_dir, 'rpm'), rpm, rpm / 60.0, clock)
+            self.tokens = SharedTokenBucket(os.path.join(state_dir, 'tpm'), tpm, tpm / 60.0, clock)
+        else:
+            self.requests = TokenBucket(rpm, rpm / 60.0, clock)
+            self.tokens = TokenBucket(tpm, tpm / 60.0, clock)
+        self.sleep = sleep
+        self.waited = 0.0
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """
+        Blocks until one request and `estimated_tokens` fit in the quota and
+        returns the time spent waiting.
+        """
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            self.sleep(wait)
+            self.waited += wait
+        return wait
+
+    def record(self, estimated_tokens: int, used_tokens: int) -> None:
+        """
+        Corrects the TPM bucket once the response reports its token usage.
+        """
+        difference = used_tokens - estimated_tokens
+        if difference > 0:
+            self.tokens.reserve(difference)
+        elif difference < 0:
+            self.tokens.give_back(-difference)
+
@@ -0,0 +1,125 @@
+"""
+Result cache for `extrair_parametros_notas_fiscais` calls.
+
+Questions phrased differently often end up with the same arguments once
+dates, CNPJs and UFs are normalized, so results are keyed on the
+canonicalized argument set. Entries expire after `ttl` seconds, the least
+recently used ones are dropped beyond `max_entries`, and entries overlapping
+the period and CNPJ of newly ingested notes are invalidated.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from server.fiscal_store import (
+    MEASURES, RATE_FILTERS, TEXT_FILTERS, UPPER_FILTERS, normalize_text, parse_date, to_int,
+)
+
+
+def canonicalize(args: dict) -> tuple:
+    """
+    Normalizes function-call arguments into a hashable key: ISO dates,
+    integer CNPJs, digit-only CPF, UF and text as `normalize_text` leaves
+    them, and measures reduced to their presence.
+    """
+    items = []
+    for key, value in args.items():
+        if value is None or value == '':
+            continue
+        if key in MEASURES:
+            value = True
+        elif key in ('id_dt_ini', 'id_dt_fin'):
+            value = parse_date(value).isoformat()
+        elif key in ('id_cnpj', 'cnpj_destinatario'):
+            value = to_int(value)
+        elif key == 'cpf_destinatario':
+            value = ''.join(filter(str.isdigit, str(value)))
+        elif key in UPPER_FILTERS or key in TEXT_FILTERS:
+            value = normalize_text(value)
+        elif key in RATE_FILTERS:
+            value = float(value)
+        items.append((key, value))
+    return tuple(sorted(items))
+
+
+class ResultCache:
+    def __init__(self, store, max_entries: int = 1024, ttl: float = 3600, clock=time.monotonic) -> None:
+        self.store = store
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Appends that happened before the cache existed are irrelevant
+        _, self._offset = store.read_appends(0)
+        self._version = store.version()
+
+    def _sync(self) -> None:
+        version = self.store.version()
+        if version == self._version:
+            return
+        self._version = version
+        entries, self._offset = self.store.read_appends(self._offset)
+        for entry in entries:
+            self._invalidate(parse_date(entry['ini']), parse_date(entry['fin']), set(entry['cnpjs']))
+
+    def get(self, args: dict):
+        key = canonicalize(args)
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, args: dict, result) -> None:
+        key = canonicalize(args)
+        params = dict(key)
+        ini = parse_date(params['id_dt_ini']) if 'id_dt_ini' in params else None
+        fin = parse_date(params['id_dt_fin']) if 'id_dt_fin' in params else None
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, result, ini, fin, params.get('id_cnpj'))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, ini, fin, cnpjs=None) -> int:
+        """
+        Drops the entries whose period overlaps [ini, fin] and whose CNPJ is in
+        `cnpjs` (entries without a CNPJ filter always match).
+        """
+        with self._lock:
+            return self._invalidate(parse_date(ini), parse_date(fin), cnpjs)
+
+    def _invalidate(self, ini, fin, cnpjs) -> int:
+        stale = []
+        for key, (_, _, entry_ini, entry_fin, entry_cnpj) in self._entries.items():
+            if entry_ini is not None and entry_ini > fin:
+                continue
+            if entry_fin is not None and entry_fin < ini:
+                continue
+            if cnpjs and entry_cnpj is not None and entry_cnpj not in cnpjs:
+                continue
+            stale.append(key)
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self._entries),
+            'invalidations': self.invalidations,
+        }
@@ -1,13 +1,15 @@
 from server.app     import app
-from server.website import Website
-from server.backend import Backend_Api
+from appkit.serving import serve
 
 from json import load
 
-if __name__ == '__main__':
-    config = load(open('config.json', 'r'))
-    site_config = config['site_config']
-    
+
+def create_app(config: dict, **backend_options):
+    # Imported here so gunicorn workers load the backend (and its network
+    # clients) only after gevent has patched the standard library
+    from server.website import Website
+    from server.backend import Backend_Api
+
     site = Website(app)
     for route in site.routes:
         app.add_url_rule(
@@ -16,7 +18,7 @@ if __name__ == '__main__':
             methods   = site.routes[route]['methods'],
         )
 
-    backend_api  = Backend_Api(app, config)
+    backend_api  = Backend_Api(app, config, **backend_options)
     for route in backend_api.routes:
         app.add_url_rule(
             route,
@@ -24,6 +26,13 @@ if __name__ == '__main__':
             methods   = backend_api.routes[route]['methods'],
         )
 
+    return app
+
+
+if __name__ == '__main__':
+    config = load(open('config.json', 'r'))
+    site_config = config['site_config']
+
     print(f"Running on port {site_config['port']}")
-    app.run(**site_config)
+    serve(lambda: create_app(config), site_config)
     print(f"Closing port {site_config['port']}")
@@ -1,11 +1,17 @@
-from flask import render_template, send_file, redirect
+from flask import render_template, redirect
 from time import time
-from os import urandom
+from os import path, urandom
+
+from appkit.assets import AssetRegistry
+
+CLIENT_DIR = path.abspath(path.join(path.dirname(__file__), '..', 'client'))
 
 
 class Website:
     def __init__(self, app) -> None:
         self.app = app
+        self.assets = AssetRegistry(CLIENT_DIR)
+        app.jinja_env.globals['asset_url'] = self.assets.url
         self.routes = {
             '/': {
                 'function': lambda: redirect('/chat'),
@@ -21,7 +27,7 @@ class Website:
             },
             '/assets/<folder>/<file>': {
                 'function': self._assets,
-                'methods': ['GET', 'POST']
+                'methods': ['GET']
             }
         }
 
@@ -35,7 +41,4 @@ class Website:
         return render_template('index.html', chat_id=f'{urandom(4).hex()}-{urandom(2).hex()}-{urandom(2).hex()}-{urandom(2).hex()}-{hex(int(time() * 1000))[2:]}')
 
     def _assets(self, folder: str, file: str):
-        try:
-            return send_file(f"./../client/{folder}/{file}", as_attachment=False)
-        except:
-            return "File not found", 404
+        return self.assets.response(folder, file)
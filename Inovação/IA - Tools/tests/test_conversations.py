@@ -0,0 +1,80 @@
+from server.conversations import SUMMARY_ACK, SUMMARY_PROMPT, ConversationStore, estimate_tokens, summarize
+
+
+class Clock:
+    now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_append_and_load_history(tmp_path):
+    store = ConversationStore(str(tmp_path / 'conversas.sqlite3'))
+    store.append('a', 'Qual o ICMS de janeiro?', 'R$ 10,00')
+    store.append('b', 'Outra conversa', 'Ok')
+    store.append('a', 'E de fevereiro?', 'R$ 12,00')
+
+    assert store.history('a') == [
+        {'role': 'user', 'parts': ['Qual o ICMS de janeiro?']},
+        {'role': 'model', 'parts': ['R$ 10,00']},
+        {'role': 'user', 'parts': ['E de fevereiro?']},
+        {'role': 'model', 'parts': ['R$ 12,00']},
+    ]
+    assert store.history('') == [] and store.history('nenhuma') == []
+    # Persisted: a new process reads the same history
+    assert ConversationStore(store.path).history('b')[0] == {'role': 'user', 'parts': ['Outra conversa']}
+
+
+def test_history_stays_within_the_token_budget(tmp_path):
+    store = ConversationStore(str(tmp_path / 'conversas.sqlite3'), history_tokens=200, summary_tokens=60, turn_tokens=50)
+    for i in range(20):
+        store.append('a', f'Pergunta {i} ' + 'x' * 100, f'Resposta {i} ' + 'y' * 400)
+
+    history = store.history('a')
+    tokens = sum(estimate_tokens(part) for turn in history for part in turn['parts'])
+    assert tokens <= 200 + estimate_tokens(SUMMARY_PROMPT + SUMMARY_ACK)
+    # Turns are clipped to `turn_tokens`, and the last exchange is kept verbatim
+    assert history[-2]['parts'][0].startswith('Pergunta 19')
+    assert history[-1]['parts'][0].endswith('…') and len(history[-1]['parts'][0]) <= 50 * 4
+    assert len(history) % 2 == 0 and [turn['role'] for turn in history[::2]] == ['user'] * (len(history) // 2)
+
+
+def test_oldest_exchanges_are_rolled_into_a_summary(tmp_path):
+    store = ConversationStore(str(tmp_path / 'conversas.sqlite3'), history_tokens=120, summary_tokens=40)
+    for i in range(6):
+        store.append('a', f'Pergunta {i} ' + 'x' * 80, f'Resposta {i}')
+
+    history = store.history('a')
+    summary = history[0]['parts'][0]
+    assert summary.startswith(SUMMARY_PROMPT)
+    assert history[1] == {'role': 'model', 'parts': [SUMMARY_ACK]}
+    assert '- Usuário: Pergunta' in summary
+    assert estimate_tokens(summary[len(SUMMARY_PROMPT):]) <= 40
+    # Rolled turns are deleted; the ones kept follow the summary
+    kept = [turn['parts'][0] for turn in history[2::2]]
+    assert kept and kept[-1].startswith('Pergunta 5')
+    assert not any(text.startswith('Pergunta 0') for text in kept)
+
+
+def test_summarize_drops_the_oldest_exchanges_first():
+    summary = ''
+    for i in range(10):
+        summary = summarize(summary, [('user', f'Pergunta {i}'), ('model', f'Resposta {i}')], max_tokens=20)
+    lines = summary.splitlines()
+    assert lines[-2:] == ['- Usuário: Pergunta 9', '- Assistente: Resposta 9']
+    assert '- Usuário: Pergunta 0' not in lines
+    assert estimate_tokens(summary) <= 20
+    assert summarize('', [('user', 'Oi,\n  tudo bem?'), ('model', 'z' * 400)], 100) == \
+        '- Usuário: Oi, tudo bem?\n- Assistente: ' + 'z' * 159 + '…'
+
+
+def test_expire_removes_idle_conversations(tmp_path):
+    clock = Clock()
+    store = ConversationStore(str(tmp_path / 'conversas.sqlite3'), clock=clock)
+    store.append('velha', 'Oi', 'Olá')
+    clock.now += 3600
+    store.append('nova', 'Oi', 'Olá')
+
+    assert store.expire(1800) == 1
+    assert store.history('velha') == []
+    assert store.history('nova') != []
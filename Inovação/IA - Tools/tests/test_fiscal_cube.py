@@ -0,0 +1,93 @@
+import datetime
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from server import fiscal_cube
+from server.fiscal_cube import FiscalCube
+from server.fiscal_store import FiscalStore
+
+
+def items():
+    return [
+        {'id_dt_ini': datetime.date(2024, month, 10), 'id_dt_fin': datetime.date(2024, month, 10),
+         'id_cnpj': 12345678000190, 'uf_destinatario': uf, 'tipo': 'Revenda', 'vl_item': 100.0, 'vl_icms': 18.0}
+        for month in (1, 2, 3) for uf in ('SP', 'RJ')
+    ]
+
+
+def open_cube(root: str, log: str) -> None:
+    rebuild = FiscalCube._rebuild
+
+    def slow_rebuild(self, store):
+        with open(log, 'a') as file:
+            file.write(f'{os.getpid()}\n')
+        time.sleep(0.2)  # the other workers start meanwhile
+        rebuild(self, store)
+
+    FiscalCube._rebuild = slow_rebuild
+    cube = FiscalCube(FiscalStore(root))
+    assert len(cube.cells) == 6
+
+
+@pytest.mark.skipif(fiscal_cube.fcntl is None or not hasattr(os, 'fork'), reason='needs flock and fork')
+def test_workers_starting_together_build_the_cube_once(tmp_path):
+    root = str(tmp_path / 'notas')
+    FiscalStore(root).append(items())
+    log = str(tmp_path / 'rebuilds.txt')
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=open_cube, args=(root, log)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert [worker.exitcode for worker in workers] == [0] * 4
+    with open(log) as file:
+        assert len(file.readlines()) == 1
+    assert sorted(name for name in os.listdir(root) if name.startswith('_cube')) == [
+        '_cube.2024-01.parquet', '_cube.2024-02.parquet', '_cube.2024-03.parquet', '_cube.built', '_cube.lock',
+    ]
+
+
+def test_update_folds_appended_items(tmp_path):
+    store = FiscalStore(str(tmp_path / 'notas'))
+    store.append(items())
+    store.cube = FiscalCube(store)
+    store.append(items()[:2])
+
+    reopened = FiscalCube(FiscalStore(store.root))
+    assert reopened.cells == store.cube.cells
+    assert sum(cell[0] for cell in reopened.cells.values()) == 8
+
+
+def test_update_rewrites_only_the_months_it_touches(tmp_path):
+    store = FiscalStore(str(tmp_path / 'notas'))
+    store.append(items())
+    store.cube = FiscalCube(store)
+    other = FiscalCube(FiscalStore(store.root))
+    before = {name: os.stat(os.path.join(store.root, name)).st_mtime_ns
+              for name in os.listdir(store.root) if name.endswith('.parquet')}
+
+    store.append([dict(items()[2], vl_icms=2.0)])  # February, SP
+    changed = [name for name, mtime in before.items() if os.stat(os.path.join(store.root, name)).st_mtime_ns != mtime]
+    assert changed == ['_cube.2024-02.parquet']
+
+    # Another process reloads the month it did not write
+    args = {'id_dt_ini': '2024-02-01', 'id_dt_fin': '2024-02-29', 'uf_destinatario': 'SP'}
+    assert other.aggregate(args, ['vl_icms']) == {'itens': 2, 'totais': {'vl_icms': 20.0}}
+    assert other.aggregate({'id_dt_ini': '2024-01-01', 'id_dt_fin': '2024-03-31'}, ['vl_icms'])['itens'] == 7
+
+
+def test_rebuild_replaces_a_single_file_cube(tmp_path):
+    store = FiscalStore(str(tmp_path / 'notas'))
+    store.append(items())
+    with open(os.path.join(store.root, '_cube.parquet'), 'wb'):
+        pass
+
+    cube = FiscalCube(store)
+    assert len(cube.cells) == 6
+    assert not os.path.exists(os.path.join(store.root, '_cube.parquet'))
@@ -0,0 +1,90 @@
+import datetime
+import os
+
+import pytest
+
+from server.fiscal_store import FiscalStore, build_filter
+
+
+def item(day, uf='SP', **fields):
+    return {'id_dt_ini': day, 'id_dt_fin': day, 'id_cnpj': 12345678000190, 'uf_destinatario': uf,
+            'tipo': 'Revenda', 'aliq_icms': 18.0, 'vl_item': 100.0, 'vl_icms': 18.0, **fields}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FiscalStore(str(tmp_path / 'notas'))
+    store.append([
+        item(datetime.date(2024, 1, 5)),
+        item(datetime.date(2024, 1, 20), uf=' rj '),
+        item(datetime.date(2024, 2, 10), id_cnpj=98765432000110, aliq_icms=12.0, vl_icms=12.0),
+        item(datetime.date(2024, 3, 1), tipo='Consumo', vl_item=50.0, vl_icms=9.0),
+    ])
+    return store
+
+
+def test_append_writes_month_and_uf_partitions(store):
+    partitions = sorted(
+        os.path.relpath(directory, store.root)
+        for directory, _, files in os.walk(store.root) if any(name.endswith('.parquet') for name in files)
+    )
+    assert partitions == [
+        'ano_mes=2024-01/uf_destinatario=RJ', 'ano_mes=2024-01/uf_destinatario=SP',
+        'ano_mes=2024-02/uf_destinatario=SP', 'ano_mes=2024-03/uf_destinatario=SP',
+    ]
+
+
+def test_filters_are_pushed_down(store):
+    def rows(**args):
+        return store.execute(args, max_rows=10)['itens']
+
+    assert rows(id_dt_ini='2024-01-01', id_dt_fin='2024-01-31') == 2
+    assert rows(id_dt_ini='10/01/2024', id_dt_fin='2024-02-10') == 2
+    assert rows(id_cnpj='98.765.432/0001-10') == 1
+    assert rows(id_cnpj=12345678000190.0, uf_destinatario='rj') == 1
+    assert rows(tipo=' consumo ') == 1
+    assert rows(aliq_icms=12) == 1
+    assert build_filter({}) is None
+
+    # The period bounds also restrict `ano_mes`, so other months are not opened
+    assert "ano_mes" in str(build_filter({'id_dt_ini': '2024-02-01'}))
+
+
+def test_aggregate_sums_the_requested_measures(store):
+    result = store.execute({'id_dt_ini': '2024-01-01', 'id_dt_fin': '2024-03-15', 'vl_icms': 0})
+    assert result == {'itens': 4, 'totais': {'vl_icms': pytest.approx(57.0)}}
+
+
+def test_append_bumps_version_and_logs_the_batch(store):
+    version = store.version()
+    entries, offset = store.read_appends()
+    assert entries == [{'ini': '2024-01-05', 'fin': '2024-03-01', 'cnpjs': [12345678000190, 98765432000110]}]
+
+    store.append([item(datetime.date(2024, 4, 2))])
+    assert store.version() != version
+    assert store.read_appends(offset)[0] == [{'ini': '2024-04-02', 'fin': '2024-04-02', 'cnpjs': [12345678000190]}]
+
+    # Another process sees the new files through `_VERSION`
+    assert FiscalStore(store.root).execute({'id_dt_ini': '2024-04-01'})['itens'] == 1
+    assert store.execute({'id_dt_ini': '2024-04-01'})['itens'] == 1
+
+
+def test_execute_uses_the_cube_for_whole_months(store):
+    calls = []
+
+    class Cube:
+        def covers(self, args):
+            return args['id_dt_ini'].endswith('-01')
+
+        def aggregate(self, args, measures):
+            calls.append(args)
+            return {'itens': 0, 'totais': {}}
+
+    store.cube = Cube()
+    store.execute({'id_dt_ini': '2024-01-01', 'id_dt_fin': '2024-01-31', 'vl_icms': 0})
+    assert len(calls) == 1
+    partial = store.execute({'id_dt_ini': '2024-01-10', 'id_dt_fin': '2024-01-31', 'vl_icms': 0})
+    assert len(calls) == 1 and partial['itens'] == 1
+    # Without measures the items are listed from the store
+    assert store.execute({'id_dt_ini': '2024-01-01', 'id_dt_fin': '2024-01-31'})['itens'] == 2
+    assert len(calls) == 1
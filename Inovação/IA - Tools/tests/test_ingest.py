@@ -0,0 +1,158 @@
+import pytest
+
+from server import ingest
+from server.fiscal_cube import FiscalCube
+from server.fiscal_store import FiscalStore
+
+NFE = '''<?xml version="1.0" encoding="UTF-8"?>
+<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe"><NFe>{notes}</NFe></nfeProc>'''
+
+NOTE = '''<infNFe Id="NFe{key}">
+  <ide><dhEmi>2024-03-{day:02d}T10:00:00-03:00</dhEmi></ide>
+  <emit><CNPJ>12.345.678/0001-90</CNPJ></emit>
+  <dest><CNPJ>98765432000110</CNPJ><xNome>Cliente</xNome><enderDest><xMun>Campinas</xMun><UF>SP</UF></enderDest></dest>
+  {items}
+</infNFe>'''
+
+ITEM = '''<det><prod><xProd>Item</xProd><CFOP>5102</CFOP><uCom>UN</uCom><vProd>10.00</vProd></prod>
+  <imposto><ICMS><ICMS00><pICMS>18</pICMS><vICMS>1.80</vICMS></ICMS00></ICMS></imposto></det>'''
+
+
+def key(number: int) -> str:
+    return f'{number:044d}'
+
+
+def write_xml(path, numbers, items=3):
+    notes = ''.join(NOTE.format(key=key(n), day=n % 28 + 1, items=ITEM * items) for n in numbers)
+    path.write_text(NFE.format(notes=notes), encoding='utf-8')
+
+
+def write_csv(path, rows, keys=None):
+    header = 'id_dt_ini;uf_destinatario;vl_item' + (';chave' if keys else '')
+    lines = [header]
+    for i in range(rows):
+        line = f'2024-04-{i % 28 + 1:02d};RJ;{i},50'
+        if keys:
+            line += f';{keys[i]}'
+        lines.append(line)
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    # Workers are forked, so they see the patched value
+    monkeypatch.setattr(ingest, 'PARSE_BATCH_ROWS', 4)
+
+
+def rows(store: FiscalStore) -> int:
+    return store.dataset.to_table().num_rows
+
+
+def test_parsers_yield_record_batches(tmp_path):
+    write_xml(tmp_path / 'notas.xml', range(5))
+    batches = list(ingest.parse_xml(str(tmp_path / 'notas.xml'), batch_rows=4))
+    # 3 items per note; notes are not split between batches
+    assert [batch.num_rows for batch in batches] == [6, 6, 3]
+    assert all(len(set(batch.column(ingest.KEY_COLUMN).to_pylist())) == 2 for batch in batches[:2])
+
+    write_csv(tmp_path / 'export.csv', 10)
+    assert [batch.num_rows for batch in ingest.parse_csv(str(tmp_path / 'export.csv'), batch_rows=4)] == [4, 4, 2]
+
+
+def test_ingest_streams_files_and_is_idempotent(tmp_path, small_batches):
+    source = tmp_path / 'notas'
+    source.mkdir()
+    write_xml(source / 'a.xml', range(0, 5))
+    write_xml(source / 'b.xml', range(3, 8))  # notes 3 and 4 repeated
+    # Keyed by the file hash: every batch of the file shares that key
+    write_csv(source / 'sem_chave.csv', 11)
+
+    store = FiscalStore(str(tmp_path / 'store'))
+    stats = ingest.Ingestor(store, workers=2, batch_size=5).run([str(source)])
+    assert stats['arquivos'] == 3
+    assert stats['itens'] == 8 * 3 + 11
+    assert rows(store) == 8 * 3 + 11
+
+    again = ingest.Ingestor(store, workers=2, batch_size=5).run([str(source)])
+    assert again['itens'] == 0
+    assert rows(store) == 8 * 3 + 11
+
+
+def test_rows_without_key_are_never_deduplicated(tmp_path, small_batches):
+    source = tmp_path / 'notas'
+    source.mkdir()
+    keys = [key(1), '', key(2), '', '', key(1), '', '', '', '']
+    write_csv(source / 'parcial.csv', len(keys), keys=keys)
+    write_csv(source / 'parcial2.csv', 4, keys=['', key(3), '', ''])
+
+    store = FiscalStore(str(tmp_path / 'store'))
+    stats = ingest.Ingestor(store, workers=1, batch_size=3).run([str(source)])
+    assert stats['itens'] == len(keys) + 4
+    assert stats['notas'] == 3
+    assert rows(store) == len(keys) + 4
+
+
+def test_unreadable_file_is_reported_and_not_recorded(tmp_path, capsys):
+    source = tmp_path / 'notas'
+    source.mkdir()
+    write_xml(source / 'ok.xml', range(2))
+    write_xml(source / 'quebrado.xml', range(10, 12))
+    (source / 'quebrado.xml').write_text((source / 'quebrado.xml').read_text()[:-40], encoding='utf-8')
+
+    store = FiscalStore(str(tmp_path / 'store'))
+    ingestor = ingest.Ingestor(store, workers=2)
+    stats = ingestor.run([str(source)])
+    assert stats['arquivos'] == 1
+    assert 'quebrado.xml' in capsys.readouterr().err
+    assert key(0) in ingestor.ledger and key(1) in ingestor.ledger
+    assert key(10) not in ingestor.ledger
+    assert rows(store) == 2 * 3
+
+
+def icms(store: FiscalStore) -> float:
+    return store.execute({'vl_icms': 1.0})['totais']['vl_icms']
+
+
+def test_file_failing_after_a_partial_write_is_loaded_once(tmp_path, small_batches, capsys):
+    source = tmp_path / 'notas'
+    source.mkdir()
+    write_xml(source / 'ok.xml', range(2))
+    write_xml(source / 'quebrado.xml', range(10, 16))
+    complete = (source / 'quebrado.xml').read_text()
+    (source / 'quebrado.xml').write_text(complete[:-40], encoding='utf-8')
+
+    store = FiscalStore(str(tmp_path / 'store'))
+    store.cube = FiscalCube(store)
+    # Every batch is written as soon as it arrives, before the file fails
+    stats = ingest.Ingestor(store, workers=1, batch_size=1).run([str(source)])
+    assert 'quebrado.xml' in capsys.readouterr().err
+    assert stats['itens'] == rows(store) == 2 * 3
+    assert stats['notas'] == 2
+
+    (source / 'quebrado.xml').write_text(complete, encoding='utf-8')
+    again = ingest.Ingestor(store, workers=1, batch_size=1).run([str(source)])
+    assert again['itens'] == rows(store) - 2 * 3 == 6 * 3
+    assert icms(store) == pytest.approx(8 * 3 * 1.8)
+    assert store.cube.aggregate({'id_dt_ini': '2024-03-01', 'id_dt_fin': '2024-03-31'}, ['vl_icms']) == \
+        {'itens': 8 * 3, 'totais': {'vl_icms': pytest.approx(8 * 3 * 1.8)}}
+
+
+def test_rows_left_by_a_killed_run_are_replaced(tmp_path, small_batches):
+    source = tmp_path / 'notas'
+    source.mkdir()
+    write_xml(source / 'a.xml', range(6))
+    path = str(source / 'a.xml')
+
+    store = FiscalStore(str(tmp_path / 'store'))
+    # Dies after writing some batches, before the file was recorded
+    killed = ingest.Ingestor(store, workers=1, batch_size=1)
+    for batch in list(ingest.parse_batches(path))[:2]:
+        killed._collect(path, batch)
+    assert rows(store) == 4 * 3
+    assert ingest.Ledger(killed.ledger.path).pending == {key(n) for n in range(4)}
+
+    stats = ingest.Ingestor(store, workers=1).run([str(source)])
+    assert stats['itens'] == rows(store) == 6 * 3
+    assert icms(store) == pytest.approx(6 * 3 * 1.8)
+    ledger = ingest.Ledger(killed.ledger.path)
+    assert ledger.pending == set() and ledger.keys == {key(n) for n in range(6)}
@@ -0,0 +1,47 @@
+from datetime import date
+
+import pytest
+
+from server.intent import parse_intent
+
+TODAY = date(2025, 6, 15)
+YEAR_2024 = {'id_dt_ini': '2024-01-01', 'id_dt_fin': '2024-12-31'}
+
+
+@pytest.mark.parametrize('message, expected', [
+    ('Quanto de ICMS paguei em 2024?', {'vl_icms': 0, **YEAR_2024}),
+    ('Total de PIS e COFINS em março de 2024 em SP', {
+        'uf_destinatario': 'SP', 'imposto_pis_vpis': 0, 'imposto_cofins_vcofins': 0,
+        'id_dt_ini': '2024-03-01', 'id_dt_fin': '2024-03-31',
+    }),
+    ('ICMS ST nas últimas duas semanas no município de Campinas', {
+        'nome_mun_destinatario': 'Campinas', 'vl_icms_st': 0, 'id_dt_ini': '2025-06-01', 'id_dt_fin': '2025-06-15',
+    }),
+    ('IPI em Minas Gerais em 2024', {'uf_destinatario': 'MG', 'imposto_ipi_vipi': 0, **YEAR_2024}),
+    ('ICMS em 2024 para a Bahia', {'uf_destinatario': 'BA', 'vl_icms': 0, **YEAR_2024}),
+    ('qual foi o ICMS de 2024 no Paraná', {'uf_destinatario': 'PR', 'vl_icms': 0, **YEAR_2024}),
+    ('ICMS em Sao Paulo em 2024', {'uf_destinatario': 'SP', 'vl_icms': 0, **YEAR_2024}),
+    ('ICMS no estado de SP em 2024', {'uf_destinatario': 'SP', 'vl_icms': 0, **YEAR_2024}),
+    ('ICMS no Pará em 2024', {'uf_destinatario': 'PA', 'vl_icms': 0, **YEAR_2024}),
+    ('ICMS em 2024 em Mato Grosso do Sul', {'uf_destinatario': 'MS', 'vl_icms': 0, **YEAR_2024}),
+])
+def test_answers_questions_it_reads_completely(message, expected):
+    assert parse_intent(message, TODAY) == expected
+
+
+@pytest.mark.parametrize('message', [
+    'ICMS 2024 de Belo Horizonte',
+    'ICMS de mercadorias importadas em 2024',
+    'ICMS das devoluções em 2024',
+    'ICMS de notas canceladas em 2024',
+    'ICMS da filial em 2024',
+    'ICMS em 2024 para revenda',
+    'ICMS por estado em 2024',
+    'ICMS em SP e MG em 2024',
+    'ICMS de 2023 e 2024',
+    'Quais notas tiveram ICMS em 2024?',
+    'Quanto paguei em 2024?',
+    'ICMS de setembro',
+])
+def test_unknown_words_go_to_gemini(message):
+    assert parse_intent(message, TODAY) is None
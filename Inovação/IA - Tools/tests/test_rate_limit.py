@@ -0,0 +1,77 @@
+import pytest
+
+from server.fakes import FakeGenerativeModel
+from server.rate_limit import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_bucket_refills_with_time(clock):
+    bucket = TokenBucket(10, 1.0, clock)
+    assert bucket.reserve(10) == 0
+    assert bucket.reserve(2) == pytest.approx(2.0)
+    clock.now += 5
+    assert bucket.level == pytest.approx(-2)  # refilled on the next call
+    assert bucket.reserve(3) == 0
+    assert bucket.level == pytest.approx(0)
+    clock.now += 60
+    bucket.reserve(0)
+    assert bucket.level == 10  # never above capacity
+
+
+def test_acquire_blocks_when_the_rpm_quota_is_used_up(clock):
+    limiter = RateLimiter(rpm=2, tpm=1_000_000, clock=clock, sleep=clock.sleep)
+    assert limiter.acquire(10) == 0
+    assert limiter.acquire(10) == 0
+    assert clock.slept == []
+    assert limiter.acquire(10) == pytest.approx(30.0)  # one request every 30 s
+    assert limiter.acquire(10) == pytest.approx(30.0)
+    assert clock.slept == pytest.approx([30.0, 30.0])
+    assert limiter.waited == pytest.approx(60.0)
+
+
+def test_tpm_accounts_for_the_usage_reported_by_the_model(clock):
+    model = FakeGenerativeModel(reply='Resposta simulada ' * 50, seed=0)
+    limiter = RateLimiter(rpm=1000, tpm=1000, clock=clock, sleep=clock.sleep)
+    message = 'Qual o total de notas fiscais emitidas em São Paulo em 2024?'
+
+    estimated = limiter.estimate_tokens(message)
+    assert limiter.acquire(estimated) == 0
+    response = model.start_chat().send_message(message)
+    used = response.usage_metadata.total_token_count
+    assert used > estimated  # the reply counts too
+    limiter.record(estimated, used)
+    assert limiter.tokens.level == pytest.approx(1000 - used)
+
+    # Overestimates are given back
+    limiter.acquire(500)
+    limiter.record(500, 100)
+    assert limiter.tokens.level == pytest.approx(1000 - used - 100)
+
+    # A prompt larger than what is left waits for the tokens to refill
+    wait = limiter.acquire(1000 - used)
+    assert wait == pytest.approx(100 / (1000 / 60))  # the 100 tokens missing
+
+
+def test_workers_sharing_a_state_dir_share_the_quota(tmp_path, clock):
+    workers = [RateLimiter(rpm=3, tpm=1_000_000, clock=clock, sleep=clock.sleep, state_dir=str(tmp_path))
+               for _ in range(2)]
+    assert [workers[i % 2].acquire(1) for i in range(3)] == [0, 0, 0]
+    assert workers[1].acquire(1) == pytest.approx(20.0)
+    assert workers[0].acquire(1) == pytest.approx(20.0)
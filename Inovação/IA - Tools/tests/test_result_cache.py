@@ -0,0 +1,87 @@
+import datetime
+
+from server.fiscal_store import FiscalStore
+from server.result_cache import ResultCache, canonicalize
+
+CNPJ = 12345678000190
+
+
+def item(day, cnpj=CNPJ, **fields):
+    return {'id_dt_ini': day, 'id_dt_fin': day, 'id_cnpj': cnpj, 'uf_destinatario': 'SP',
+            'vl_item': 100.0, 'vl_icms': 18.0, **fields}
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def january(**args):
+    return {'id_dt_ini': '2024-01-01', 'id_dt_fin': '2024-01-31', 'vl_icms': 1.0, **args}
+
+
+def test_equivalent_arguments_share_an_entry(tmp_path):
+    cache = ResultCache(FiscalStore(str(tmp_path)))
+    assert cache.get(january(id_cnpj='12.345.678/0001-90')) is None
+    cache.put(january(id_cnpj='12.345.678/0001-90'), 'janeiro')
+
+    assert cache.get({'id_dt_fin': '31/01/2024', 'id_dt_ini': '2024-01-01', 'id_cnpj': float(CNPJ), 'vl_icms': 0.0}) == 'janeiro'
+    assert cache.get(january(id_cnpj=CNPJ, uf_destinatario='SP')) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_text_keys_match_the_rows_the_store_returns(tmp_path):
+    store = FiscalStore(str(tmp_path))
+    store.append([
+        item(datetime.date(2024, 1, 5), nome_destinatario='Foo  Bar'),
+        item(datetime.date(2024, 1, 6), nome_destinatario='foo bar '),
+        item(datetime.date(2024, 1, 7), nome_destinatario='Foo Barra'),
+    ])
+    spaced, single = {'nome_destinatario': 'Foo  Bar'}, {'nome_destinatario': ' FOO bar'}
+
+    assert canonicalize(spaced) == canonicalize(single)
+    assert store.execute(spaced)['itens'] == store.execute(single)['itens'] == 2
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    clock = Clock()
+    cache = ResultCache(FiscalStore(str(tmp_path)), ttl=60, clock=clock)
+    cache.put(january(), 'janeiro')
+    clock.now = 59
+    assert cache.get(january()) == 'janeiro'
+    clock.now = 60
+    assert cache.get(january()) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResultCache(FiscalStore(str(tmp_path)), max_entries=2)
+    cache.put(january(uf_destinatario='SP'), 'SP')
+    cache.put(january(uf_destinatario='RJ'), 'RJ')
+    assert cache.get(january(uf_destinatario='SP')) == 'SP'
+
+    cache.put(january(uf_destinatario='MG'), 'MG')
+    assert cache.get(january(uf_destinatario='RJ')) is None
+    assert cache.get(january(uf_destinatario='SP')) == 'SP'
+    assert cache.get(january(uf_destinatario='MG')) == 'MG'
+
+
+def test_appends_invalidate_overlapping_entries(tmp_path):
+    store = FiscalStore(str(tmp_path))
+    store.append([item(datetime.date(2023, 12, 1))])  # before the cache: ignored
+    cache = ResultCache(store)
+    cache.put(january(), 'todos')
+    cache.put(january(id_cnpj=CNPJ), 'cnpj')
+    cache.put(january(id_cnpj=98765432000110), 'outro cnpj')
+    cache.put({'id_dt_ini': '2024-02-01', 'id_dt_fin': '2024-02-29', 'vl_icms': 1.0}, 'fevereiro')
+    assert cache.stats()['entries'] == 4
+
+    # Written through another store instance, as an ingest process would
+    FiscalStore(str(tmp_path)).append([item(datetime.date(2024, 1, 15))])
+    assert cache.get(january()) is None
+    assert cache.get(january(id_cnpj=CNPJ)) is None
+    assert cache.get(january(id_cnpj=98765432000110)) == 'outro cnpj'
+    assert cache.get({'id_dt_ini': '2024-02-01', 'id_dt_fin': '2024-02-29', 'vl_icms': 1.0}) == 'fevereiro'
+    assert cache.stats()['invalidations'] == 2
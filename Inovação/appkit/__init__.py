@@ -0,0 +1,6 @@
+"""
+Serving, warmup, metrics, server-sent events and client assets shared by the Flask chat apps
+(`IA - Tools` and `Chatbot Propostas/2024/model`). Each app's `server`
+package puts this directory's parent on `sys.path`, so the modules import
+as `appkit.metrics`, `appkit.serving`, ...
+"""
@@ -0,0 +1,143 @@
+"""
+In-memory registry of the client assets (css, js, img).
+
+Every file is read once at startup, hashed and, for text types, compressed
+with gzip (and brotli when the `brotli` package is installed). Responses
+carry a strong ETag and answer `If-None-Match` with 304. Templates link
+assets through `asset_url`, which adds the content hash to the file name
+(`/assets/css/style.3f2a9c1e.css`); those URLs are cached by browsers as
+immutable, while plain names are revalidated on every load.
+
+Only files found at startup are served, so `folder`/`file` from the URL are
+never used to build a filesystem path.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FOLDERS = ('css', 'js', 'img')
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'application/manifest+json', 'image/svg+xml', 'image/x-icon', 'image/vnd.microsoft.icon')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+mimetypes.add_type('application/javascript', '.js')
+
+
+def accepted_encodings(header: str) -> dict:
+    """
+    'gzip, br;q=0.5, *;q=0' -> {'gzip': 1.0, 'br': 0.5, '*': 0.0}
+    """
+    weights = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    return weights
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """
+    `If-None-Match` check: a list of (possibly weak) tags, or `*`.
+    """
+    tags = [tag.strip() for tag in header.split(',')]
+    return any(tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == etag for tag in tags)
+
+
+class Asset:
+    def __init__(self, folder: str, name: str, body: bytes) -> None:
+        self.folder = folder
+        self.name = name
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+        stem, extension = os.path.splitext(name)
+        self.hashed_name = f'{stem}.{self.digest[:8]}{extension}'
+
+        self.variants = {'identity': body}
+        if self.mimetype.startswith(COMPRESSIBLE):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants['br'] = compressed
+
+    def etag(self, encoding: str) -> str:
+        # Strong validators must differ between content-codings
+        if encoding == 'identity':
+            return f'"{self.digest[:32]}"'
+        return f'"{self.digest[:32]}-{encoding}"'
+
+
+class AssetRegistry:
+    def __init__(self, root: str, folders=FOLDERS) -> None:
+        self.assets = {}
+        for folder in folders:
+            directory = os.path.join(root, folder)
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if not os.path.isfile(path):
+                    continue
+                with open(path, 'rb') as file:
+                    asset = Asset(folder, name, file.read())
+                self.assets[(folder, name)] = asset
+                self.assets[(folder, asset.hashed_name)] = asset
+
+    def url(self, path: str) -> str:
+        """
+        Jinja helper: 'css/style.css' -> '/assets/css/style.<hash>.css'.
+        """
+        folder, name = path.split('/', 1)
+        asset = self.assets.get((folder, name))
+        if asset is None:
+            return f'/assets/{path}'
+        return f'/assets/{folder}/{asset.hashed_name}'
+
+    def _encoding(self, asset: Asset) -> str:
+        weights = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        best, best_weight = 'identity', 0.0
+        # Brotli first: preferred when both are accepted with the same weight
+        for encoding in ('br', 'gzip'):
+            weight = weights.get(encoding, weights.get('*', 0.0))
+            if encoding in asset.variants and weight > best_weight:
+                best, best_weight = encoding, weight
+        return best
+
+    def response(self, folder: str, file: str):
+        asset = self.assets.get((folder, file))
+        if asset is None:
+            return "File not found", 404
+
+        encoding = self._encoding(asset)
+        headers = {
+            'ETag': asset.etag(encoding),
+            'Cache-Control': IMMUTABLE if file == asset.hashed_name else REVALIDATE,
+            'Vary': 'Accept-Encoding',
+        }
+        if etag_matches(request.headers.get('If-None-Match', ''), asset.etag(encoding)):
+            return Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(asset.variants[encoding], mimetype=asset.mimetype, headers=headers)
@@ -0,0 +1,317 @@
+"""
+Per-stage timing for `Backend_Api`, exposed in the Prometheus text format.
+
+    with self.metrics.stage('llm'):
+        response = chat_session.send_message(message)
+
+Each stage feeds a latency histogram; exceptions raised inside a stage are
+counted by stage and re-raised. Other modules can add counters (`inc`) and
+gauges computed at scrape time (`gauge`). When `trace_log` is configured,
+every request also writes one JSON line with its stage timings.
+
+Under gunicorn every worker has its own `Metrics`, and a scrape of
+`/metrics` reaches one of them. The workers therefore share a directory
+(`serving.shared_dir('metrics')`): each worker writes its values there at
+most every `flush_interval` seconds, and
+`render` adds up the histograms, errors and counters of all the workers
+that ever ran, so any scrape sees the whole server. Gauges are reported per
+live worker, with a `pid` label.
+"""
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from appkit.serving import shared_dir as worker_shared_dir
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+FLUSH_INTERVAL = 1.0
+
+_current_trace = contextvars.ContextVar('trace', default=None)
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    inner = ','.join(f'{key}="{str(value)}"' for key, value in sorted(labels.items()))
+    return '{' + inner + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def add(self, counts: list, sum: float, count: int) -> None:
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, counts)]
+        self.sum += sum
+        self.count += count
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+    def __init__(self, prefix: str, trace_log: str = None, shared_dir: str = None,
+                 flush_interval: float = FLUSH_INTERVAL) -> None:
+        self.prefix = prefix
+        self.trace_log = trace_log
+        self.shared_dir = shared_dir or worker_shared_dir('metrics')
+        self.flush_interval = flush_interval
+        self.histograms = {}
+        self.errors = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._flusher_pid = None
+
+    def _changed(self) -> None:
+        # Called with `_lock` held
+        self._dirty = True
+        if self.shared_dir and self._flusher_pid != os.getpid():
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+            self._changed()
+        trace = _current_trace.get()
+        if trace is not None:
+            trace['stages'][stage] = trace['stages'].get(stage, 0.0) + seconds
+
+    def error(self, stage: str, exception: Exception = None) -> None:
+        with self._lock:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+            self._changed()
+        trace = _current_trace.get()
+        if trace is not None:
+            trace['errors'].append({'stage': stage, 'error': repr(exception) if exception else None})
+
+    def mean(self, *stages: str):
+        """
+        Mean seconds per request spent in `stages` together, or None before
+        any observation.
+        """
+        with self._lock:
+            histograms = [self.histograms[stage] for stage in stages if stage in self.histograms]
+            if not histograms or not histograms[0].count:
+                return None
+            return sum(histogram.sum for histogram in histograms) / histograms[0].count
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.error(name, e)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def iterate(self, iterable, stage: str):
+        """
+        Yields from `iterable`, timing only the time spent producing items
+        (not the time the consumer spends between them).
+        """
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    self.error(stage, e)
+                    raise
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield item
+        finally:
+            self.observe(stage, elapsed)
+
+    def inc(self, name: str, value: float = 1, help: str = '', **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            entry = self.counters.get(key)
+            self.counters[key] = (help, (entry[1] if entry else 0) + value)
+            self._changed()
+
+    def gauge(self, name: str, help: str, function) -> None:
+        """
+        Registers a value computed on every scrape.
+        """
+        self.gauges[name] = (help, function)
+
+    @contextmanager
+    def trace(self, **fields):
+        """
+        Collects the stage timings of one request and, if `trace_log` is set,
+        appends them as a JSON line.
+        """
+        trace = {'id': uuid.uuid4().hex, 'start': time.time(), 'stages': {}, 'errors': [], **fields}
+        token = _current_trace.set(trace)
+        started = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            trace['total'] = time.perf_counter() - started
+            self.observe('total', trace['total'])
+            if self.trace_log:
+                line = json.dumps(trace, ensure_ascii=False, default=str)
+                with self._lock, open(self.trace_log, 'a', encoding='utf-8') as log:
+                    log.write(line + '\n')
+
+    def annotate(self, **fields) -> None:
+        """
+        Adds `fields` to the trace of the current request, if any.
+        """
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.update(fields)
+
+    def traced(self, events, **fields):
+        """
+        Same as `trace`, for a streamed response: the trace spans the whole
+        generator.
+        """
+        with self.trace(**fields):
+            yield from events
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            state = {
+                'pid': os.getpid(),
+                'histograms': {
+                    stage: [list(histogram.buckets), list(histogram.counts), histogram.sum, histogram.count]
+                    for stage, histogram in self.histograms.items()
+                },
+                'errors': dict(self.errors),
+                'counters': [[name, [list(label) for label in labels], help, value]
+                             for (name, labels), (help, value) in self.counters.items()],
+            }
+            self._dirty = False
+        state['gauges'] = {gauge: [help, function()] for gauge, (help, function) in self.gauges.items()}
+        return state
+
+    def flush(self, state: dict = None) -> None:
+        """
+        Writes this worker's values to `shared_dir`, for the scrapes served
+        by the other workers.
+        """
+        if not self.shared_dir:
+            return
+        state = state or self._snapshot()
+        path = os.path.join(self.shared_dir, f"{self.prefix}-{state['pid']}.json")
+        with self._write_lock:
+            with open(path + '.tmp', 'w', encoding='utf-8') as file:
+                json.dump(state, file, default=str)
+            os.replace(path + '.tmp', path)
+
+    def _states(self) -> list:
+        """
+        The values of this process and, with `shared_dir`, of every other
+        worker that wrote there.
+        """
+        own = self._snapshot()
+        if not self.shared_dir:
+            return [own]
+        self.flush(own)
+        states = [own]
+        for path in sorted(glob.glob(os.path.join(self.shared_dir, f'{self.prefix}-*.json'))):
+            try:
+                with open(path, encoding='utf-8') as file:
+                    state = json.load(file)
+            except (OSError, ValueError):
+                continue
+            if state['pid'] != own['pid']:
+                states.append(state)
+        return states
+
+    def render(self) -> str:
+        states = self._states()
+        histograms, errors, counters, gauges = {}, {}, {}, []
+        for state in states:
+            for stage, (buckets, counts, total, count) in state['histograms'].items():
+                if stage not in histograms:
+                    histograms[stage] = Histogram(tuple(buckets))
+                histograms[stage].add(counts, total, count)
+            for stage, count in state['errors'].items():
+                errors[stage] = errors.get(stage, 0) + count
+            for counter, labels, help, value in state['counters']:
+                key = (counter, tuple(tuple(label) for label in labels))
+                counters[key] = (help, counters.get(key, (help, 0))[1] + value)
+            # A dead worker's counts stay in the totals, but not its gauges
+            if len(states) > 1 and not _alive(state['pid']):
+                continue
+            for gauge, (help, value) in state['gauges'].items():
+                gauges.append((gauge, {'pid': state['pid']} if self.shared_dir else {}, help, value))
+
+        name = f'{self.prefix}_stage_seconds'
+        lines = [f'# HELP {name} Time spent per request stage.', f'# TYPE {name} histogram']
+        for stage, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels({"stage": stage, "le": bound})} {cumulative}')
+            lines.append(f'{name}_bucket{_labels({"stage": stage, "le": "+Inf"})} {histogram.count}')
+            lines.append(f'{name}_sum{_labels({"stage": stage})} {histogram.sum}')
+            lines.append(f'{name}_count{_labels({"stage": stage})} {histogram.count}')
+
+        name = f'{self.prefix}_stage_errors_total'
+        lines += [f'# HELP {name} Exceptions raised per request stage.', f'# TYPE {name} counter']
+        for stage, count in sorted(errors.items()):
+            lines.append(f'{name}{_labels({"stage": stage})} {count}')
+
+        declared = set()
+        for (counter, labels), (help, value) in sorted(counters.items()):
+            name = f'{self.prefix}_{counter}'
+            if name not in declared:
+                declared.add(name)
+                lines += [f'# HELP {name} {help}', f'# TYPE {name} counter']
+            lines.append(f'{name}{_labels(dict(labels))} {value}')
+
+        for gauge, labels, help, value in sorted(gauges, key=lambda item: (item[0], str(item[1]))):
+            name = f'{self.prefix}_{gauge}'
+            if name not in declared:
+                declared.add(name)
+                lines += [f'# HELP {name} {help}', f'# TYPE {name} gauge']
+            lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
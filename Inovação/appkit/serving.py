@@ -0,0 +1,160 @@
+"""
+Serving modes for the chat app, driven by `site_config` in config.json.
+
+The keys accepted by `app.run` (host, port, debug, ...) keep working and the
+Flask development server stays the default. For production set:
+
+    "site_config": {
+        "host": "0.0.0.0",
+        "port": 1338,
+        "server": "gunicorn",
+        "workers": 4,
+        "worker_class": "gevent",
+        "worker_connections": 100,
+        "timeout": 120,
+        "graceful_timeout": 30
+    }
+
+With the gevent worker class every request runs in a greenlet, so a request
+waiting on Gemini or Pinecone does not hold a thread and one worker serves
+many conversations at once. On SIGTERM workers stop accepting connections
+and get `graceful_timeout` seconds to finish the answers being streamed.
+
+`serve(..., preload=...)` runs `preload` once in the gunicorn master before
+the workers fork, to load model weights a single time and share their pages
+copy-on-write. `gc.freeze()` then keeps the collector from touching (and
+so copying) those objects in the workers.
+
+Under gevent, threads are greenlets on the worker's hub: CPU-bound work
+(model weights, a torch `encode`) goes through `run_in_thread`, which runs
+it on a real OS thread so the other requests keep being served meanwhile.
+
+State the workers must share (the metrics, so `/metrics` reports the whole
+server whichever worker answers the scrape; the Gemini quota) lives in a
+directory created by the master at startup, inside `shared_dir` (default:
+the system temporary directory). Workers find it with `shared_dir(name)`.
+"""
+import gc
+import os
+import shutil
+import tempfile
+
+SERVER_KEYS = {
+    'server', 'workers', 'worker_class', 'worker_connections', 'threads',
+    'timeout', 'graceful_timeout', 'keepalive', 'max_requests', 'max_requests_jitter',
+    'shared_dir',
+}
+
+# Set in the gunicorn master, inherited by the workers
+SHARED_DIR_ENV = 'APPKIT_SHARED_DIR'
+
+
+def prepare_shared_dir(parent: str = None) -> str:
+    """
+    Creates the directory of this server's run, empty, and exports it to
+    the processes forked afterwards.
+    """
+    directory = os.path.join(parent or tempfile.gettempdir(), f'appkit-{os.getpid()}')
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    os.environ[SHARED_DIR_ENV] = directory
+    return directory
+
+
+def shared_dir(name: str):
+    """
+    Directory `name` shared by the workers of this server, or None when the
+    app runs in a single process.
+    """
+    root = os.environ.get(SHARED_DIR_ENV)
+    if not root:
+        return None
+    directory = os.path.join(root, name)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _gevent_patched() -> bool:
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def run_in_thread(function, *args, **kwargs):
+    """
+    Calls `function` on a real OS thread of gevent's pool when gevent has
+    patched `threading` (the calling greenlet waits, the others run), and
+    directly otherwise. `function` must not use gevent-patched objects.
+    """
+    if _gevent_patched():
+        from gevent import get_hub
+        return get_hub().threadpool.apply(function, args, kwargs)
+    return function(*args, **kwargs)
+
+
+def flask_options(site_config: dict) -> dict:
+    return {key: value for key, value in site_config.items() if key not in SERVER_KEYS}
+
+
+def gunicorn_options(site_config: dict) -> dict:
+    options = {
+        'bind': f"{site_config.get('host', '127.0.0.1')}:{site_config.get('port', 1338)}",
+        'workers': site_config.get('workers', 2),
+        'worker_class': site_config.get('worker_class', 'gevent'),
+        'worker_connections': site_config.get('worker_connections', 100),
+        'timeout': site_config.get('timeout', 120),
+        'graceful_timeout': site_config.get('graceful_timeout', 30),
+        'keepalive': site_config.get('keepalive', 5),
+        'post_worker_init': _post_worker_init,
+    }
+    for key in ('threads', 'max_requests', 'max_requests_jitter'):
+        if key in site_config:
+            options[key] = site_config[key]
+    return options
+
+
+def _post_worker_init(worker) -> None:
+    # google-generativeai talks gRPC, which must cooperate with gevent's hub
+    if 'gevent' in worker.cfg.worker_class_str:
+        try:
+            from grpc.experimental import gevent as grpc_gevent
+            grpc_gevent.init_gevent()
+        except ImportError:
+            pass
+
+
+def serve(create_app, site_config: dict, preload=None) -> None:
+    """
+    Runs the app returned by `create_app()`.
+
+    Under gunicorn `create_app` is called inside each worker, after gevent
+    has patched the standard library, so the locks and connections built by
+    the backend are cooperative. `preload` must only build fork-safe
+    objects (model weights, not network clients).
+    """
+    if site_config.get('server', 'flask') != 'gunicorn':
+        create_app().run(**flask_options(site_config))
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    prepare_shared_dir(site_config.get('shared_dir'))
+    if preload is not None:
+        if gunicorn_options(site_config)['worker_class'] == 'gevent':
+            # What preload imports (ssl, threading) must already be patched
+            from gevent import monkey
+            monkey.patch_all()
+        preload()
+        gc.freeze()
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options(site_config).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return create_app()
+
+    Application().run()
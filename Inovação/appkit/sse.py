@@ -0,0 +1,42 @@
+"""
+Server-sent events helpers for the conversation endpoints.
+
+Every event carries a JSON object; `content` is markdown the client appends
+to the answer being rendered. The stream ends with a `done` event.
+"""
+import json
+
+from flask import Response, stream_with_context
+
+
+def wants_stream(request) -> bool:
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def event(data: dict, name: str = None) -> str:
+    lines = []
+    if name:
+        lines.append(f"event: {name}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream(events) -> Response:
+    """
+    Wraps a generator of event dicts into a text/event-stream response.
+    Errors raised while streaming are sent as an `error` event.
+    """
+    def generate():
+        try:
+            for data in events:
+                yield event(data)
+        except Exception as e:
+            print(e)
+            yield event({'error': str(e)}, 'error')
+        yield event({}, 'done')
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -0,0 +1,7 @@
+"""
+Tests run from the directory above the package (`python -m pytest appkit`).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
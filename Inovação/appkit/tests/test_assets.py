@@ -0,0 +1,75 @@
+import gzip
+
+import pytest
+from flask import Flask
+
+from appkit.assets import AssetRegistry, accepted_encodings, etag_matches
+
+CSS = b'body { color: #222; }\n' * 50
+
+
+@pytest.fixture
+def registry(tmp_path):
+    for folder in ('css', 'js', 'img'):
+        (tmp_path / folder).mkdir()
+    (tmp_path / 'css' / 'style.css').write_bytes(CSS)
+    (tmp_path / 'img' / 'logo.png').write_bytes(b'\x89PNG' + bytes(range(256)))
+    registry = AssetRegistry(str(tmp_path))
+    # Stands in for the brotli package, which may not be installed
+    registry.assets[('css', 'style.css')].variants['br'] = b'brotli'
+    return registry
+
+
+def get(registry, name, folder='css', **headers):
+    app = Flask(__name__)
+    with app.test_request_context(headers={key.replace('_', '-'): value for key, value in headers.items()}):
+        return registry.response(folder, name)
+
+
+def test_hashed_urls_are_immutable(registry):
+    url = registry.url('css/style.css')
+    name = url.rsplit('/', 1)[1]
+    assert url.startswith('/assets/css/style.') and name != 'style.css'
+    assert registry.url('css/missing.css') == '/assets/css/missing.css'
+
+    assert get(registry, name).headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert get(registry, 'style.css').headers['Cache-Control'] == 'no-cache'
+    assert get(registry, '../secret.txt') == ('File not found', 404)
+    # Binary images are not compressed
+    assert 'gzip' not in registry.assets[('img', 'logo.png')].variants
+
+
+def test_content_encoding_follows_the_weights(registry):
+    assert accepted_encodings('gzip, br;q=0.5, *;q=0') == {'gzip': 1.0, 'br': 0.5, '*': 0.0}
+
+    def encoding(header):
+        return get(registry, 'style.css', Accept_Encoding=header).headers.get('Content-Encoding', 'identity')
+
+    assert encoding('gzip, deflate, br') == 'br'
+    assert encoding('gzip, br;q=0') == 'gzip'
+    assert encoding('br;q=0.5, gzip;q=0.8') == 'gzip'
+    assert encoding('*') == 'br'
+    assert encoding('*;q=0, gzip') == 'gzip'
+    assert encoding('gzip;q=0, br;q=0') == 'identity'
+    assert encoding('') == 'identity'
+
+    response = get(registry, 'style.css', Accept_Encoding='gzip')
+    assert gzip.decompress(response.get_data()) == CSS
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_if_none_match_compares_each_tag(registry):
+    etag = get(registry, 'style.css').headers['ETag']
+    assert etag_matches(f'W/{etag}', etag)
+
+    def status(header, **headers):
+        return get(registry, 'style.css', If_None_Match=header, **headers).status_code
+
+    assert status(etag) == 304
+    assert status(f'W/{etag}') == 304
+    assert status(f'"outra", {etag}') == 304
+    assert status('*') == 304
+    assert status('"outra"') == 200
+    assert status(etag[:-1] + 'x"') == 200
+    # The gzip variant has its own validator
+    assert status(etag, Accept_Encoding='gzip') == 200
@@ -0,0 +1,57 @@
+import multiprocessing
+import os
+
+import pytest
+
+from appkit.metrics import Metrics
+
+
+def sample(text: str, line: str) -> float:
+    for row in text.splitlines():
+        if row.startswith(line + ' '):
+            return float(row.rsplit(' ', 1)[1])
+    raise AssertionError(f'{line} not in the scrape')
+
+
+def other_worker(shared_dir: str) -> None:
+    metrics = Metrics('app', shared_dir=shared_dir)
+    metrics.gauge('queued', 'Queued items.', lambda: 7)
+    for _ in range(3):
+        metrics.observe('llm', 0.2)
+    metrics.error('llm')
+    metrics.inc('answers_total', 3, help='Answers.', source='llm')
+    metrics.flush()
+
+
+def test_single_process_render():
+    metrics = Metrics('app')
+    metrics.gauge('queued', 'Queued items.', lambda: 2)
+    with pytest.raises(ValueError), metrics.stage('llm'):
+        raise ValueError
+    text = metrics.render()
+    assert sample(text, 'app_stage_seconds_count{stage="llm"}') == 1
+    assert sample(text, 'app_stage_errors_total{stage="llm"}') == 1
+    assert sample(text, 'app_queued') == 2
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='workers are forked by gunicorn')
+def test_render_adds_up_the_workers(tmp_path):
+    process = multiprocessing.get_context('fork').Process(target=other_worker, args=(str(tmp_path),))
+    process.start()
+    process.join()
+
+    metrics = Metrics('app', shared_dir=str(tmp_path))
+    metrics.gauge('queued', 'Queued items.', lambda: 1)
+    metrics.observe('llm', 0.2)
+    metrics.observe('llm', 0.2)
+    metrics.inc('answers_total', 2, help='Answers.', source='llm')
+    text = metrics.render()
+
+    assert sample(text, 'app_stage_seconds_count{stage="llm"}') == 5
+    assert sample(text, 'app_stage_seconds_sum{stage="llm"}') == pytest.approx(1.0)
+    assert sample(text, 'app_stage_errors_total{stage="llm"}') == 1
+    assert sample(text, 'app_answers_total{source="llm"}') == 5
+    # The other worker exited: its counts stay, its gauge does not
+    assert sample(text, f'app_queued{{pid="{os.getpid()}"}}') == 1
+    assert f'pid="{process.pid}"' not in text
+    assert (tmp_path / f'app-{os.getpid()}.json').exists()
@@ -0,0 +1,53 @@
+import json
+
+from flask import Flask, request
+
+from appkit.sse import event, stream, wants_stream
+
+
+def parse(body: str) -> list:
+    events = []
+    for block in body.split('\n\n'):
+        if not block:
+            continue
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((fields.get('event'), json.loads(fields['data'])))
+    return events
+
+
+def app_streaming(events) -> Flask:
+    app = Flask(__name__)
+    app.add_url_rule('/', 'stream', lambda: stream(events()) if wants_stream(request) else 'texto')
+    return app
+
+
+def test_event_framing():
+    assert event({'content': 'Olá'}) == 'data: {"content": "Olá"}\n\n'
+    assert event({}, 'done') == 'event: done\ndata: {}\n\n'
+
+
+def test_stream_ends_with_done():
+    def events():
+        yield {'content': 'a'}
+        yield {'content': 'b\n\nc'}
+
+    client = app_streaming(events).test_client()
+    assert client.get('/').get_data(as_text=True) == 'texto'
+
+    response = client.get('/', headers={'Accept': 'text/event-stream'})
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert parse(response.get_data(as_text=True)) == [
+        (None, {'content': 'a'}), (None, {'content': 'b\n\nc'}), ('done', {}),
+    ]
+
+
+def test_error_while_streaming_is_sent_before_done():
+    def events():
+        yield {'content': 'parcial'}
+        raise RuntimeError('cota excedida')
+
+    response = app_streaming(events).test_client().get('/', headers={'Accept': 'text/event-stream'})
+    assert parse(response.get_data(as_text=True)) == [
+        (None, {'content': 'parcial'}), ('error', {'error': 'cota excedida'}), ('done', {}),
+    ]
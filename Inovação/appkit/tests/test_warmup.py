@@ -0,0 +1,103 @@
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+
+from flask import Flask
+
+from appkit.warmup import Warmup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def ready_route(warmup: Warmup):
+    app = Flask(__name__)
+    app.add_url_rule('/ready', 'ready', warmup.response)
+    return app.test_client()
+
+
+def test_ready_before_and_after_loading():
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return 'modelo'
+
+    warmup = Warmup()
+    warmup.add('model', slow)
+    warmup.add('index', lambda: 'injetado', value='injetado')
+    client = ready_route(warmup)
+
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert response.json == {'ready': False, 'resources': {
+        'model': {'ready': False, 'seconds': None, 'error': None},
+        'index': {'ready': True, 'seconds': 0.0, 'error': None},
+    }}
+
+    warmup.start()
+    release.set()
+    assert warmup.get('model') == 'modelo'
+    response = client.get('/ready')
+    assert response.status_code == 200 and response.json['ready'] is True
+    assert response.json['resources']['model']['seconds'] >= 0
+
+
+def test_failed_load_is_reported_and_retried():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError('sem conexão')
+        return 'cliente'
+
+    warmup = Warmup()
+    warmup.add('index', flaky)
+    warmup.start()
+    for thread in threading.enumerate():
+        if thread.name == 'warmup-index':
+            thread.join()
+
+    body, status = warmup.response()
+    assert status == 503 and body['resources']['index']['error'] == 'sem conexão'
+    # The next request that needs it builds it again
+    assert warmup.get('index') == 'cliente'
+    assert warmup.response()[1] == 200 and warmup.status()['index']['error'] is None
+
+
+def test_blocking_resource_leaves_the_gevent_hub_free():
+    # Under gunicorn's gevent workers the warm-up threads are greenlets: a
+    # blocking factory runs on a real thread while requests are answered
+    script = textwrap.dedent('''
+        from gevent import monkey
+        monkey.patch_all()
+
+        import time
+        import gevent
+        from appkit.warmup import Warmup
+
+        def weights():
+            deadline = time.perf_counter() + 0.3
+            while time.perf_counter() < deadline:
+                pass
+            return 'pesos'
+
+        ticks = []
+
+        def heartbeat():
+            while True:
+                ticks.append(1)
+                gevent.sleep(0.01)
+
+        warmup = Warmup()
+        warmup.add('embedding_model', weights, blocking=True)
+        beat = gevent.spawn(heartbeat)
+        warmup.start()
+        print(warmup.get('embedding_model'), warmup.ready(), len(ticks) > 10)
+        beat.kill()
+    ''')
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split('\n')[0] == 'pesos True True'
@@ -0,0 +1,120 @@
+"""
+Lazy, background-warmed loading of the backend's heavy resources (models,
+vector index clients).
+
+`Backend_Api` registers a factory per resource and may start warming them
+in background threads, so the port opens right away; `/ready` reports when
+everything is loaded. A request that needs a resource before that waits for
+it (or builds it, when nothing started the warm-up).
+
+Resources added with `blocking=True` (model weights, an index built in
+Python) are built through `serving.run_in_thread`: under gevent the warm-up
+threads are greenlets, and loading them there would stall every request of
+the worker until done.
+
+`shared` keeps one instance per process. Called in the gunicorn master
+before the workers fork (see `serving.serve(preload=...)`), the model
+weights are loaded once and shared copy-on-write by all workers.
+"""
+import threading
+import time
+
+from appkit.serving import run_in_thread
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared(key: str, factory):
+    """
+    Returns the process-wide instance for `key`, building it on first use.
+    """
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = factory()
+        return _shared[key]
+
+
+class Resource:
+    def __init__(self, name: str, factory, value=None, blocking: bool = False) -> None:
+        self.name = name
+        self.factory = factory
+        self.blocking = blocking
+        self.value = value
+        self.error = None
+        self.seconds = 0.0 if value is not None else None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.value is not None
+
+    def load(self):
+        """
+        Builds the resource unless it is already built; a failed build is
+        retried on the next call.
+        """
+        with self._lock:
+            if self.value is None:
+                started = time.perf_counter()
+                try:
+                    self.value = run_in_thread(self.factory) if self.blocking else self.factory()
+                    self.error = None
+                except Exception as e:
+                    self.error = e
+                    raise
+                finally:
+                    self.seconds = time.perf_counter() - started
+            return self.value
+
+
+class Warmup:
+    def __init__(self) -> None:
+        self.resources = {}
+
+    def add(self, name: str, factory, value=None, blocking: bool = False) -> None:
+        """
+        Registers a resource; `value` marks it as already loaded (e.g. a fake
+        injected by the load test). `blocking` factories are CPU-bound and
+        must not start threads, which would be greenlets of another hub.
+        """
+        self.resources[name] = Resource(name, factory, value, blocking)
+
+    def get(self, name: str):
+        return self.resources[name].load()
+
+    def start(self) -> None:
+        """
+        Loads every resource in its own daemon thread.
+        """
+        for resource in self.resources.values():
+            if not resource.ready:
+                threading.Thread(target=self._load_quietly, args=(resource,), daemon=True,
+                                 name=f'warmup-{resource.name}').start()
+
+    @staticmethod
+    def _load_quietly(resource: Resource) -> None:
+        try:
+            resource.load()
+        except Exception as e:
+            print(f"Warm-up of {resource.name} failed: {e}")
+
+    def ready(self) -> bool:
+        return all(resource.ready for resource in self.resources.values())
+
+    def response(self):
+        """
+        Body and status of the `/ready` route: 503 until everything loaded.
+        """
+        ready = self.ready()
+        return {'ready': ready, 'resources': self.status()}, 200 if ready else 503
+
+    def status(self) -> dict:
+        return {
+            name: {
+                'ready': resource.ready,
+                'seconds': resource.seconds,
+                'error': str(resource.error) if resource.error else None,
+            }
+            for name, resource in self.resources.items()
+        }
@@ -0,0 +1,200 @@
+"""
+Prompt size and generation latency of the proposal chatbot, with the
+retrieved matches joined as they come (before) and packed by
+`server.context.ContextPacker` (after).
+
+    python bench/context_packing.py --corpus propostas/ atas/ --budget 1500 \
+        --out bench/results/context_packing.json
+
+The corpus is chunked like `server.ingest`; without `--corpus` a synthetic
+one is generated, with proposals reused for several clients with a few
+words changed, as in the real archive. Questions are random word windows of
+the chunks and are answered by the BM25 index, so no embedding model is
+needed. For every question:
+
+    before  the `--top-k` best matches, all of them in the prompt
+    after   the packer's pick among the `--candidates` best matches
+
+and the script reports the context and prompt tokens (all sections), the
+passages dropped as duplicates and the time to generate the five sections
+in parallel. Generation uses the offline model, whose latency grows with the
+prompt by `--per-token` seconds per token; `--gemini` calls the real model
+(GEMINI_API_KEY) instead.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'Chatbot Propostas', '2024', 'model'))
+
+from embedding_eval import sample_queries  # noqa: E402
+from loadtest import git_commit, percentile  # noqa: E402
+from server.context import ContextPacker, estimate_tokens  # noqa: E402
+from server.fakes import FakeEmbeddingModel, FakeGenerativeModel  # noqa: E402
+from server.ingest import chunk_file, discover, split_chunks  # noqa: E402
+from server.lexical_index import LexicalIndex  # noqa: E402
+from server.proposal import SECTIONS, SYSTEM_INSTRUCTION, ProposalGenerator, section_prompt  # noqa: E402
+from server.vector_index import VectorIndex  # noqa: E402
+
+TOPICS = [
+    "dashboard de vendas", "previsão de demanda", "churn de clientes", "precificação dinâmica",
+    "manutenção preditiva", "gestão de estoque", "análise de crédito", "atendimento com chatbot",
+]
+SECTORS = ["varejo", "saúde", "indústria", "agronegócio", "financeiro", "logística"]
+PHRASES = [
+    "O cliente {client} atua no setor de {sector} e hoje consolida as informações em planilhas manuais.",
+    "A demanda é um projeto de {topic} que integre os dados do ERP e do CRM em uma base única.",
+    "A equipe gasta horas por semana preparando relatórios e as decisões chegam atrasadas às áreas.",
+    "Na primeira etapa faremos o diagnóstico das fontes de dados, entrevistas com as áreas e o levantamento de indicadores.",
+    "Na segunda etapa construiremos o pipeline de dados com validações de qualidade e atualização diária.",
+    "Na terceira etapa desenvolveremos o modelo de {topic} e o painel de acompanhamento para os gestores.",
+    "Por fim faremos a capacitação da equipe do cliente e o acompanhamento assistido durante trinta dias.",
+    "O impacto esperado é a redução do tempo de análise e ganho de receita com decisões baseadas em dados.",
+    "Os indicadores de sucesso serão acordados com o patrocinador do projeto na reunião de abertura.",
+]
+
+
+def synthetic_corpus(proposals: int, variants: int, seed: int = 0) -> list:
+    """
+    Chunks of `proposals` base texts, each reused for `variants` clients
+    with the client name and a few words changed.
+    """
+    rng = random.Random(seed)
+    texts = []
+    for p in range(proposals):
+        topic, sector = rng.choice(TOPICS), rng.choice(SECTORS)
+        paragraphs = [rng.choice(PHRASES) for _ in range(rng.randint(40, 70))]
+        for v in range(variants):
+            words = ' '.join(paragraphs).format(client=f"Cliente{p}x{v}", sector=sector, topic=topic).split()
+            for _ in range(len(words) // 50 if v else 0):
+                words[rng.randrange(len(words))] = rng.choice(["ajustado", "revisado", "novo", "atual"])
+            texts.extend(split_chunks(' '.join(words), 220, 40))
+    return texts
+
+
+def load_corpus(paths: list, max_chunks: int) -> list:
+    texts = []
+    for path, source in discover(paths):
+        texts.extend(text for _, text, _ in chunk_file(path, source, 220, 40)[2])
+        if len(texts) >= max_chunks:
+            break
+    return texts[:max_chunks]
+
+
+def build_index(texts: list, workdir: str) -> LexicalIndex:
+    index = VectorIndex(os.path.join(workdir, 'index'), dimension=32)
+    model = FakeEmbeddingModel(dimension=32)
+    for start in range(0, len(texts), 1000):
+        batch = texts[start:start + 1000]
+        index.upsert([(str(start + i), vector, {'summary': text})
+                      for i, (text, vector) in enumerate(zip(batch, model.encode(batch)))])
+    return LexicalIndex(index)
+
+
+def gemini_model():
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+    return genai.GenerativeModel(model_name='gemini-2.0-flash-exp', system_instruction=SYSTEM_INSTRUCTION)
+
+
+def run_variant(name: str, contexts: list, queries: list, model, workers: int) -> dict:
+    prompt_tokens, latencies = [], []
+    for query, context in zip(queries, contexts):
+        prompt_tokens.append(sum(estimate_tokens(section_prompt(instruction, query, context)) for _, _, instruction in SECTIONS))
+        generator = ProposalGenerator(model, max_workers=workers, retries=0)
+        started = time.perf_counter()
+        for _ in generator.stream(query, context):
+            pass
+        latencies.append(time.perf_counter() - started)
+    context_tokens = [estimate_tokens(context) if context else 0 for context in contexts]
+    result = {
+        'variant': name,
+        'context_tokens': {'mean': sum(context_tokens) / len(context_tokens), 'p95': percentile(context_tokens, 0.95)},
+        'prompt_tokens': {'mean': sum(prompt_tokens) / len(prompt_tokens), 'p95': percentile(prompt_tokens, 0.95)},
+        'generation_s': {f'p{p}': percentile(latencies, p / 100) for p in (50, 95)},
+    }
+    print(f"{name:>7}: contexto {result['context_tokens']['mean']:7.1f} tokens  "
+          f"prompt {result['prompt_tokens']['mean']:7.1f} tokens  "
+          f"geração p50={result['generation_s']['p50'] * 1000:7.1f} ms p95={result['generation_s']['p95'] * 1000:7.1f} ms")
+    return result
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Compara o contexto do prompt com e sem o empacotamento por orçamento.')
+    parser.add_argument('--corpus', nargs='+', help='Diretórios ou arquivos de propostas e atas (padrão: corpus sintético)')
+    parser.add_argument('--proposals', type=int, default=40, help='Propostas do corpus sintético')
+    parser.add_argument('--variants', type=int, default=4, help='Clientes por proposta do corpus sintético')
+    parser.add_argument('--max-chunks', type=int, default=20000)
+    parser.add_argument('--num-queries', type=int, default=50)
+    parser.add_argument('--top-k', type=int, default=5, help='Trechos no prompt sem empacotamento')
+    parser.add_argument('--candidates', type=int, default=10, help='Trechos avaliados pelo empacotamento')
+    parser.add_argument('--budget', type=int, default=1500, help='Orçamento de tokens do contexto')
+    parser.add_argument('--diversity', type=float, default=0.3)
+    parser.add_argument('--duplicate-threshold', type=float, default=0.5)
+    parser.add_argument('--llm-latency', type=float, default=0.3, help='Latência fixa do modelo falso (s)')
+    parser.add_argument('--per-token', type=float, default=0.0002, help='Latência do modelo falso por token do prompt (s)')
+    parser.add_argument('--workers', type=int, help='Seções geradas em paralelo (padrão: todas)')
+    parser.add_argument('--gemini', action='store_true', help='Gera com o Gemini (GEMINI_API_KEY) em vez do modelo falso')
+    parser.add_argument('--out', default=os.path.join(BENCH_DIR, 'results', 'context_packing.json'))
+    args = parser.parse_args(argv)
+
+    if args.corpus:
+        texts = load_corpus(args.corpus, args.max_chunks)
+    else:
+        texts = synthetic_corpus(args.proposals, args.variants)
+    queries = sample_queries(texts, args.num_queries)
+    print(f"{len(texts)} trechos, {len(queries)} perguntas")
+
+    workdir = tempfile.mkdtemp(prefix='context-packing-')
+    try:
+        lexical = build_index(texts, workdir)
+        candidates = [lexical.query(query, top_k=max(args.top_k, args.candidates), include_metadata=True)['matches']
+                      for query in queries]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    before = ["\n".join(f"- {match['metadata']['summary']}" for match in matches[:args.top_k]) for matches in candidates]
+    packer = ContextPacker(budget_tokens=args.budget, diversity=args.diversity, duplicate_threshold=args.duplicate_threshold)
+    packed = [packer.pack(matches[:args.candidates]) for matches in candidates]
+    after = [result.text for result in packed]
+
+    model = gemini_model() if args.gemini else FakeGenerativeModel(latency=args.llm_latency, per_token=args.per_token, seed=0)
+    results = [run_variant('antes', before, queries, model, args.workers),
+               run_variant('depois', after, queries, model, args.workers)]
+    packing = {
+        'passages': sum(len(result.passages) for result in packed) / len(packed),
+        'duplicates': sum(result.duplicates for result in packed) / len(packed),
+        'over_budget': sum(result.over_budget for result in packed) / len(packed),
+        'tokens_used': sum(result.tokens for result in packed) / len(packed),
+        'tokens_saved': sum(result.saved_tokens for result in packed) / len(packed),
+    }
+    print(f"Empacotamento: {packing['passages']:.1f} trechos, {packing['duplicates']:.1f} duplicados e "
+          f"{packing['over_budget']:.1f} fora do orçamento por pergunta; "
+          f"{packing['tokens_used']:.0f} tokens usados, {packing['tokens_saved']:.0f} economizados")
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'options': vars(args),
+        'chunks': len(texts),
+        'queries': len(queries),
+        'packing': packing,
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Time spent on Google APIs per Streamlit rerun of `E-mail/email_deploy.py`,
+as the page used to work (before) and with the cached clients, calendar and
+signature (after).
+
+    python bench/email_rerun.py --sessions 5 --reruns 30 --api-latency 0.15 \
+        --connect-latency 0.1 --out bench/results/email_rerun.json
+
+A session is a login followed by `--reruns` interactions, each reading the
+events of today or tomorrow. Per rerun:
+
+    before  builds the calendar and gmail clients, opens a new connection
+            and lists the day's events; the first rerun of every session
+            also reads the profile and the sendAs signature
+    after   `clients_for` (built once per credential), `CalendarCache`
+            (full sync on the first rerun, deltas every 30 s) and the
+            signature cached per user across sessions
+
+Clients are really built (static discovery documents, fake credentials);
+the API calls go to the stand-ins in `E-mail/fakes.py`, which cost
+`--api-latency` per HTTP round trip plus `--connect-latency` on the first
+one of every client. Without a network, discovery fetched remotely (older
+client libraries) is not part of the "before" numbers.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'E-mail'))
+
+from loadtest import git_commit, percentile  # noqa: E402
+from calendar_cache import CalendarCache  # noqa: E402
+from confirmacao import group_guests  # noqa: E402
+from fakes import FakeCalendarService, FakeGmailService  # noqa: E402
+from google.oauth2.credentials import Credentials  # noqa: E402
+from googleapiclient.discovery import build  # noqa: E402
+from google_clients import cached, clients_for  # noqa: E402
+
+
+def sample_events(days: int, per_day: int) -> list:
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    events = []
+    for d in range(-7, days):
+        day = today + datetime.timedelta(days=d)
+        for i in range(per_day):
+            start = datetime.datetime.combine(day, datetime.time(9 + i % 10), tzinfo=datetime.timezone.utc)
+            events.append({
+                'id': f'{d}-{i}',
+                'summary': f'Reunião {i}',
+                'start': {'dateTime': start.isoformat()},
+                'end': {'dateTime': (start + datetime.timedelta(minutes=45)).isoformat()},
+                'attendees': [{'email': 'hunter@polijunior.com.br'}, {'email': f'cliente{i}@empresa{d}.com'}],
+            })
+    return events
+
+
+def signature(gmail) -> str:
+    email = gmail.users().getProfile(userId='me').execute()['emailAddress']
+    return gmail.users().settings().sendAs().get(userId='me', sendAsEmail=email).execute()['signature']
+
+
+def run_before(args, events: list) -> tuple:
+    latencies, round_trips = [], 0
+    calendar = FakeCalendarService(events, latency=args.api_latency, connect_latency=args.connect_latency)
+    for session in range(args.sessions):
+        creds = Credentials(token=f'token-{session}', refresh_token=f'refresh-{session}')
+        for rerun in range(args.reruns):
+            started = time.perf_counter()
+            build('calendar', 'v3', credentials=creds)
+            build('gmail', 'v1', credentials=creds)
+            # Clients built on every rerun: a new connection each time (the
+            # stand-in charges it on its first round trip)
+            calendar.round_trips = 0
+            gmail = FakeGmailService(latency=args.api_latency, connect_latency=args.connect_latency)
+            if rerun == 0:
+                signature(gmail)
+            day = datetime.date.today() + datetime.timedelta(days=rerun % 2)
+            start = datetime.datetime.combine(day, datetime.time.min)
+            items = calendar.events().list(
+                calendarId='primary', timeMin=start.isoformat() + 'Z',
+                timeMax=(start + datetime.timedelta(days=1)).isoformat() + 'Z',
+                singleEvents=True, orderBy='startTime',
+            ).execute().get('items', [])
+            group_guests(items)
+            latencies.append(time.perf_counter() - started)
+            round_trips += calendar.round_trips + gmail.round_trips
+    return latencies, round_trips
+
+
+def run_after(args, events: list) -> tuple:
+    latencies, round_trips = [], 0
+    for session in range(args.sessions):
+        creds = Credentials(token=f'token-{session}', refresh_token=f'refresh-{session}')
+        # One client (and connection) per session, as `clients_for` keeps them
+        calendar = FakeCalendarService(events, latency=args.api_latency, connect_latency=args.connect_latency)
+        gmail = FakeGmailService(latency=args.api_latency, connect_latency=args.connect_latency)
+        cache = CalendarCache(min_sync_interval=args.sync_interval)
+        for rerun in range(args.reruns):
+            started = time.perf_counter()
+            clients = clients_for(creds)
+            _ = clients.calendar, clients.gmail
+            if rerun == 0:
+                cached(('signature', 'hunter@polijunior.com.br'), 3600, lambda: signature(gmail))
+            day = datetime.date.today() + datetime.timedelta(days=rerun % 2)
+            group_guests(cache.events_for_date(calendar, day))
+            latencies.append(time.perf_counter() - started)
+            if args.think_time:
+                time.sleep(args.think_time)
+        round_trips += calendar.round_trips + gmail.round_trips
+    return latencies, round_trips
+
+
+def summarize(name: str, latencies: list, round_trips: int, reruns: int) -> dict:
+    first = latencies[::reruns]
+    rest = [latency for i, latency in enumerate(latencies) if i % reruns]
+    result = {
+        'variant': name,
+        'rerun_s': {f'p{p}': percentile(latencies, p / 100) for p in (50, 95)},
+        'first_rerun_s': sum(first) / len(first),
+        'later_reruns_s': sum(rest) / len(rest) if rest else None,
+        'round_trips': round_trips,
+    }
+    print(f"{name:>7}: rerun p50={result['rerun_s']['p50'] * 1000:7.1f} ms  p95={result['rerun_s']['p95'] * 1000:7.1f} ms  "
+          f"primeiro={result['first_rerun_s'] * 1000:7.1f} ms  "
+          f"demais={(result['later_reruns_s'] or 0) * 1000:7.1f} ms  {round_trips} requisições HTTP")
+    return result
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Mede a latência dos reruns do email_deploy.py antes e depois do cache.')
+    parser.add_argument('--sessions', type=int, default=5)
+    parser.add_argument('--reruns', type=int, default=30, help='Interações por sessão')
+    parser.add_argument('--events-per-day', type=int, default=15)
+    parser.add_argument('--api-latency', type=float, default=0.15, help='Latência de cada requisição à API (s)')
+    parser.add_argument('--connect-latency', type=float, default=0.1, help='Abertura da conexão de um cliente novo (s)')
+    parser.add_argument('--sync-interval', type=float, default=30, help='Intervalo mínimo entre sincronizações da agenda (s)')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Pausa entre interações no "depois" (s)')
+    parser.add_argument('--out', default=os.path.join(BENCH_DIR, 'results', 'email_rerun.json'))
+    args = parser.parse_args(argv)
+
+    events = sample_events(35, args.events_per_day)
+    results = [summarize('antes', *run_before(args, events), args.reruns),
+               summarize('depois', *run_after(args, events), args.reruns)]
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'options': vars(args),
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.out}")
+
+
+if __name__ == '__main__':
+    main()
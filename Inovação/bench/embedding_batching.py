@@ -0,0 +1,108 @@
+"""
+Throughput and added latency of the micro-batching encode scheduler.
+
+    python bench/embedding_batching.py --concurrency 1,8,32 --requests 400 \
+        --batch-size 8,32 --wait-ms 1,5,10 --out bench/results/embedding_batching.json
+
+Every combination of batch size and wait window is compared with calling
+the model directly, at each concurrency level. By default the model is the
+offline stand-in, running one call at a time with a fixed cost per call
+(`--call-latency`) and a cost per text (`--item-latency`), which is how a
+CPU transformer behaves; pass
+`--model sentence-transformers/nli-bert-large` to measure the real one.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'Chatbot Propostas', '2024', 'model'))
+
+from loadtest import git_commit, percentile  # noqa: E402
+from server.batching import BatchingEncoder  # noqa: E402
+from server.fakes import FakeEmbeddingModel  # noqa: E402
+
+
+def run(encoder, concurrency: int, total: int) -> dict:
+    counter = iter(range(total))
+    lock = threading.Lock()
+    latencies = []
+
+    def worker(_) -> None:
+        while True:
+            with lock:
+                number = next(counter, None)
+            if number is None:
+                return
+            started = time.perf_counter()
+            encoder.encode(f'Ata de reunião {number}: cliente quer previsão de demanda por loja.')
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'throughput_per_s': total / elapsed,
+        'latency_s': {f'p{p}': percentile(latencies, p / 100) for p in (50, 95, 99)},
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark do agrupamento de chamadas ao modelo de embeddings.')
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--batch-size', default='8,32')
+    parser.add_argument('--wait-ms', default='1,5,10')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--model', help='Modelo sentence-transformers real (padrão: modelo falso)')
+    parser.add_argument('--call-latency', type=float, default=0.02)
+    parser.add_argument('--item-latency', type=float, default=0.002)
+    parser.add_argument('--out', default=os.path.join(BENCH_DIR, 'results', 'embedding_batching.json'))
+    args = parser.parse_args(argv)
+
+    if args.model:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model)
+    else:
+        model = FakeEmbeddingModel(latency=args.call_latency, per_item=args.item_latency, serial=True)
+
+    levels = [int(c) for c in args.concurrency.split(',')]
+    settings = [None] + [(int(b), float(w)) for b in args.batch_size.split(',') for w in args.wait_ms.split(',')]
+    results = []
+    for setting in settings:
+        for concurrency in levels:
+            if setting is None:
+                encoder, label = model, 'sem agrupamento'
+            else:
+                encoder = BatchingEncoder(model, max_batch_size=setting[0], max_wait=setting[1] / 1000, threads=args.threads)
+                label = f'lote {setting[0]}, espera {setting[1]:g} ms'
+            result = run(encoder, concurrency, args.requests)
+            result.update({'batch_size': setting and setting[0], 'wait_ms': setting and setting[1], 'concurrency': concurrency})
+            if isinstance(encoder, BatchingEncoder):
+                result['mean_batch_size'] = encoder.stats()['mean_batch_size']
+            results.append(result)
+            print(f"{label:>24} c={concurrency:<4} {result['throughput_per_s']:8.1f} textos/s  "
+                  f"p50={result['latency_s']['p50'] * 1000:7.1f} ms  p99={result['latency_s']['p99'] * 1000:7.1f} ms")
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'options': vars(args),
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.out}")
+
+
+if __name__ == '__main__':
+    main()
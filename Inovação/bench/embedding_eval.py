@@ -0,0 +1,210 @@
+"""
+Retrieval quality and cost of the embedding profiles on the proposal corpus.
+
+    python bench/embedding_eval.py --corpus propostas/ --profiles bert-large,minilm,minilm-int8,mpnet-256-pca \
+        --queries perguntas.txt --out bench/results/embedding_eval.json
+
+The corpus is chunked like `server.ingest`. Questions come from `--queries`
+(one per line) or, by default, from random word windows of the chunks. The
+reference is the current model (`--reference`, nli-bert-large) scored
+exactly in float32; for every profile the script reports:
+
+    recall@k            overlap of its top k with the reference top k
+    compression_recall  overlap with its own model scored exactly in
+                        float32: what the reduction and quantization lose
+    encode              chunks per second, and latency of one question
+    query               latency of `VectorIndex.query`, scanned bytes per
+                        vector and index size on disk
+
+The index is scanned exactly unless `--ivf` is given, so the recall only
+reflects the profile.
+
+`--fake` swaps the models for the offline stand-in, which only makes
+`compression_recall` and the index numbers meaningful.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'Chatbot Propostas', '2024', 'model'))
+
+from loadtest import git_commit, percentile  # noqa: E402
+from server.embedding_profiles import PROFILES, ReducedEncoder, fit_pca, resolve_profile  # noqa: E402
+from server.fakes import FakeEmbeddingModel  # noqa: E402
+from server.ingest import chunk_file, discover  # noqa: E402
+from server.vector_index import VectorIndex, normalize  # noqa: E402
+
+
+def load_corpus(paths: list, max_chunks: int) -> list:
+    texts = []
+    for path, source in discover(paths):
+        texts.extend(text for _, text, _ in chunk_file(path, source, 220, 40)[2])
+        if len(texts) >= max_chunks:
+            break
+    return texts[:max_chunks]
+
+
+def sample_queries(texts: list, count: int, words: int = 12, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    queries = []
+    for text in rng.sample(texts, min(count, len(texts))):
+        tokens = text.split()
+        start = rng.randrange(max(1, len(tokens) - words))
+        queries.append(' '.join(tokens[start:start + words]))
+    return queries
+
+
+def exact_top_k(chunks: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = normalize(queries) @ normalize(chunks).T
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(best, np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1), axis=1)
+
+
+def recall(found: list, expected: np.ndarray, k: int) -> float:
+    return float(np.mean([len(set(f[:k]) & set(e[:k])) / k for f, e in zip(found, expected)]))
+
+
+def load_model(name: str, dimension: int, fake: bool):
+    if fake:
+        return FakeEmbeddingModel(dimension=dimension)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
+
+class ModelRun:
+    """
+    Full-size embeddings of the corpus and questions by one model, computed
+    once and shared by the profiles that use it.
+    """
+
+    def __init__(self, model, texts: list, queries: list, query_prefix: str, passage_prefix: str) -> None:
+        started = time.perf_counter()
+        self.chunks = np.asarray(model.encode([passage_prefix + text for text in texts], batch_size=64), dtype=np.float32)
+        self.chunks_per_s = len(texts) / (time.perf_counter() - started)
+        latencies = []
+        for query in queries[:50]:
+            started = time.perf_counter()
+            model.encode(query_prefix + query)
+            latencies.append(time.perf_counter() - started)
+        self.query_encode_s = percentile(latencies, 0.5)
+        self.queries = np.asarray(model.encode([query_prefix + query for query in queries], batch_size=64), dtype=np.float32)
+
+
+def evaluate(profile, run: ModelRun, reference: np.ndarray, k_values: list, workdir: str, ivf: bool = False) -> dict:
+    chunks, queries = run.chunks, run.queries
+    if profile.reduction:
+        if profile.reduction == 'pca':
+            profile.pca_path = os.path.join(workdir, 'pca.npz')
+            fit_pca(chunks, profile.dimension, profile.pca_path)
+        reducer = ReducedEncoder(None, profile)
+        chunks, queries = reducer.reduce(chunks), reducer.reduce(queries)
+
+    path = os.path.join(workdir, 'index')
+    index = VectorIndex(path, dimension=chunks.shape[1], quantization=profile.quantization, rescore=profile.rescore)
+    for start in range(0, len(chunks), 5000):
+        index.upsert([(str(i), chunks[i]) for i in range(start, min(start + 5000, len(chunks)))])
+    if ivf and len(chunks) > index.exact_below:
+        index.train()
+
+    k = max(k_values)
+    found, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        matches = index.query(query, top_k=k)['matches']
+        latencies.append(time.perf_counter() - started)
+        found.append([int(match['id']) for match in matches])
+    own = exact_top_k(run.chunks, run.queries, k)
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    scanned = index.code_size if profile.quantization != 'float32' else 4 * chunks.shape[1]
+    return {
+        'profile': profile.name,
+        'model': profile.model,
+        'dimension': int(chunks.shape[1]),
+        'reduction': profile.reduction,
+        'quantization': profile.quantization,
+        'recall': {f'@{k}': recall(found, reference, k) for k in k_values},
+        'compression_recall': {f'@{k}': recall(found, own, k) for k in k_values},
+        'encode_chunks_per_s': run.chunks_per_s,
+        'encode_query_s': run.query_encode_s,
+        'query_s': {f'p{p}': percentile(latencies, p / 100) for p in (50, 95)},
+        'scanned_bytes_per_vector': scanned,
+        'index_bytes': size,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Compara perfis de embeddings em recall, latência e tamanho.')
+    parser.add_argument('--corpus', nargs='+', required=True, help='Diretórios ou arquivos de propostas e atas')
+    parser.add_argument('--profiles', default=','.join(PROFILES))
+    parser.add_argument('--reference', default='bert-large', help='Perfil de referência (modelo atual)')
+    parser.add_argument('--queries', help='Arquivo com uma pergunta por linha (padrão: trechos do corpus)')
+    parser.add_argument('--num-queries', type=int, default=200)
+    parser.add_argument('--max-chunks', type=int, default=20000)
+    parser.add_argument('--k', default='5,10')
+    parser.add_argument('--ivf', action='store_true', help='Treina o IVF do índice (padrão: busca exata)')
+    parser.add_argument('--fake', action='store_true', help='Usa o modelo falso (sem baixar pesos)')
+    parser.add_argument('--out', default=os.path.join(BENCH_DIR, 'results', 'embedding_eval.json'))
+    args = parser.parse_args(argv)
+
+    texts = load_corpus(args.corpus, args.max_chunks)
+    if args.queries:
+        with open(args.queries, encoding='utf-8') as file:
+            queries = [line.strip() for line in file if line.strip()]
+    else:
+        queries = sample_queries(texts, args.num_queries)
+    k_values = [int(k) for k in args.k.split(',')]
+    print(f"{len(texts)} trechos, {len(queries)} perguntas")
+
+    runs = {}
+
+    def model_run(profile) -> ModelRun:
+        key = (profile.model, profile.query_prefix, profile.passage_prefix)
+        if key not in runs:
+            model = load_model(profile.model, profile.model_dimension, args.fake)
+            runs[key] = ModelRun(model, texts, queries, profile.query_prefix, profile.passage_prefix)
+        return runs[key]
+
+    reference_run = model_run(resolve_profile(args.reference))
+    reference = exact_top_k(reference_run.chunks, reference_run.queries, max(k_values))
+
+    results = []
+    for name in args.profiles.split(','):
+        profile = resolve_profile(name)
+        workdir = tempfile.mkdtemp(prefix='embedding-eval-')
+        try:
+            result = evaluate(profile, model_run(profile), reference, k_values, workdir, args.ivf)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        results.append(result)
+        print(f"{name:>16} dim={result['dimension']:<5} {result['quantization']:>7}  "
+              + '  '.join(f"R{k}={value:.3f}" for k, value in result['recall'].items())
+              + f"  comp{max(k_values)}={result['compression_recall'][f'@{max(k_values)}']:.3f}"
+              f"  {result['encode_chunks_per_s']:7.1f} trechos/s  "
+              f"consulta p50={result['query_s']['p50'] * 1000:6.2f} ms  {result['scanned_bytes_per_vector']} B/vetor")
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'options': vars(args),
+        'chunks': len(texts),
+        'queries': len(queries),
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""
+Load test for `/backend-api/v2/conversation` of the IA-Tools and Chatbot
+Propostas apps, with offline stand-ins for Gemini, the embedding model and
+Pinecone.
+
+    python bench/loadtest.py --app ia-tools --app propostas \
+        --concurrency 1,8,32 --requests 200 --llm-latency 0.8 \
+        --vector-latency 0.1 --out bench/results/loadtest.json
+
+Each app is started in its own process (both apps have a `server` package)
+through `create_app` and `serving.serve`, with the fakes injected into
+`Backend_Api`. Requests are then sent at every concurrency level (a stage)
+and the latency percentiles, time to first byte, throughput and error rate
+of each stage are written as JSON, tagged with the current commit, so runs
+can be compared across commits. The server's `/metrics` is scraped around
+every stage to add the mean time spent in each backend stage (embed,
+vector_query, llm, ...) and the errors counted there.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+APPS = {
+    'ia-tools': os.path.join(ROOT_DIR, 'IA - Tools'),
+    'propostas': os.path.join(ROOT_DIR, 'Chatbot Propostas', '2024', 'model'),
+}
+
+QUESTIONS = {
+    'ia-tools': 'Quanto de ICMS paguei em 2024?',
+    'propostas': 'Ata: cliente do varejo quer um dashboard de vendas por loja e previsão de demanda.',
+}
+
+
+def percentile(values: list, fraction: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# --- Server side (runs inside the app directory) ---
+
+def build_fakes(app_name: str, options: dict) -> dict:
+    if app_name == 'ia-tools':
+        from server.fakes import FakeGenerativeModel
+        function_args = None
+        if options['function_call']:
+            function_args = {'id_dt_ini': '2024-01-01', 'id_dt_fin': '2024-12-31', 'vl_icms': 0}
+        return {'model': FakeGenerativeModel(
+            latency=options['llm_latency'], jitter=options['llm_latency'] * 0.2,
+            failure_rate=options['llm_failure'], function_args=function_args,
+            reply='Resposta simulada sobre a situação fiscal do cliente. ' * 8,
+        )}
+
+    from server.fakes import FakeEmbeddingModel, FakeGenerativeModel, FakePineconeIndex
+    return {
+        'embedding_model': FakeEmbeddingModel(latency=options['embed_latency']),
+        'pinecone_index': FakePineconeIndex(
+            latency=options['vector_latency'], jitter=options['vector_latency'] * 0.2,
+            failure_rate=options['vector_failure'],
+        ),
+        # Per-section latency of the proposal generation
+        'model': FakeGenerativeModel(
+            latency=options['llm_latency'], jitter=options['llm_latency'] * 0.2,
+            failure_rate=options['llm_failure'],
+            reply='Parágrafo simulado da seção, com base na ata e nas propostas anteriores. ' * 4,
+        ),
+    }
+
+
+def run_server(app_name: str, port: int, options: dict) -> None:
+    sys.path.insert(0, os.getcwd())
+    from server.run import create_app
+    from appkit.serving import serve
+
+    data_dir = tempfile.mkdtemp()
+    config = {
+        'site_config': {'host': '127.0.0.1', 'port': port, 'debug': False},
+        'fiscal_store': {'path': os.path.join(data_dir, 'notas')},
+        'conversations': {'path': os.path.join(data_dir, 'conversas.sqlite3')},
+        'rate_limit': {'rpm': 1_000_000, 'tpm': 1_000_000_000},
+        'intent': {'enabled': options['intent']},
+        'embedding_cache': {'enabled': options['embedding_cache'], 'path': os.path.join(data_dir, 'embeddings.sqlite3')},
+        'proposal': {'max_workers': options['proposal_workers'], 'backoff': 0.05},
+        # Every request repeats the same question, so it would only measure hits
+        'semantic_cache': {'enabled': options['semantic_cache']},
+    }
+    site_config = dict(config['site_config'])
+    if options['server'] == 'gunicorn':
+        site_config.update({'server': 'gunicorn', 'workers': options['workers']})
+    else:
+        site_config['threaded'] = True
+
+    serve(lambda: create_app(config, **build_fakes(app_name, options)), site_config)
+
+
+# --- Client side ---
+
+def request_once(port: int, body: bytes, stream: bool) -> dict:
+    started = time.perf_counter()
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        connection.request('POST', '/backend-api/v2/conversation', body=body, headers={
+            'content-type': 'application/json',
+            'accept': 'text/event-stream' if stream else 'application/json',
+        })
+        response = connection.getresponse()
+        first = response.read(1)
+        ttfb = time.perf_counter() - started
+        payload = first + response.read()
+        latency = time.perf_counter() - started
+    except Exception as e:
+        return {'ok': False, 'error': type(e).__name__, 'latency': time.perf_counter() - started}
+    finally:
+        connection.close()
+
+    ok = response.status == 200
+    if ok and stream:
+        ok = b'event: error' not in payload
+    elif ok:
+        ok = json.loads(payload).get('success', False)
+    return {'ok': ok, 'status': response.status, 'ttfb': ttfb, 'latency': latency}
+
+
+def scrape_metrics(port: int) -> dict:
+    """
+    Returns {(metric, stage): value} for the stage sums, counts and errors.
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        connection.request('GET', '/metrics')
+        text = connection.getresponse().read().decode()
+    except OSError:
+        return {}
+    finally:
+        connection.close()
+
+    values = {}
+    for line in text.splitlines():
+        if line.startswith('#') or 'stage="' not in line or '_bucket' in line:
+            continue
+        name_labels, value = line.rsplit(' ', 1)
+        metric = name_labels.split('{', 1)[0].rsplit('_', 1)[-1]
+        stage = name_labels.split('stage="', 1)[1].split('"', 1)[0]
+        values[(metric, stage)] = float(value)
+    return values
+
+
+def stage_breakdown(before: dict, after: dict) -> dict:
+    delta = {key: value - before.get(key, 0.0) for key, value in after.items()}
+    stages = sorted({stage for _, stage in delta})
+    breakdown = {}
+    for stage in stages:
+        count = delta.get(('count', stage), 0.0)
+        breakdown[stage] = {
+            'mean_s': delta.get(('sum', stage), 0.0) / count if count else None,
+            'count': int(count),
+            'errors': int(delta.get(('total', stage), 0.0)),
+        }
+    return breakdown
+
+
+def run_stage(port: int, app_name: str, concurrency: int, total: int, stream: bool) -> dict:
+    counter = iter(range(total))
+    lock = threading.Lock()
+    results = []
+
+    def worker(worker_id: int) -> None:
+        while True:
+            with lock:
+                number = next(counter, None)
+            if number is None:
+                return
+            body = json.dumps({
+                'conversation_id': f'bench-{worker_id}-{number}',
+                'meta': {'content': {'parts': [{'content': QUESTIONS[app_name], 'role': 'user'}]}},
+            }).encode()
+            result = request_once(port, body, stream)
+            with lock:
+                results.append(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    succeeded = [r for r in results if r['ok']]
+    latencies = [r['latency'] for r in succeeded]
+    ttfbs = [r['ttfb'] for r in succeeded]
+    errors = {}
+    for r in results:
+        if not r['ok']:
+            key = r.get('error') or f"HTTP {r.get('status')}"
+            errors[key] = errors.get(key, 0) + 1
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'duration_s': elapsed,
+        'throughput_rps': len(succeeded) / elapsed if elapsed else 0.0,
+        'error_rate': 1 - len(succeeded) / len(results) if results else 0.0,
+        'errors': errors,
+        'latency_s': {f'p{p}': percentile(latencies, p / 100) for p in (50, 95, 99)},
+        'ttfb_s': {f'p{p}': percentile(ttfbs, p / 100) for p in (50, 95, 99)},
+    }
+
+
+def wait_ready(port: int, process, timeout: float = 120) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Servidor encerrou antes de ficar pronto')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/ready')
+            response = connection.getresponse()
+            response.read()
+            if response.status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('Servidor não ficou pronto a tempo')
+
+
+def bench_app(app_name: str, options: dict) -> dict:
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), '--serve', app_name, '--port', str(port),
+               '--options', json.dumps(options)]
+    process = subprocess.Popen(command, cwd=APPS[app_name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port, process)
+        stages = []
+        for concurrency in options['concurrency']:
+            before = scrape_metrics(port)
+            stage = run_stage(port, app_name, concurrency, options['requests'], options['stream'])
+            if options['server'] == 'gunicorn':
+                time.sleep(1.5)  # the other workers write their metrics every second
+            stage['backend_stages'] = stage_breakdown(before, scrape_metrics(port))
+            stages.append(stage)
+            print(f"{app_name:>10} c={concurrency:<4} {stage['throughput_rps']:8.1f} req/s  "
+                  f"p50={stage['latency_s']['p50'] or 0:.3f}s p99={stage['latency_s']['p99'] or 0:.3f}s  "
+                  f"erros={stage['error_rate']:.1%}")
+        return {'app': app_name, 'stages': stages}
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Teste de carga do endpoint de conversa.')
+    parser.add_argument('--app', action='append', choices=sorted(APPS), help='Aplicações a testar (padrão: todas)')
+    parser.add_argument('--concurrency', default='1,8,32', help='Níveis de concorrência, separados por vírgula')
+    parser.add_argument('--requests', type=int, default=100, help='Requisições por nível')
+    parser.add_argument('--stream', action='store_true', help='Pede respostas em text/event-stream')
+    parser.add_argument('--server', choices=['flask', 'gunicorn'], default='flask')
+    parser.add_argument('--workers', type=int, default=2, help='Workers do gunicorn')
+    parser.add_argument('--llm-latency', type=float, default=0.8)
+    parser.add_argument('--llm-failure', type=float, default=0.0)
+    parser.add_argument('--function-call', action='store_true', help='O Gemini falso responde com chamada de função')
+    parser.add_argument('--no-intent', action='store_true', help='Desliga o atalho sem LLM do IA-Tools')
+    parser.add_argument('--embed-latency', type=float, default=0.05)
+    parser.add_argument('--no-embedding-cache', action='store_true', help='Desliga o cache de embeddings do Chatbot Propostas')
+    parser.add_argument('--vector-latency', type=float, default=0.1)
+    parser.add_argument('--vector-failure', type=float, default=0.0)
+    parser.add_argument('--proposal-workers', type=int, help='Seções geradas em paralelo (padrão: todas; 1 = em série)')
+    parser.add_argument('--semantic-cache', action='store_true', help='Liga o cache semântico de respostas do Chatbot Propostas')
+    parser.add_argument('--out', default=os.path.join(BENCH_DIR, 'results', 'loadtest.json'))
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--options', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        run_server(args.serve, args.port, json.loads(args.options))
+        return
+
+    options = {
+        'concurrency': [int(c) for c in args.concurrency.split(',')],
+        'requests': args.requests,
+        'stream': args.stream,
+        'server': args.server,
+        'workers': args.workers,
+        'llm_latency': args.llm_latency,
+        'llm_failure': args.llm_failure,
+        'function_call': args.function_call,
+        'intent': not args.no_intent,
+        'embed_latency': args.embed_latency,
+        'embedding_cache': not args.no_embedding_cache,
+        'vector_latency': args.vector_latency,
+        'vector_failure': args.vector_failure,
+        'proposal_workers': args.proposal_workers,
+        'semantic_cache': args.semantic_cache,
+    }
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'options': options,
+        'results': [bench_app(app_name, options) for app_name in args.app or sorted(APPS)],
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.out}")
+
+
+if __name__ == '__main__':
+    main()